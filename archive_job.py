@@ -0,0 +1,52 @@
+import os
+import threading
+from typing import Optional, Tuple
+
+from sheets_scheduler import background
+
+
+class ArchiveJob:
+    """Фоновый перенос выданных заказов в архив (GoogleSheetsManager.archive_delivered).
+
+    Первый проход — через first_delay секунд после запуска, чтобы не
+    мешать холодному старту, дальше раз в interval секунд
+    (ARCHIVE_INTERVAL, по умолчанию 6 часов). Запросы к Sheets идут
+    с фоновым приоритетом и уступают квоту запросам пользователей.
+    """
+
+    def __init__(self, sheets, interval: Optional[float] = None, first_delay: float = 60):
+        self.sheets = sheets
+        self.interval = interval or float(os.getenv('ARCHIVE_INTERVAL', '21600'))
+        self.first_delay = first_delay
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        print("🗄️ Перенос выданных заказов в архив включен: строки удаляются "
+              f"с листа «Клиенты» целиком, раз в {self.interval / 3600:g} ч")
+        self._thread = threading.Thread(target=self._run, name='archive-job', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        if self._stop.wait(self.first_delay):
+            return
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def run_once(self) -> Tuple[bool, str]:
+        with background():
+            success, msg = self.sheets.archive_delivered()
+        if not success:
+            print(f"⚠️ Перенос в архив не выполнен: {msg}")
+        return success, msg
@@ -0,0 +1,100 @@
+from typing import Optional, Sequence, Tuple
+
+from telebot.async_telebot import AsyncTeleBot
+from google_sheets import AsyncSheetsManager
+from handlers import BotHandlers
+from state_store import create_state_store
+import metrics
+from send_queue import client_ids
+from sheets_scheduler import background
+
+
+class AsyncBotIO:
+    """Адаптер обработчиков для AsyncTeleBot.
+
+    Все обращения к Google Sheets идут через sheets (пул потоков),
+    так что одна медленная таблица не блокирует остальные диалоги.
+    Ответы отправляет send_queue.send_async — с общими с рассылкой
+    лимитами Telegram и повтором после 429.
+    """
+
+    def __init__(self, bot: AsyncTeleBot, sheets: AsyncSheetsManager,
+                 registration_queue, send_queue):
+        self.bot = bot
+        self.sheets = sheets
+        self.registration_queue = registration_queue
+        self.send_queue = send_queue
+        send_queue.async_bot = bot
+
+    async def reply(self, chat_id, text: str, **kwargs):
+        return await self.send_queue.send_async(chat_id, text, **kwargs)
+
+    async def find_client(self, telegram_id: str,
+                          fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        return await self.sheets.find_client(telegram_id, fields)
+
+    async def client_exists(self, telegram_id: str) -> bool:
+        return await self.sheets.client_exists(telegram_id)
+
+    async def sheets_connected(self) -> bool:
+        # Первое обращение к service подключается к Sheets — не в цикле событий
+        return await self.sheets.run(lambda: bool(self.sheets.service))
+
+    async def setup_headers(self) -> Tuple[bool, str]:
+        return await self.sheets.setup_headers()
+
+    async def bulk_update_status(self, mapping: dict) -> Tuple[bool, str]:
+        return await self.sheets.run(self._bulk_update_in_background, mapping)
+
+    def _bulk_update_in_background(self, mapping: dict) -> Tuple[bool, str]:
+        # Массовая запись уступает квоту Sheets запросам клиентов
+        with background():
+            return self.sheets.manager.bulk_update_status(mapping)
+
+    async def submit_registration(self, *args) -> Tuple[bool, str]:
+        # Журнал регистраций пишется с fsync — тоже не в цикле событий
+        return await self.sheets.run(self.registration_queue.submit, *args)
+
+    async def start_broadcast(self, text: str, admin_chat_id) -> Tuple[bool, str]:
+        return await self.sheets.run(
+            self.send_queue.start_broadcast,
+            text, lambda: client_ids(self.sheets.manager), admin_chat_id
+        )
+
+    def broadcast_progress(self) -> str:
+        return self.send_queue.broadcast_progress()
+
+    async def download_file(self, file_id: str) -> bytes:
+        file_info = await self.bot.get_file(file_id)
+        return await self.bot.download_file(file_info.file_path)
+
+
+def create_async_bot(token: str, sheets: AsyncSheetsManager,
+                     registration_queue, is_admin, send_queue,
+                     user_states=None) -> AsyncTeleBot:
+    """Создает AsyncTeleBot с общими обработчиками (handlers.py)."""
+    bot = AsyncTeleBot(token)
+    if user_states is None:
+        user_states = create_state_store()
+    io = AsyncBotIO(bot, sheets, registration_queue, send_queue)
+    BotHandlers(io, user_states, is_admin).register(bot)
+    return bot
+
+
+async def run_async_bot(token: str, manager, registration_queue, is_admin,
+                        send_queue, user_states=None) -> None:
+    """Запускает бота в режиме asyncio polling."""
+    # asyncio_helper импортирован вместе с AsyncTeleBot — учитываем и его
+    metrics.instrument_telegram()
+    sheets = AsyncSheetsManager(manager)
+    bot = create_async_bot(token, sheets, registration_queue, is_admin, send_queue, user_states)
+    print("🟢 Бот запускается (asyncio)...")
+    try:
+        await bot.remove_webhook()
+        print("🤖 Бот запущен в режиме asyncio polling!")
+        await bot.infinity_polling()
+    except Exception as e:
+        print(f"🔴 Ошибка запуска: {e}")
+    finally:
+        await bot.close_session()
+        sheets.shutdown()
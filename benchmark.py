@@ -0,0 +1,624 @@
+"""Бенчмарки бота без сети.
+
+    python benchmark.py replies [-n 20000]
+    python benchmark.py handlers [--updates 2000] [--sheet-size 5000]
+                                 [--latency-ms 150] [--workers 4] [--index-ttl 0]
+                                 [--archive]
+    python benchmark.py coldstart [--runs 5]
+    python benchmark.py transport [--updates 2000] [--workers 4] [--handshake-ms 50]
+    python benchmark.py dispatch [-n 20000]
+    python benchmark.py warmstart [--updates 2000] [--sheet-size 5000] [--latency-ms 150]
+
+replies — сколько процессорного времени на сообщение в
+BotHandlers.handle_text экономят заранее сериализованные клавиатуры.
+
+handlers — прогоняет поток синтетических обновлений (регистрации,
+проверки статуса, профиль, справка) через настоящие обработчики main.py.
+Вместо Google Sheets подставляется FakeSheetsService с заданной задержкой
+и размером листа. Печатает p50/p95/p99 обработки, пропускную способность
+и число вызовов Sheets API на обновление. С --archive перед прогоном
+выданные заказы переносятся в архив (каждый пятый клиент листа).
+
+coldstart — запускает бота в отдельном процессе и измеряет время от
+старта интерпретатора до ответа на /start, отдельно — импорт main.py и
+создание клиента Sheets из локального discovery-документа (оно идет уже
+после первого ответа).
+
+transport — параллельные values().get настоящего клиента googleapiclient
+к локальному HTTP-серверу: новый httplib2.Http на каждый запрос
+(потокобезопасный вариант без пула) против общего PooledHttp. Печатает
+пропускную способность и число открытых соединений. Сервер работает по
+HTTP, поэтому стоимость TLS-рукопожатия имитируется задержкой при
+открытии соединения (--handshake-ms).
+
+dispatch — процессорное время выбора обработчика в process_new_updates
+при 10, 100 и 1000 кнопках: по фильтру func=lambda на каждую кнопку
+(как раньше) против одного обработчика с Router.
+
+warmstart — перезапуск GoogleSheetsManager: сколько ждут первые проверки
+статуса без снимка таблицы и со снимком, загруженным с диска (лист
+сверяется в фоне).
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+import telebot
+from telebot import apihelper
+
+
+class _FakeRequest:
+    def __init__(self, service, method: str, func):
+        self.service = service
+        self.method = method
+        self.func = func
+
+    def execute(self, **kwargs):
+        self.service.count(self.method)
+        if self.service.latency:
+            time.sleep(self.service.latency)
+        with self.service.lock:
+            return self.func()
+
+
+class _FakeValues:
+    def __init__(self, service):
+        self.service = service
+
+    def get(self, spreadsheetId=None, range=None, **kwargs):
+        return _FakeRequest(self.service, 'get', lambda: self.service.read(range))
+
+    def batchGet(self, spreadsheetId=None, ranges=None, **kwargs):
+        return _FakeRequest(self.service, 'batchGet', lambda: {
+            'valueRanges': [self.service.read(r) for r in ranges]
+        })
+
+    def append(self, spreadsheetId=None, range=None, body=None, **kwargs):
+        return _FakeRequest(self.service, 'append', lambda: self.service.append(range, body['values']))
+
+    def update(self, spreadsheetId=None, range=None, body=None, **kwargs):
+        return _FakeRequest(self.service, 'update', lambda: self.service.write(range, body['values']))
+
+    def batchUpdate(self, spreadsheetId=None, body=None, **kwargs):
+        def apply():
+            for data in body['data']:
+                self.service.write(data['range'], data['values'])
+            return {'totalUpdatedRanges': len(body['data'])}
+        return _FakeRequest(self.service, 'batchUpdate', apply)
+
+    def batchClear(self, spreadsheetId=None, body=None, **kwargs):
+        def apply():
+            for cleared in body['ranges']:
+                self.service.clear(cleared)
+            return {'clearedRanges': body['ranges']}
+        return _FakeRequest(self.service, 'batchClear', apply)
+
+    def clear(self, spreadsheetId=None, range=None, body=None, **kwargs):
+        return _FakeRequest(self.service, 'clear', lambda: self.service.clear(range) or {})
+
+
+class _FakeSpreadsheets:
+    def __init__(self, service):
+        self.service = service
+
+    def values(self):
+        return _FakeValues(self.service)
+
+    def get(self, spreadsheetId=None, **kwargs):
+        return _FakeRequest(self.service, 'spreadsheets.get', lambda: {'sheets': [
+            {'properties': {'sheetId': i, 'title': title}}
+            for i, title in enumerate(self.service.sheets)
+        ]})
+
+    def batchUpdate(self, spreadsheetId=None, body=None, **kwargs):
+        return _FakeRequest(self.service, 'spreadsheets.batchUpdate',
+                            lambda: self.service.structure(body['requests']))
+
+
+class FakeSheetsService:
+    """Подмена service из googleapiclient в памяти процесса.
+
+    Поддерживает values().get/batchGet/append/update/batchUpdate/batchClear/clear
+    для диапазонов вида 'Лист!A:I' и 'Лист!G5:I5', а также spreadsheets().get
+    и batchUpdate с addSheet/deleteDimension (перенос в архив); добавляет задержку
+    latency (секунды) к каждому вызову, считает вызовы по методам
+    и прочитанные ячейки (cells_read).
+    """
+
+    HEADERS = [
+        "Имя", "Фамилия", "Телефон", "Город", "Комментарии", "Telegram ID",
+        "Статус", "Дата обновления", "Комментарий статуса"
+    ]
+    _RANGE = re.compile(r"^'?([^'!]+)'?!([A-Z]+)(\d*)(?::([A-Z]+)(\d*))?$")
+
+    def __init__(self, sheet_size: int = 0, latency: float = 0.0, first_id: int = 1_000_000):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.calls = Counter()
+        self.cells_read = 0
+        self.sheets = {'Клиенты': [list(self.HEADERS)]}
+        statuses = ["В обработке", "Отправлен", "В пути", "Прибыл", "Выдан"]
+        for i in range(sheet_size):
+            self.sheets['Клиенты'].append([
+                f"Имя{i}", f"Фамилия{i}", f"+996 555 {i:06d}", "Бишкек", "",
+                str(first_id + i), statuses[i % len(statuses)], "2024-01-01 10:00:00", ""
+            ])
+
+    def spreadsheets(self):
+        return _FakeSpreadsheets(self)
+
+    def count(self, method: str) -> None:
+        with self.lock:
+            self.calls[method] += 1
+
+    def _parse(self, range_name: str):
+        sheet, col1, row1, col2, row2 = self._RANGE.match(range_name).groups()
+        rows = self.sheets.setdefault(sheet, [])
+        first_col = ord(col1) - ord('A')
+        last_col = ord(col2 or col1) - ord('A')
+        first_row = int(row1) if row1 else 1
+        last_row = int(row2) if row2 else (first_row if row1 and not col2 else len(rows))
+        return rows, first_col, last_col, first_row, last_row
+
+    def read(self, range_name: str) -> dict:
+        rows, first_col, last_col, first_row, last_row = self._parse(range_name)
+        values = [row[first_col:last_col + 1] for row in rows[first_row - 1:last_row]]
+        while values and not any(values[-1]):
+            values.pop()
+        self.cells_read += sum(len(row) for row in values)
+        return {'range': range_name, 'majorDimension': 'ROWS', 'values': values}
+
+    def append(self, range_name: str, values: list) -> dict:
+        rows, *_ = self._parse(range_name)
+        start = len(rows) + 1
+        rows.extend(list(row) for row in values)
+        sheet = range_name.split('!')[0].strip("'")
+        return {'updates': {
+            'updatedRange': f"'{sheet}'!A{start}:I{len(rows)}",
+            'updatedRows': len(values)
+        }}
+
+    def write(self, range_name: str, values: list) -> dict:
+        rows, first_col, _, first_row, _ = self._parse(range_name)
+        for offset, new_values in enumerate(values):
+            while len(rows) < first_row + offset:
+                rows.append([])
+            row = rows[first_row + offset - 1]
+            while len(row) < first_col + len(new_values):
+                row.append("")
+            row[first_col:first_col + len(new_values)] = new_values
+        return {'updatedRange': range_name}
+
+    def structure(self, requests: list) -> dict:
+        titles = list(self.sheets)
+        for request in requests:
+            if 'addSheet' in request:
+                self.sheets.setdefault(request['addSheet']['properties']['title'], [])
+            elif 'deleteDimension' in request:
+                span = request['deleteDimension']['range']
+                del self.sheets[titles[span['sheetId']]][span['startIndex']:span['endIndex']]
+        return {'replies': [{} for _ in requests]}
+
+    def clear(self, range_name: str) -> None:
+        rows, first_col, last_col, first_row, last_row = self._parse(range_name)
+        for row in rows[first_row - 1:last_row]:
+            for col in range(first_col, min(last_col + 1, len(row))):
+                row[col] = ""
+
+
+def make_update(text: str, user_id: int = 1, update_id: int = 1) -> telebot.types.Update:
+    return telebot.types.Update.de_json({
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': 0,
+            'chat': {'id': user_id, 'type': 'private'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': 'Тест'},
+            'text': text
+        }
+    })
+
+
+def make_message(text: str, user_id: int = 1, update_id: int = 1) -> telebot.types.Message:
+    return make_update(text, user_id, update_id).message
+
+
+def cpu_per_call(func, iterations: int) -> float:
+    """Процессорное время одного вызова func в микросекундах."""
+    start = time.process_time()
+    for _ in range(iterations):
+        func()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def fake_send_message(chat_id, text, reply_markup=None, **kwargs):
+    # То же, что делает telebot перед HTTP-запросом
+    payload = {'chat_id': str(chat_id), 'text': text}
+    if reply_markup:
+        payload['reply_markup'] = apihelper._convert_markup(reply_markup)
+    return payload
+
+
+def import_main():
+    """Импортирует main.py с временными файлами вместо рабочих."""
+    workdir = tempfile.mkdtemp(prefix='nbm-bench-')
+    os.environ.setdefault('REGISTRATION_JOURNAL', os.path.join(workdir, 'registrations.journal'))
+    os.environ.setdefault('STATE_STORE', 'memory')
+    os.environ.setdefault('BROADCAST_JOURNAL', os.path.join(workdir, 'broadcast.journal'))
+    os.environ.setdefault('STATUS_SNAPSHOT', os.path.join(workdir, 'status_snapshot.json'))
+    os.environ.setdefault('UPDATE_OFFSET_PATH', os.path.join(workdir, 'update_offset.json'))
+    os.environ.setdefault('SHEETS_SNAPSHOT', os.path.join(workdir, 'sheets_snapshot.json'))
+    # Лимиты Telegram и квоты Sheets не мешают измерять собственное время
+    # обработчиков; число вызовов Sheets выводится отдельно
+    os.environ.setdefault('TELEGRAM_GLOBAL_RATE', '1000000')
+    os.environ.setdefault('TELEGRAM_CHAT_RATE', '1000000')
+    os.environ.setdefault('SHEETS_READ_PER_MINUTE', '1000000')
+    os.environ.setdefault('SHEETS_WRITE_PER_MINUTE', '1000000')
+    import main
+    return main
+
+
+def synthetic_stream(count: int, sheet_size: int, first_id: int, seed: int = 42) -> list:
+    """Смесь обновлений: регистрации, статус, профиль и справка."""
+    rng = random.Random(seed)
+    updates = []
+    update_id = 0
+    new_user = 1
+    registration = ["Регистрация клиента", "Иван", "Петров", "+996 555 000 000", "Бишкек", "нет"]
+    while len(updates) < count:
+        kind = rng.random()
+        if kind < 0.15:
+            # Новый пользователь проходит регистрацию целиком
+            for text in registration:
+                update_id += 1
+                updates.append(make_update(text, new_user, update_id))
+            new_user += 1
+            continue
+        user_id = first_id + rng.randrange(sheet_size) if sheet_size else new_user
+        if kind < 0.6:
+            text = "Проверить статус"
+        elif kind < 0.85:
+            text = "Мой профиль"
+        else:
+            text = "Помощь"
+        update_id += 1
+        updates.append(make_update(text, user_id, update_id))
+    return updates[:count]
+
+
+def bench_replies(iterations: int) -> None:
+    main = import_main()
+    handlers = main.setup_sync_bot()
+    from handlers import run_sync
+    from replies import MAIN_KEYBOARD, CANCEL_KEYBOARD, create_keyboard, create_cancel_keyboard
+
+    prebuilt = {MAIN_KEYBOARD: create_keyboard, CANCEL_KEYBOARD: create_cancel_keyboard}
+    rebuild = False
+
+    def send_message(chat_id, text, reply_markup=None, **kwargs):
+        if rebuild and reply_markup in prebuilt:
+            # Прежнее поведение: новая клавиатура на каждый ответ
+            reply_markup = prebuilt[reply_markup]()
+        return fake_send_message(chat_id, text, reply_markup)
+
+    main.bot.send_message = send_message
+    messages = [make_message(text) for text in ("Помощь", "Связаться с нами", "что-то")]
+
+    def handle_batch():
+        for message in messages:
+            run_sync(handlers.handle_text(message))
+
+    cached = cpu_per_call(handle_batch, iterations) / len(messages)
+    rebuild = True
+    rebuilt = cpu_per_call(handle_batch, iterations) / len(messages)
+
+    print("handle_text, CPU на сообщение:")
+    print(f"  клавиатура на каждый ответ: {rebuilt:8.1f} мкс")
+    print(f"  готовый JSON клавиатуры:    {cached:8.1f} мкс")
+    print(f"  экономия:                   {rebuilt - cached:8.1f} мкс "
+          f"({(rebuilt - cached) / rebuilt * 100:.0f}%)")
+
+
+def bench_handlers(updates: int, sheet_size: int, latency_ms: float, workers: int,
+                   index_ttl: Optional[float] = None, archive: bool = False) -> None:
+    main = import_main()
+    main.setup_sync_bot()
+    from update_queue import UpdateQueue, update_chat_id
+
+    first_id = 1_000_000
+    service = FakeSheetsService(sheet_size=sheet_size, latency=latency_ms / 1000, first_id=first_id)
+    sheets = main.sheets_manager
+    sheets.service = service
+    if hasattr(sheets, 'invalidate_index'):
+        sheets.invalidate_index()
+        if index_ttl is not None:
+            sheets.index_ttl = index_ttl
+    if archive:
+        os.environ.setdefault('GOOGLE_SPREADSHEET_ID', 'bench')
+        print(f"Архив: {sheets.archive_delivered()[1]}")
+        service.calls.clear()
+        service.cells_read = 0
+    main.bot.send_message = fake_send_message
+    main.bot.threaded = False
+
+    stream = synthetic_stream(updates, sheet_size, first_id)
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def process(update):
+        start = time.perf_counter()
+        main.bot.process_new_updates([update])
+        elapsed = time.perf_counter() - start
+        with latencies_lock:
+            latencies.append(elapsed)
+
+    started = time.perf_counter()
+    if workers:
+        queue = UpdateQueue(process, maxsize=len(stream) + workers, workers=workers, key=update_chat_id)
+        for update in stream:
+            queue.put(update, block=True)
+        queue.stop()
+    else:
+        for update in stream:
+            process(update)
+    # Отложенные регистрации тоже считаются
+    main.registration_queue.stop()
+    total = time.perf_counter() - started
+
+    calls = sum(service.calls.values())
+    print(f"Обновлений: {len(stream)}, лист: {sheet_size} строк, "
+          f"задержка Sheets: {latency_ms:.0f} мс, потоков: {workers or 1}")
+    print(f"  обработка p50: {percentile(latencies, 50) * 1000:8.2f} мс")
+    print(f"  обработка p95: {percentile(latencies, 95) * 1000:8.2f} мс")
+    print(f"  обработка p99: {percentile(latencies, 99) * 1000:8.2f} мс")
+    print(f"  пропускная способность: {len(stream) / total:8.1f} обновлений/с")
+    print(f"  вызовов Sheets на обновление: {calls / len(stream):.4f} "
+          f"({', '.join(f'{m}={n}' for m, n in sorted(service.calls.items())) or 'нет'})")
+    print(f"  ячеек Sheets прочитано на обновление: {service.cells_read / len(stream):.1f}")
+    if hasattr(sheets, '_reads'):
+        print(f"  чтений объединено (single-flight): {sheets._reads.saved}")
+
+
+def coldstart_child() -> None:
+    """Выполняется в дочернем процессе bench_coldstart."""
+    started = time.perf_counter()
+    main = import_main()
+    main.setup_sync_bot()
+    imported = time.perf_counter()
+    main.bot.send_message = fake_send_message
+    main.bot.threaded = False
+    main.process_update(make_update('/start'))
+    answered = time.perf_counter()
+    print(f"ready {imported - started:.6f} {answered - imported:.6f}", flush=True)
+
+    # То, что GoogleSheetsManager делает при первом обращении к service
+    # (без учетных данных — только импорт и разбор discovery-документа)
+    import httplib2
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+    build_from_document(discovery_cache.get_static_doc('sheets', 'v4'), http=httplib2.Http())
+    print(f"sheets {time.perf_counter() - answered:.6f}", flush=True)
+
+
+def bench_coldstart(runs: int) -> None:
+    here = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ)
+    # Без учетных данных: процесс не должен ходить в сеть
+    env.pop('GOOGLE_SERVICE_ACCOUNT_JSON', None)
+    totals, imports, handlers, sheets = [], [], [], []
+    for _ in range(runs):
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, '-c', 'import benchmark; benchmark.coldstart_child()'],
+            cwd=here, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        for line in proc.stdout:
+            kind, *values = line.split()
+            if kind == 'ready':
+                totals.append(time.perf_counter() - started)
+                imports.append(float(values[0]))
+                handlers.append(float(values[1]))
+            elif kind == 'sheets':
+                sheets.append(float(values[0]))
+        proc.wait()
+
+    print(f"Холодный старт, запусков: {runs}")
+    print(f"  запуск процесса -> ответ на /start p50: {percentile(totals, 50) * 1000:8.1f} мс")
+    print(f"  запуск процесса -> ответ на /start max: {max(totals) * 1000:8.1f} мс")
+    print(f"  импорт main.py p50:                   {percentile(imports, 50) * 1000:8.1f} мс")
+    print(f"  обработка /start p50:                 {percentile(handlers, 50) * 1000:8.1f} мс")
+    print(f"  клиент Sheets (после ответа) p50:     {percentile(sheets, 50) * 1000:8.1f} мс")
+
+
+class _ValuesHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Заголовки и тело одним пакетом, иначе задержка ACK исказит результат
+    disable_nagle_algorithm = True
+    wbufsize = -1
+    body = json.dumps({'range': 'Клиенты!F1:I1', 'values': [['1', 'В пути', '', '']]}).encode()
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+        time.sleep(self.server.handshake)
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json; charset=UTF-8')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+def bench_transport(requests_count: int, workers: int, handshake_ms: float) -> None:
+    import httplib2
+    import googleapiclient.http
+    from google.auth.credentials import AnonymousCredentials
+    from googleapiclient import discovery_cache
+    from googleapiclient.discovery import build_from_document
+    from sheets_transport import PooledHttp
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ValuesHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.handshake = handshake_ms / 1000
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    options = {'api_endpoint': f'http://127.0.0.1:{server.server_port}/'}
+    document = discovery_cache.get_static_doc('sheets', 'v4')
+
+    def new_http_per_request(http, *args, **kwargs):
+        return googleapiclient.http.HttpRequest(httplib2.Http(), *args, **kwargs)
+
+    transports = {
+        'httplib2.Http на запрос': build_from_document(
+            document, http=httplib2.Http(), requestBuilder=new_http_per_request,
+            client_options=options
+        ),
+        'общий PooledHttp': build_from_document(
+            document, http=PooledHttp(AnonymousCredentials(), pool_size=workers),
+            client_options=options
+        ),
+    }
+
+    print(f"Запросов: {requests_count}, потоков: {max(workers, 1)}, "
+          f"открытие соединения: {handshake_ms:.0f} мс")
+    for name, service in transports.items():
+        server.connections = 0
+        values = service.spreadsheets().values()
+
+        def call(_):
+            return values.get(
+                spreadsheetId='bench', range='Клиенты!F1:I1'
+            ).execute()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            list(executor.map(call, range(requests_count)))
+        total = time.perf_counter() - started
+        print(f"  {name:24} {requests_count / total:8.1f} запросов/с, "
+              f"соединений открыто: {server.connections}")
+    server.shutdown()
+
+
+def bench_dispatch(iterations: int) -> None:
+    from router import ANY, Router
+
+    def noop(message):
+        pass
+
+    print("process_new_updates, CPU на сообщение (последняя кнопка / неизвестный текст):")
+    for buttons in (10, 100, 1000):
+        texts = [f"Кнопка {i}" for i in range(buttons)]
+
+        filters = telebot.TeleBot('1:bench', threaded=False)
+        for text in texts:
+            filters.message_handler(func=lambda message, text=text: message.text == text)(noop)
+        filters.message_handler(func=lambda message: True)(noop)
+
+        routed = telebot.TeleBot('1:bench', threaded=False)
+        router = Router(lambda message: None)
+        for text in texts:
+            router.add(noop, text)
+        router.add(noop, state=ANY)
+        routed.message_handler(content_types=['text'])(router.dispatch)
+
+        last = [make_update(texts[-1])]
+        unknown = [make_update("что-то")]
+        for name, bot in (('фильтры func', filters), ('Router', routed)):
+            hit = cpu_per_call(lambda: bot.process_new_updates(last), iterations)
+            miss = cpu_per_call(lambda: bot.process_new_updates(unknown), iterations)
+            print(f"  {buttons:5} кнопок, {name:13} {hit:8.1f} / {miss:8.1f} мкс")
+
+
+def bench_warmstart(lookups: int, sheet_size: int, latency_ms: float) -> None:
+    os.environ.setdefault('SHEETS_READ_PER_MINUTE', '1000000')
+    os.environ.setdefault('SHEETS_WRITE_PER_MINUTE', '1000000')
+    from google_sheets import GoogleSheetsManager
+    from storage import STATUS_FIELDS
+
+    first_id = 1_000_000
+    service = FakeSheetsService(sheet_size=sheet_size, latency=latency_ms / 1000, first_id=first_id)
+    snapshot_path = os.path.join(tempfile.mkdtemp(prefix='nbm-bench-'), 'sheets_snapshot.json')
+    previous = GoogleSheetsManager(snapshot_path=snapshot_path)
+    previous.service = service
+    previous.revalidate()
+
+    rng = random.Random(42)
+    telegram_ids = [str(first_id + rng.randrange(sheet_size)) for _ in range(lookups)]
+    print(f"Проверок статуса после перезапуска: {lookups}, лист: {sheet_size} строк, "
+          f"задержка Sheets: {latency_ms:.0f} мс")
+    for name, path in (('без снимка', ''), ('со снимком', snapshot_path)):
+        started = time.perf_counter()
+        sheets = GoogleSheetsManager(snapshot_path=path)
+        loaded = time.perf_counter() - started
+        sheets.service = service
+        sheets.connect_in_background()
+        service.calls.clear()
+        latencies = []
+        for telegram_id in telegram_ids:
+            start = time.perf_counter()
+            sheets.find_client(telegram_id, fields=STATUS_FIELDS)
+            latencies.append(time.perf_counter() - start)
+        print(f"  {name}: загрузка {loaded * 1000:.1f} мс, первый ответ {latencies[0] * 1000:.1f} мс, "
+              f"p50 {percentile(latencies, 50) * 1000:.2f} мс, p99 {percentile(latencies, 99) * 1000:.2f} мс, "
+              f"вызовов Sheets: {sum(service.calls.values())}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Бенчмарки бота")
+    parser.add_argument('suite', choices=['replies', 'handlers', 'coldstart', 'transport', 'dispatch',
+                                          'warmstart'])
+    parser.add_argument('-n', '--iterations', type=int, default=20000)
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--sheet-size', type=int, default=5000)
+    parser.add_argument('--latency-ms', type=float, default=150.0)
+    parser.add_argument('--workers', type=int, default=4,
+                        help="0 — обрабатывать последовательно в одном потоке")
+    parser.add_argument('--index-ttl', type=float, default=None,
+                        help="TTL индекса клиентов, с (0 — читать лист на каждый поиск)")
+    parser.add_argument('--archive', action='store_true',
+                        help="перенести выданные заказы в архив перед прогоном (handlers)")
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--handshake-ms', type=float, default=50.0,
+                        help="имитация TLS-рукопожатия при новом соединении (transport)")
+    args = parser.parse_args(argv)
+
+    if args.suite == 'replies':
+        bench_replies(args.iterations)
+    elif args.suite == 'handlers':
+        bench_handlers(args.updates, args.sheet_size, args.latency_ms, args.workers,
+                       args.index_ttl, args.archive)
+    elif args.suite == 'coldstart':
+        bench_coldstart(args.runs)
+    elif args.suite == 'transport':
+        bench_transport(args.updates, args.workers, args.handshake_ms)
+    elif args.suite == 'dispatch':
+        bench_dispatch(args.iterations)
+    elif args.suite == 'warmstart':
+        bench_warmstart(args.updates, args.sheet_size, args.latency_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Массовое обновление статусов заказов.
+
+Запуск из командной строки:
+
+    python bulk_status.py --status "Прибыл" 123456 654321
+    python bulk_status.py --status "Прибыл" --csv container.csv
+
+CSV: в каждой строке Telegram ID, а также необязательные статус и
+комментарий. Если статус в строке не указан, берется --status.
+"""
+import argparse
+import csv
+import io
+import sys
+from typing import Dict, Iterable, Optional, Tuple
+from google_sheets import GoogleSheetsManager
+
+
+def decode_csv(data: bytes) -> Optional[str]:
+    """Текст CSV-файла: UTF-8 (с BOM или без) или cp1251 из Excel.
+
+    None — файл не текстовый ни в одной из этих кодировок.
+    """
+    for encoding in ('utf-8-sig', 'cp1251'):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError:
+            pass
+    return None
+
+
+def parse_status_csv(text: str, default_status: Optional[str] = None,
+                     default_comment: str = "") -> Dict[str, Tuple[str, str]]:
+    """Разбирает CSV вида 'telegram_id[,статус[,комментарий]]'.
+
+    Строки без числового Telegram ID (например, заголовок) пропускаются.
+    """
+    # Excel в русской локали сохраняет CSV через ';'
+    delimiter = max(',;\t', key=text.count)
+
+    mapping = {}
+    for row in csv.reader(io.StringIO(text), delimiter=delimiter):
+        cells = [cell.strip() for cell in row]
+        if not cells or not cells[0].isdigit():
+            continue
+        status = cells[1] if len(cells) > 1 and cells[1] else default_status
+        if not status:
+            continue
+        comment = cells[2] if len(cells) > 2 else default_comment
+        mapping[cells[0]] = (status, comment)
+    return mapping
+
+
+def parse_id_list(items: Iterable[str], status: str,
+                  comment: str = "") -> Dict[str, Tuple[str, str]]:
+    """Превращает список Telegram ID (через пробелы или запятые) в mapping."""
+    mapping = {}
+    for item in items:
+        for telegram_id in item.replace(',', ' ').split():
+            if telegram_id.isdigit():
+                mapping[telegram_id] = (status, comment)
+    return mapping
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Массовое обновление статусов заказов")
+    parser.add_argument('ids', nargs='*', help="Telegram ID клиентов")
+    parser.add_argument('--status', help="Новый статус, например «Прибыл»")
+    parser.add_argument('--comment', default="", help="Комментарий статуса")
+    parser.add_argument('--csv', help="CSV-файл с Telegram ID (или '-' для stdin)")
+    args = parser.parse_args(argv)
+
+    mapping = {}
+    if args.csv:
+        if args.csv == '-':
+            text = sys.stdin.read()
+        else:
+            with open(args.csv, 'rb') as f:
+                text = decode_csv(f.read())
+            if text is None:
+                parser.error("CSV должен быть в кодировке UTF-8 или cp1251")
+        mapping.update(parse_status_csv(text, args.status, args.comment))
+    if args.ids:
+        if not args.status:
+            parser.error("для списка Telegram ID нужен --status")
+        mapping.update(parse_id_list(args.ids, args.status, args.comment))
+
+    if not mapping:
+        parser.error("не указано ни одного клиента")
+
+    success, msg = GoogleSheetsManager().bulk_update_status(mapping)
+    print(f"{'✅' if success else '❌'} {msg}")
+    return 0 if success else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
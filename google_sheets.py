@@ -1,26 +1,151 @@
 import os
+import re
+import asyncio
+import functools
+import time
 import threading
 import json
-from datetime import datetime
-from typing import Tuple, Optional
-from flask import Flask, request
-import telebot
-from telebot.types import ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
-from keepalive import keep_alive
-from google.oauth2.service_account import Credentials
-from googleapiclient.discovery import build
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple, Optional
+from storage import ClientStorage, CLIENT_FIELDS, STATUS_FIELDS, StatusUpdate, unpack_status
+from sheets_scheduler import (
+    SheetsBusy, SheetsScheduler, SheetsUnavailable, SingleFlight, background,
+    current_priority, get_scheduler
+)
 from googleapiclient.errors import HttpError
+import metrics
 
-app = Flask(__name__)
+# Поле записи клиента -> буква колонки листа «Клиенты»
+COLUMNS = {field: chr(ord('A') + i) for i, field in enumerate(CLIENT_FIELDS)}
 
-class GoogleSheetsManager:
-    def __init__(self):
-        """Инициализация менеджера Google Sheets."""
-        self.service = None
-        self._initialize_service()
+ARCHIVED_ROWS = metrics.Counter('sheets_archived_rows_total', 'Строки, перенесенные в архив')
 
-    def _initialize_service(self) -> None:
-        """Инициализирует подключение к Google Sheets API."""
+class GoogleSheetsManager(ClientStorage):
+    # Порядок колонок листа «Клиенты» (A:I)
+    RECORD_FIELDS = CLIENT_FIELDS
+
+    def __init__(self, index_ttl: Optional[float] = None,
+                 scheduler: Optional[SheetsScheduler] = None,
+                 record_ttl: Optional[float] = None,
+                 archive_sheet: Optional[str] = None,
+                 snapshot_path: Optional[str] = None):
+        """Инициализация менеджера Google Sheets.
+
+        index_ttl — время жизни индекса клиентов в секундах
+        (по умолчанию берется из SHEETS_INDEX_TTL или 60).
+        record_ttl — сколько секунд прочитанные строки клиентов отдаются
+        из кэша (SHEETS_RECORD_TTL, по умолчанию 120); StatusWatcher
+        обновляет в нем статусы при каждом проходе.
+        scheduler — планировщик вызовов API с учетом квот
+        (по умолчанию общий для процесса).
+        archive_sheet — лист, куда archive_delivered переносит выданные
+        заказы (SHEETS_ARCHIVE_SHEET, по умолчанию «Архив»; пустая строка
+        отключает архив). Поиск заглядывает в него только при промахе
+        по листу «Клиенты».
+        snapshot_path — файл снимка индекса и статусов для теплого старта
+        (SHEETS_SNAPSHOT, по умолчанию sheets_snapshot.json; пустая строка
+        отключает снимок), см. load_snapshot.
+
+        К Google Sheets менеджер подключается при первом обращении
+        к service (или заранее в фоне — см. connect_in_background).
+        """
+        self._service = None
+        self._values_resource = None
+        self._connected = False
+        self._connect_lock = threading.Lock()
+        self.scheduler = scheduler or get_scheduler()
+        if index_ttl is None:
+            index_ttl = float(os.getenv('SHEETS_INDEX_TTL', '60'))
+        self.index_ttl = index_ttl
+        if record_ttl is None:
+            record_ttl = float(os.getenv('SHEETS_RECORD_TTL', '120'))
+        self.record_ttl = record_ttl
+        # Telegram ID -> номер строки в листе (строится по одной колонке F)
+        self._index: Dict[str, int] = {}
+        # Telegram ID -> (время чтения, номер строки, прочитанные поля записи)
+        self._records: Dict[str, Tuple[float, int, dict]] = {}
+        self._index_loaded_at: Optional[float] = None
+        self._index_lock = threading.RLock()
+        # Растет при каждой локальной правке индекса (см. refresh_index)
+        self._index_generation = 0
+        # Архив: Telegram ID -> номер строки, читается только при промахе
+        if archive_sheet is None:
+            archive_sheet = os.getenv('SHEETS_ARCHIVE_SHEET', 'Архив')
+        self.archive_sheet = archive_sheet
+        self.archive_ttl = float(os.getenv('SHEETS_ARCHIVE_INDEX_TTL', '600'))
+        self._archive_index: Dict[str, int] = {}
+        self._archive_loaded_at: Optional[float] = None
+        # Запись по номеру строки не идет одновременно с удалением строк
+        # при переносе в архив, иначе она попала бы в чужую строку
+        self._rows_lock = threading.RLock()
+        # Одновременные одинаковые чтения листа выполняются одним запросом
+        self._reads = SingleFlight()
+        # Очередь отложенной записи регистраций (см. write_queue.py)
+        self.write_queue = None
+        # Теплый старт: данные из снимка отдаются, пока revalidate не сверит их с листом
+        if snapshot_path is None:
+            snapshot_path = os.getenv('SHEETS_SNAPSHOT', 'sheets_snapshot.json')
+        self.snapshot_path = snapshot_path
+        self._snapshot_pending = False
+        self._snapshot_failed = False
+        self._revalidating = False
+        self._revalidated_at = 0.0
+        self._snapshot_lock = threading.Lock()
+        self.load_snapshot()
+
+    @property
+    def service(self):
+        """Клиент Sheets API или None, если подключиться не удалось."""
+        if not self._connected:
+            with self._connect_lock:
+                if not self._connected:
+                    self._service = self._initialize_service()
+                    self._connected = True
+        return self._service
+
+    @service.setter
+    def service(self, service) -> None:
+        with self._connect_lock:
+            self._service = service
+            self._values_resource = None
+            self._connected = True
+
+    def _values(self):
+        """Ресурс spreadsheets().values(), общий для всех потоков.
+
+        googleapiclient строит ресурсы из discovery-документа при каждом
+        вызове spreadsheets() — это десятки миллисекунд процессора, поэтому
+        ресурс создается один раз.
+        """
+        values = self._values_resource
+        if values is None:
+            values = self._values_resource = self.service.spreadsheets().values()
+        return values
+
+    def connect_in_background(self) -> None:
+        """Подключается к Sheets в фоне, чтобы первый запрос клиента не ждал.
+
+        Там же индекс и статусы читаются одним запросом (revalidate): снимок
+        с диска сверяется с листом, а без снимка индекс готов до первого поиска.
+        """
+        threading.Thread(target=self._warm_up, name='sheets-connect', daemon=True).start()
+
+    def _warm_up(self) -> None:
+        if self.service:
+            with background():
+                self.revalidate()
+
+    def _initialize_service(self):
+        """Создает клиент Google Sheets API.
+
+        Клиентская библиотека Google импортируется только здесь: она тяжелая,
+        а бот должен начать отвечать сразу после запуска. Описание API берется
+        из discovery-документа, поставляемого с googleapiclient, без сетевого
+        запроса к discovery-сервису. Запросы идут через общий пул соединений
+        (sheets_transport.PooledHttp), поэтому service можно использовать
+        из нескольких потоков.
+        """
         try:
             service_account_info = self._get_service_account_info()
             spreadsheet_id = os.getenv('GOOGLE_SPREADSHEET_ID')
@@ -28,42 +153,536 @@ class GoogleSheetsManager:
             if not service_account_info or not spreadsheet_id:
                 raise ValueError("Не настроены переменные окружения")
 
+            from google.oauth2.service_account import Credentials
+            from googleapiclient import discovery_cache
+            from googleapiclient.discovery import build, build_from_document
+            from sheets_transport import PooledHttp
+
             creds = Credentials.from_service_account_info(
                 service_account_info,
                 scopes=['https://www.googleapis.com/auth/spreadsheets']
             )
-            self.service = build('sheets', 'v4', credentials=creds)
+            http = PooledHttp(creds)
+            document = discovery_cache.get_static_doc('sheets', 'v4')
+            if document:
+                service = build_from_document(document, http=http)
+            else:
+                service = build('sheets', 'v4', http=http, cache_discovery=False)
             print("✅ Успешное подключение к Google Sheets")
+            return service
             
         except Exception as e:
             print(f"❌ Ошибка инициализации: {str(e)}")
-            self.service = None
+            return None
 
-    def get_client_info(self, telegram_id: str) -> Optional[dict]:
-        """Возвращает полную информацию о клиенте по Telegram ID"""
-        try:
-            result = self.service.spreadsheets().values().get(
+    @staticmethod
+    def _cell(value) -> Optional[str]:
+        """Значение ячейки как строка (UNFORMATTED_VALUE отдает числа числами)."""
+        if value is None or value == '':
+            return value
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        return str(value)
+
+    @classmethod
+    def _parse_row(cls, row: list, fields: Sequence[str] = CLIENT_FIELDS) -> dict:
+        """Превращает строку (или ее часть с колонками fields) в запись клиента."""
+        return {
+            field: cls._cell(row[i]) if len(row) > i else None
+            for i, field in enumerate(fields)
+        }
+
+    @classmethod
+    def _span(cls, fields: Sequence[str]) -> Tuple[str, ...]:
+        """Непрерывный диапазон колонок, покрывающий fields и Telegram ID."""
+        positions = [cls.RECORD_FIELDS.index(field) for field in fields]
+        positions.append(cls.RECORD_FIELDS.index('telegram_id'))
+        return cls.RECORD_FIELDS[min(positions):max(positions) + 1]
+
+    @classmethod
+    def _range(cls, fields: Sequence[str], row: Optional[int] = None,
+               sheet: str = 'Клиенты') -> str:
+        """'Клиенты!F:I' для колонок fields или 'Клиенты!F5:I5' для одной строки."""
+        first = COLUMNS[fields[0]]
+        last = COLUMNS[fields[-1]]
+        if not sheet.isalnum():
+            sheet = f"'{sheet}'"
+        if row is None:
+            return f'{sheet}!{first}:{last}'
+        return f'{sheet}!{first}{row}:{last}{row}'
+
+    def _get_values(self, range_name: str, coalesce: bool = True, **kwargs) -> list:
+        """Читает диапазон: только значения, без форматирования и метаданных.
+
+        Одинаковые одновременные чтения с тем же приоритетом объединяются
+        в один запрос, если coalesce не False: перед записью по номеру строки
+        нужен ответ, запрошенный уже после захвата _rows_lock, а не начатый раньше.
+        kwargs передаются в SheetsScheduler.execute (например, timeout).
+        """
+        def read():
+            return self.scheduler.execute('get', self._values().get(
                 spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                range='Клиенты!A:I'
-            ).execute()
-            
-            for row in result.get('values', []):
-                if len(row) > 5 and row[5] == str(telegram_id):
-                    return {
-                        'first_name': row[0] if len(row) > 0 else None,
-                        'last_name': row[1] if len(row) > 1 else None,
-                        'phone': row[2] if len(row) > 2 else None,
-                        'city': row[3] if len(row) > 3 else None,
-                        'comments': row[4] if len(row) > 4 else None,
-                        'status': row[6] if len(row) > 6 else None,
-                        'last_updated': row[7] if len(row) > 7 else None,
-                        'status_comment': row[8] if len(row) > 8 else None
-                    }
+                range=range_name,
+                valueRenderOption='UNFORMATTED_VALUE',
+                dateTimeRenderOption='FORMATTED_STRING',
+                fields='values'
+            ), **kwargs)
+
+        if coalesce:
+            # Запрос пользователя не ждет фоновое чтение, уступающее квоту
+            result = self._reads.do(
+                (range_name, current_priority()), read, timeout=kwargs.get('timeout', self.scheduler.default_timeout()),
+                kind=self._read_kind(range_name)
+            )
+        else:
+            result = read()
+        return result.get('values', [])
+
+    def _read_kind(self, range_name: str) -> str:
+        """Вид чтения для меток метрик: index, row, archive или full."""
+        sheet, _, cells = range_name.rpartition('!')
+        if self.archive_sheet and sheet.strip("'") == self.archive_sheet:
+            return 'archive'
+        if re.search(r'\d', cells):
+            return 'row'
+        if cells == 'F:F':
+            return 'index'
+        return 'full'
+
+    def _index_is_fresh(self) -> bool:
+        return (
+            self._index_loaded_at is not None
+            and time.monotonic() - self._index_loaded_at < self.index_ttl
+        )
+
+    def _record_is_fresh(self, loaded_at: float) -> bool:
+        return time.monotonic() - loaded_at < self.record_ttl
+
+    def refresh_index(self, coalesce: bool = True, **kwargs) -> Dict[str, int]:
+        """Перестраивает индекс Telegram ID -> строка по одной колонке F.
+
+        Возвращает построенный индекс. coalesce и kwargs передаются
+        в _get_values (например, timeout).
+        """
+        with self._index_lock:
+            generation = self._index_generation
+
+        index = {}
+        for i, row in enumerate(self._get_values('Клиенты!F:F', coalesce, **kwargs)):
+            telegram_id = self._cell(row[0]) if row else None
+            if telegram_id:
+                # При дублях сохраняем первую строку, как и прежний линейный поиск
+                index.setdefault(telegram_id, i + 1)
+
+        self._replace_index(index, generation)
+        return index
+
+    def _replace_index(self, index: Dict[str, int], generation: int) -> None:
+        with self._index_lock:
+            self._index = index
+            # Пока лист читался, индекс правили локально — прочитанное могло
+            # устареть, поэтому следующий поиск перечитает колонку еще раз
+            fresh = self._index_generation == generation
+            self._index_loaded_at = time.monotonic() if fresh else None
+
+    def invalidate_index(self) -> None:
+        """Помечает индекс устаревшим — следующий поиск перечитает лист."""
+        with self._index_lock:
+            self._index_loaded_at = None
+
+    def _ensure_index(self) -> None:
+        """Обновляет индекс при истечении TTL.
+
+        Если Sheets недоступен или квота исчерпана, а индекс уже
+        загружался, отдаем прежний индекс вместо ошибки и не ждем
+        дольше секунды.
+        """
+        if self._index_is_fresh():
+            return
+        if self._index_loaded_at is None:
+            # Индекса нет или он заведомо неверен — отдавать его нельзя
+            self.refresh_index()
+            return
+        try:
+            self.refresh_index(timeout=1.0)
+        except Exception as e:
+            print(f"⚠️ Не удалось обновить индекс ({e}), используем прежний")
+            with self._index_lock:
+                # Следующая попытка обновления — не раньше чем через 5 секунд
+                self._index_loaded_at = time.monotonic() - self.index_ttl + 5
+
+    def _lookup(self, telegram_id: str) -> Optional[int]:
+        """Номер строки клиента по индексу (обновляя его при истечении TTL)."""
+        if self._snapshot_pending and self._index_loaded_at is not None:
+            # Теплый старт: строку из снимка отдаем сразу, лист сверяется в фоне.
+            # Промах не доверяем снимку — клиент мог появиться после него
+            with self._index_lock:
+                row_number = self._index.get(str(telegram_id))
+            if row_number is not None:
+                self._revalidate_in_background()
+                return row_number
+        # Колонка читается без блокировки индекса, чтобы поиски не выстраивались
+        # в очередь за одним запросом (одинаковые чтения объединяются)
+        self._ensure_index()
+        with self._index_lock:
+            return self._index.get(str(telegram_id))
+
+    def _row_for_write(self, telegram_id: str) -> Optional[int]:
+        """Номер строки клиента для записи, сверенный с листом (под _rows_lock).
+
+        Строке из снимка или из индекса в пределах TTL верить нельзя: строки
+        могли удалить или отсортировать, и запись попала бы в чужую строку.
+        Поэтому ячейка F строки из индекса перечитывается, а без индекса
+        или при расхождении перечитывается вся колонка F.
+        """
+        with self._index_lock:
+            row_number = None
+            if not self._snapshot_pending and self._index_loaded_at is not None:
+                row_number = self._index.get(telegram_id)
+        if row_number is not None:
+            values = self._get_values(self._range(('telegram_id',), row_number), coalesce=False)
+            if values and values[0] and self._cell(values[0][0]) == telegram_id:
+                return row_number
+        return self.refresh_index(coalesce=False).get(telegram_id)
+
+    def refresh_archive_index(self, **kwargs) -> None:
+        """Перестраивает индекс архива по его колонке F."""
+        try:
+            rows = self._get_values(self._range(('telegram_id',), sheet=self.archive_sheet), **kwargs)
+        except HttpError as e:
+            if e.resp.status != 400:
+                raise
+            # Листа архива еще нет — его создаст первый перенос
+            rows = []
+        index = {}
+        for i, row in enumerate(rows):
+            telegram_id = self._cell(row[0]) if row else None
+            if telegram_id:
+                index.setdefault(telegram_id, i + 1)
+        with self._index_lock:
+            self._archive_index = index
+            self._archive_loaded_at = time.monotonic()
+
+    def _lookup_archive(self, telegram_id: str) -> Optional[int]:
+        """Номер строки клиента в архиве (индекс архива живет archive_ttl секунд)."""
+        if not self.archive_sheet:
             return None
+        loaded_at = self._archive_loaded_at
+        if loaded_at is None:
+            self.refresh_archive_index()
+        elif time.monotonic() - loaded_at >= self.archive_ttl:
+            try:
+                self.refresh_archive_index(timeout=1.0)
+            except Exception as e:
+                print(f"⚠️ Не удалось обновить индекс архива ({e}), используем прежний")
+                with self._index_lock:
+                    self._archive_loaded_at = time.monotonic() - self.archive_ttl + 5
+        with self._index_lock:
+            return self._archive_index.get(str(telegram_id))
+
+    def _find_archived(self, telegram_id: str, fields: Sequence[str]) -> Optional[dict]:
+        """Читает колонки fields строки клиента из архива (без кэша: такие клиенты редки)."""
+        row_number = self._lookup_archive(telegram_id)
+        if row_number is None:
+            return None
+        span = self._span(fields)
+        values = self._get_values(self._range(span, row_number, self.archive_sheet))
+        record = self._parse_row(values[0] if values else [], span)
+        if record['telegram_id'] != telegram_id:
+            # Архив правили вручную — при следующем промахе перечитаем индекс
+            with self._index_lock:
+                self._archive_loaded_at = None
+            return None
+        return {field: record[field] for field in fields}
+
+    def _cache_record(self, telegram_id: str, row_number: int, record: dict) -> None:
+        """Кладет (часть) записи в кэш, дополняя свежую запись той же строки."""
+        with self._index_lock:
+            cached = self._records.get(telegram_id)
+            if cached and cached[1] == row_number and self._record_is_fresh(cached[0]):
+                record = dict(cached[2], **record)
+            self._records[telegram_id] = (time.monotonic(), row_number, record)
+
+    def _patch_record(self, telegram_id: str, row_number: int, **fields) -> None:
+        """Обновляет поля закэшированной записи после собственной записи в лист."""
+        with self._index_lock:
+            cached = self._records.get(telegram_id)
+            if cached and cached[1] == row_number:
+                self._records[telegram_id] = (cached[0], row_number, dict(cached[2], **fields))
+
+    def _fetch_record(self, telegram_id: str, row_number: int,
+                      fields: Sequence[str]) -> Optional[dict]:
+        """Читает колонки fields одной строки (или берет их из кэша).
+
+        Если Sheets недоступен, отдает последнюю прочитанную запись
+        с пометкой stale=True (данные могут быть устаревшими).
+        """
+        with self._index_lock:
+            cached = self._records.get(telegram_id)
+        usable = (cached and cached[1] == row_number
+                  and all(field in cached[2] for field in fields))
+        if usable and self._record_is_fresh(cached[0]):
+            return {field: cached[2][field] for field in fields}
+        if usable and self._snapshot_pending:
+            self._revalidate_in_background()
+            record = {field: cached[2][field] for field in fields}
+            if self._snapshot_failed:
+                # Сверить снимок с листом пока не удалось
+                record['stale'] = True
+            return record
+
+        span = self._span(fields)
+        try:
+            values = self._get_values(self._range(span, row_number))
         except Exception as e:
-            print(f"Ошибка при получении информации о клиенте: {e}")
+            if usable:
+                print(f"⚠️ Не удалось прочитать строку ({e}), отдаем запись из кэша")
+                return dict({field: cached[2][field] for field in fields}, stale=True)
+            raise
+
+        record = self._parse_row(values[0] if values else [], span)
+        if record['telegram_id'] != telegram_id:
+            # Строки сдвинулись (удаление или сортировка в таблице)
             return None
-    
+        self._cache_record(telegram_id, row_number, record)
+        return {field: record[field] for field in fields}
+
+    def find_client(self, telegram_id: str,
+                    fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """Возвращает запись клиента, читая только нужные колонки его строки.
+
+        fields — какие поля нужны (по умолчанию все). Строка берется из
+        индекса по колонке F, затем читается диапазон вида Клиенты!F5:I5;
+        если клиента там нет, так же ищем в архиве выданных заказов.
+        None означает, что клиент не зарегистрирован. Если таблица
+        недоступна, возвращается последняя известная запись с stale=True,
+        а если ее нет — SheetsBusy/SheetsUnavailable, а не None.
+        """
+        # Регистрация могла быть принята, но еще не записана в таблицу
+        pending = self._pending_client(telegram_id)
+        if pending:
+            return pending
+
+        if not self.service:
+            return None
+
+        telegram_id = str(telegram_id)
+        fields = tuple(fields or self.RECORD_FIELDS)
+        try:
+            row_number = self._lookup(telegram_id)
+            if row_number is None:
+                record = self._find_archived(telegram_id, fields)
+            else:
+                record = self._fetch_record(telegram_id, row_number, fields)
+                if record is None:
+                    self.invalidate_index()
+                    row_number = self._lookup(telegram_id)
+                    if row_number is None:
+                        record = self._find_archived(telegram_id, fields)
+                    else:
+                        record = self._fetch_record(telegram_id, row_number, fields)
+            if record is not None:
+                record['telegram_id'] = telegram_id
+            return record
+        except SheetsBusy:
+            raise
+        except Exception as e:
+            print(f"Ошибка при поиске клиента: {e}")
+            raise SheetsUnavailable(str(e)) from e
+
+    def client_exists(self, telegram_id: str) -> bool:
+        """Проверяет регистрацию только по индексам колонки F листа и архива.
+
+        Ошибка Sheets не превращается в «не зарегистрирован»: без индекса
+        поднимается SheetsBusy/SheetsUnavailable.
+        """
+        if self._pending_client(telegram_id):
+            return True
+        if not self.service:
+            return False
+        try:
+            return (self._lookup(telegram_id) is not None
+                    or self._lookup_archive(telegram_id) is not None)
+        except SheetsBusy:
+            raise
+        except Exception as e:
+            print(f"Ошибка при поиске клиента: {e}")
+            raise SheetsUnavailable(str(e)) from e
+
+    def iter_clients(self) -> Iterator[dict]:
+        """Перебирает записи всех клиентов — единственное чтение всего A:I."""
+        if not self.service:
+            return
+        with self._index_lock:
+            generation = self._index_generation
+
+        index = {}
+        records = []
+        for i, row in enumerate(self._get_values('Клиенты!A:I')):
+            record = self._parse_row(row)
+            telegram_id = record['telegram_id']
+            # При дублях сохраняем первую строку, как и поиск клиента
+            if telegram_id and telegram_id not in index:
+                index[telegram_id] = i + 1
+                records.append((i + 1, record))
+
+        self._replace_index(index, generation)
+        for row_number, record in records:
+            self._cache_record(record['telegram_id'], row_number, record)
+            yield dict(record)
+
+    def iter_client_ids(self) -> Iterator[str]:
+        """Telegram ID всех клиентов из индексов колонки F листа и архива."""
+        if not self.service:
+            return
+        self._ensure_index()
+        if self.archive_sheet:
+            self.refresh_archive_index()
+        with self._index_lock:
+            telegram_ids = list(self._index)
+            telegram_ids += [tid for tid in self._archive_index if tid not in self._index]
+        yield from telegram_ids
+
+    def iter_statuses(self) -> Iterator[Tuple[str, str]]:
+        """Читает только колонки F:I (ID и статус) одним запросом.
+
+        Заодно обновляет статусы в кэше записей, чтобы «Проверить статус»
+        сразу видел правки сотрудников и не читал строку отдельно.
+        """
+        if not self.service:
+            return
+        status_fields = self._span(STATUS_FIELDS)
+        rows = self._get_values(self._range(status_fields))
+
+        with self._index_lock:
+            index = self._index
+        for i, row in enumerate(rows):
+            record = self._parse_row(row, status_fields)
+            telegram_id = record['telegram_id']
+            if not telegram_id:
+                continue
+            if index.get(telegram_id) == i + 1:
+                self._cache_record(telegram_id, i + 1, record)
+            yield telegram_id, record['status'] or ''
+        self.save_snapshot()
+
+    def revalidate(self, **kwargs) -> bool:
+        """Сверяет индекс и статусы с листом одним чтением F:I.
+
+        Индекс строится заново, статусы в кэше записей становятся свежими,
+        снимок на диске перезаписывается. kwargs передаются в
+        SheetsScheduler.execute. Возвращает False, если лист прочитать не удалось.
+        """
+        try:
+            with self._index_lock:
+                generation = self._index_generation
+            status_fields = self._span(STATUS_FIELDS)
+            rows = self._get_values(self._range(status_fields), **kwargs)
+        except Exception as e:
+            print(f"⚠️ Не удалось сверить снимок с таблицей: {e}")
+            self._snapshot_failed = True
+            return False
+
+        index = {}
+        records = []
+        for i, row in enumerate(rows):
+            record = self._parse_row(row, status_fields)
+            telegram_id = record['telegram_id']
+            # При дублях сохраняем первую строку, как и поиск клиента
+            if telegram_id and telegram_id not in index:
+                index[telegram_id] = i + 1
+                records.append((i + 1, record))
+        self._replace_index(index, generation)
+        for row_number, record in records:
+            self._cache_record(record['telegram_id'], row_number, record)
+
+        self._snapshot_pending = False
+        self._snapshot_failed = False
+        self.save_snapshot()
+        return True
+
+    def _revalidate_in_background(self) -> None:
+        """Запускает revalidate в фоне, если он еще не идет (не чаще раза в 5 секунд)."""
+        with self._snapshot_lock:
+            if self._revalidating or time.monotonic() - self._revalidated_at < 5:
+                return
+            self._revalidating = True
+
+        def run():
+            try:
+                with background():
+                    self.revalidate()
+            finally:
+                with self._snapshot_lock:
+                    self._revalidating = False
+                    self._revalidated_at = time.monotonic()
+
+        threading.Thread(target=run, name='sheets-revalidate', daemon=True).start()
+
+    def load_snapshot(self) -> bool:
+        """Загружает снимок индекса и статусов, сохраненный прошлым запуском.
+
+        Снимок — JSON вида {"index": {ID: строка}, "statuses": {ID: [статус,
+        дата, комментарий]}}: словарь index сразу становится индексом без
+        копирования. Пока revalidate не сверит снимок с листом, найденные
+        в нем клиенты отдаются без обращения к Sheets.
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return False
+        # Метки времени «уже устарело»: обычный TTL снимку не доверяет
+        now = time.monotonic()
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            index = snapshot['index']
+            records = {}
+            for telegram_id, (status, last_updated, status_comment) in snapshot['statuses'].items():
+                if telegram_id in index:
+                    records[telegram_id] = (now - self.record_ttl, index[telegram_id], {
+                        'telegram_id': telegram_id,
+                        'status': status,
+                        'last_updated': last_updated,
+                        'status_comment': status_comment
+                    })
+        except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+            print(f"⚠️ Снимок таблицы поврежден, начинаем без него: {e}")
+            return False
+
+        with self._index_lock:
+            self._index = index
+            self._index_loaded_at = now - self.index_ttl
+            self._records.update(records)
+        self._snapshot_pending = True
+        print(f"♨️ Загружен снимок таблицы: клиентов {len(index)}")
+        return True
+
+    def save_snapshot(self) -> None:
+        """Атомарно записывает индекс и известные статусы на диск."""
+        if not self.snapshot_path:
+            return
+        with self._index_lock:
+            if self._index_loaded_at is None:
+                # Индекс заведомо неверен — прежний снимок лучше
+                return
+            index = dict(self._index)
+            statuses = {
+                telegram_id: [record['status'], record['last_updated'], record['status_comment']]
+                for telegram_id, (_, row_number, record) in self._records.items()
+                if index.get(telegram_id) == row_number
+                and all(field in record for field in STATUS_FIELDS)
+            }
+        with self._snapshot_lock:
+            tmp_path = self.snapshot_path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump({'index': index, 'statuses': statuses}, f,
+                              ensure_ascii=False, separators=(',', ':'))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.snapshot_path)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить снимок таблицы: {e}")
+
     def _get_service_account_info(self) -> dict:
         """Получает данные сервисного аккаунта из переменных окружения."""
         try:
@@ -72,6 +691,52 @@ class GoogleSheetsManager:
             print("⚠️ Неверный формат GOOGLE_SERVICE_ACCOUNT_JSON")
             return {}
 
+    def _row_from_updated_range(self, updated_range: str) -> Optional[int]:
+        """Извлекает номер строки из диапазона вида 'Клиенты'!A5:I5."""
+        match = re.search(r'![A-Z]+(\d+)', updated_range or '')
+        return int(match.group(1)) if match else None
+
+    def _append_rows(self, rows: List[list]) -> None:
+        """Дописывает строки одним запросом append и обновляет индекс."""
+        with self._rows_lock:
+            self._append_rows_locked(rows)
+
+    def _append_rows_locked(self, rows: List[list]) -> Optional[int]:
+        """Дописывает строки; возвращает номер первой из них (если API его сообщил)."""
+        result = self.scheduler.execute('append', self._values().append(
+            spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+            range='Клиенты!A:I',
+            valueInputOption='USER_ENTERED',
+            insertDataOption='INSERT_ROWS',
+            body={'values': rows}
+        ))
+
+        first_row = self._row_from_updated_range(
+            result.get('updates', {}).get('updatedRange')
+        )
+        with self._index_lock:
+            self._index_generation += 1
+            if first_row is None:
+                self._index_loaded_at = None
+                return None
+            for offset, values in enumerate(rows):
+                row_number = first_row + offset
+                if values[5] not in self._index:
+                    self._index[values[5]] = row_number
+                    self._records[values[5]] = (
+                        time.monotonic(), row_number, self._parse_row(values)
+                    )
+        return first_row
+
+    @staticmethod
+    def _client_row(first_name: str, last_name: str, phone: str,
+                    city: str, comments: str, telegram_id: str) -> list:
+        return [
+            first_name, last_name, phone, city,
+            comments, str(telegram_id),
+            "В обработке", "", ""
+        ]
+
     def add_client(self, first_name: str, last_name: str, phone: str, 
                   city: str, comments: str, telegram_id: str) -> Tuple[bool, str]:
         """Добавляет нового клиента в таблицу."""
@@ -79,22 +744,9 @@ class GoogleSheetsManager:
             return False, "Сервис не инициализирован"
 
         try:
-            values = [
-                first_name, last_name, phone, city, 
-                comments, str(telegram_id),
-                "В обработке", "", ""
-            ]
-            
-            body = {'values': [values]}
-            
-            result = self.service.spreadsheets().values().append(
-                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                range='Клиенты!A:I',
-                valueInputOption='USER_ENTERED',
-                insertDataOption='INSERT_ROWS',
-                body=body
-            ).execute()
-            
+            self._append_rows([self._client_row(
+                first_name, last_name, phone, city, comments, telegram_id
+            )])
             return True, "Клиент успешно зарегистрирован"
             
         except HttpError as e:
@@ -105,6 +757,27 @@ class GoogleSheetsManager:
             print(f"❌ Ошибка: {str(e)}")
             return False, f"Ошибка при добавлении: {str(e)}"
 
+    def add_clients(self, clients: List[dict]) -> Tuple[bool, str]:
+        """Добавляет нескольких клиентов одним запросом append.
+
+        Каждый элемент clients — словарь с аргументами add_client.
+        """
+        if not self.service:
+            return False, "Сервис не инициализирован"
+        if not clients:
+            return True, "Нет клиентов для добавления"
+
+        try:
+            self._append_rows([self._client_row(**client) for client in clients])
+            return True, f"Добавлено клиентов: {len(clients)}"
+        except HttpError as e:
+            error_msg = f"Ошибка API: {e.content.decode()}"
+            print(f"❌ {error_msg}")
+            return False, error_msg
+        except Exception as e:
+            print(f"❌ Ошибка: {str(e)}")
+            return False, f"Ошибка при добавлении: {str(e)}"
+
     def update_status(self, telegram_id: str, new_status: str, 
                     comment: str = "") -> Tuple[bool, str]:
         """Обновляет статус заказа."""
@@ -112,36 +785,328 @@ class GoogleSheetsManager:
             return False, "Сервис не инициализирован"
 
         try:
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                range='Клиенты!A:I'
-            ).execute()
-            
-            rows = result.get('values', [])
-            for i, row in enumerate(rows):
-                if len(row) > 5 and row[5] == str(telegram_id):
-                    range_name = f'Клиенты!G{i+1}:I{i+1}'
-                    update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                    
-                    body = {
-                        'values': [[new_status, update_time, comment]]
-                    }
-                    
-                    self.service.spreadsheets().values().update(
-                        spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                        range=range_name,
-                        valueInputOption='USER_ENTERED',
-                        body=body
-                    ).execute()
-                    
-                    return True, "Статус успешно обновлен"
-            
-            return False, "Клиент не найден"
-            
+            with self._rows_lock:
+                return self._update_status_locked(str(telegram_id), new_status, comment)
         except Exception as e:
             print(f"❌ Ошибка обновления статуса: {str(e)}")
             return False, str(e)
 
+    def _update_status_locked(self, telegram_id: str, new_status: str,
+                              comment: str) -> Tuple[bool, str]:
+        row_number = self._row_for_write(telegram_id)
+        if row_number is None:
+            # Новый заказ клиента из архива — возвращаем его на основной лист
+            row_number = self._restore_archived(telegram_id)
+        if row_number is None:
+            return False, "Клиент не найден"
+
+        range_name = self._range(STATUS_FIELDS, row_number)
+        update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        
+        body = {
+            'values': [[new_status, update_time, comment]]
+        }
+        
+        self.scheduler.execute('update', self._values().update(
+            spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+            range=range_name,
+            valueInputOption='USER_ENTERED',
+            body=body
+        ))
+
+        with self._index_lock:
+            self._index_generation += 1
+        self._patch_record(
+            telegram_id, row_number,
+            status=new_status, last_updated=update_time, status_comment=comment
+        )
+        
+        return True, "Статус успешно обновлен"
+
+    def bulk_update_status(self, mapping: Dict[str, StatusUpdate],
+                           comment: str = "") -> Tuple[bool, str]:
+        """Обновляет статусы многих клиентов одним запросом batchUpdate.
+
+        mapping — Telegram ID -> новый статус, пара (статус, комментарий)
+        или тройка (статус, комментарий, дата обновления).
+        Строки находятся одним чтением колонки F прямо перед записью (индекс
+        в памяти мог устареть, пока сотрудники правили таблицу), клиенты
+        из архива возвращаются на основной лист.
+        """
+        if not self.service:
+            return False, "Сервис не инициализирован"
+        if not mapping:
+            return True, "Нет клиентов для обновления"
+
+        try:
+            with self._rows_lock:
+                return self._bulk_update_status_locked(mapping, comment)
+        except Exception as e:
+            print(f"❌ Ошибка массового обновления статусов: {str(e)}")
+            return False, str(e)
+
+    def _bulk_update_status_locked(self, mapping: Dict[str, StatusUpdate],
+                                   comment: str) -> Tuple[bool, str]:
+        # Номера строк для записи берутся только из только что прочитанной
+        # колонки F: по строке из кэша статус попал бы в чужую строку
+        index = self.refresh_index(coalesce=False)
+
+        update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        data = []
+        updated = {}
+        missing = []
+        for telegram_id, value in mapping.items():
+            telegram_id = str(telegram_id)
+            new_status, status_comment, last_updated = unpack_status(
+                value, comment, update_time
+            )
+            row_number = index.get(telegram_id)
+            if row_number is None:
+                row_number = self._restore_archived(telegram_id)
+            if row_number is None:
+                missing.append(telegram_id)
+                continue
+            data.append({
+                'range': self._range(STATUS_FIELDS, row_number),
+                'values': [[new_status, last_updated, status_comment]]
+            })
+            updated[telegram_id] = (row_number, {
+                'status': new_status,
+                'last_updated': last_updated,
+                'status_comment': status_comment
+            })
+
+        if data:
+            self.scheduler.execute('batchUpdate', self._values().batchUpdate(
+                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+                body={'valueInputOption': 'USER_ENTERED', 'data': data}
+            ))
+            with self._index_lock:
+                self._index_generation += 1
+            for telegram_id, (row_number, fields) in updated.items():
+                self._patch_record(telegram_id, row_number, **fields)
+
+        msg = f"Обновлено статусов: {len(updated)}"
+        if missing:
+            shown = ", ".join(missing[:10])
+            more = f" и еще {len(missing) - 10}" if len(missing) > 10 else ""
+            msg += f"; не найдены: {shown}{more}"
+        return bool(updated), msg
+
+    def _restore_archived(self, telegram_id: str) -> Optional[int]:
+        """Переносит строку клиента из архива обратно на лист «Клиенты».
+
+        Возвращает номер новой строки или None, если в архиве клиента нет.
+        """
+        archived_row = self._lookup_archive(telegram_id)
+        if archived_row is None:
+            return None
+        archive_range = self._range(self.RECORD_FIELDS, archived_row, self.archive_sheet)
+        values = self._get_values(archive_range)
+        row = [self._cell(value) or '' for value in (values[0] if values else [])]
+        row += [''] * (len(self.RECORD_FIELDS) - len(row))
+        if row[5] != telegram_id:
+            with self._index_lock:
+                self._archive_loaded_at = None
+            return None
+
+        with self._rows_lock:
+            row_number = self._append_rows_locked([row])
+        self.scheduler.execute('clear', self._values().clear(
+            spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+            range=archive_range,
+            body={}
+        ))
+        with self._index_lock:
+            self._archive_index.pop(telegram_id, None)
+        print(f"📤 Клиент {telegram_id} возвращен из архива")
+        if row_number is None:
+            return self.refresh_index(coalesce=False).get(telegram_id)
+        return row_number
+
+    @staticmethod
+    def _parse_date(value: Optional[str]) -> Optional[datetime]:
+        """Дата обновления статуса из ячейки (строкой или серийным числом)."""
+        if not value:
+            return None
+        for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%d.%m.%Y %H:%M:%S', '%d.%m.%Y'):
+            try:
+                return datetime.strptime(value, fmt)
+            except ValueError:
+                pass
+        try:
+            # Ячейка без формата даты отдает число дней с 30.12.1899
+            return datetime(1899, 12, 30) + timedelta(days=float(value))
+        except (ValueError, OverflowError):
+            return None
+
+    def _sheet_ids(self) -> Dict[str, int]:
+        """Название листа -> sheetId (нужен для удаления строк)."""
+        result = self.scheduler.execute('get', self.service.spreadsheets().get(
+            spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+            fields='sheets.properties(sheetId,title)'
+        ))
+        return {
+            sheet['properties']['title']: sheet['properties']['sheetId']
+            for sheet in result.get('sheets', [])
+        }
+
+    def _create_archive_sheet(self) -> None:
+        """Создает лист архива с теми же заголовками, что у «Клиенты»."""
+        self.scheduler.execute('batchUpdate', self.service.spreadsheets().batchUpdate(
+            spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+            body={'requests': [{'addSheet': {'properties': {'title': self.archive_sheet}}}]}
+        ), idempotent=False)
+        headers = self._get_values('Клиенты!A1:I1')
+        if headers:
+            self.scheduler.execute('update', self._values().update(
+                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+                range=self._range(self.RECORD_FIELDS, 1, self.archive_sheet),
+                valueInputOption='RAW',
+                body={'values': headers[:1]}
+            ))
+        print(f"✅ Создан лист архива «{self.archive_sheet}»")
+
+    def archive_delivered(self, statuses: Optional[Sequence[str]] = None,
+                          older_than_days: Optional[float] = None,
+                          batch_size: Optional[int] = None) -> Tuple[bool, str]:
+        """Переносит давно выданные заказы с листа «Клиенты» в архив.
+
+        Переносятся строки со статусом из statuses (ARCHIVE_STATUSES через
+        запятую, по умолчанию «Выдан»), обновленные раньше чем older_than_days
+        дней назад (ARCHIVE_AFTER_DAYS, по умолчанию 30). Так основной лист,
+        который читают поиск и проверка статусов, не растет вместе с
+        историей клиентов.
+
+        Перенос идет пачками по batch_size строк (ARCHIVE_BATCH_SIZE,
+        по умолчанию 200) снизу листа вверх: перед удалением строки пачки
+        перечитываются и заново проверяются, строки дописываются в архив одним append
+        и удаляются одним batchUpdate. Уже попавшие в архив клиенты (после
+        прерванного переноса) повторно не дописываются.
+        """
+        if not self.service:
+            return False, "Сервис не инициализирован"
+        if not self.archive_sheet:
+            return False, "Архив отключен (SHEETS_ARCHIVE_SHEET)"
+        if statuses is None:
+            statuses = [
+                status.strip()
+                for status in os.getenv('ARCHIVE_STATUSES', 'Выдан').split(',')
+                if status.strip()
+            ]
+        if older_than_days is None:
+            older_than_days = float(os.getenv('ARCHIVE_AFTER_DAYS', '30'))
+        batch_size = batch_size or int(os.getenv('ARCHIVE_BATCH_SIZE', '200'))
+        cutoff = datetime.now() - timedelta(days=older_than_days)
+
+        try:
+            sheet_ids = self._sheet_ids()
+            if self.archive_sheet not in sheet_ids:
+                self._create_archive_sheet()
+            self.refresh_archive_index()
+
+            def archivable(record: dict) -> bool:
+                updated_at = self._parse_date(record['last_updated'])
+                return bool(record['telegram_id'] and record['status'] in statuses
+                            and updated_at is not None and updated_at < cutoff)
+
+            candidates = [
+                (i + 1, record)
+                for i, record in enumerate(map(self._parse_row, self._get_values('Клиенты!A:I')))
+                if archivable(record)
+            ]
+
+            # Снизу вверх: удаление пачки не сдвигает строки следующих пачек
+            candidates.reverse()
+            moved = 0
+            for start in range(0, len(candidates), batch_size):
+                moved += self._archive_batch(
+                    sheet_ids['Клиенты'], candidates[start:start + batch_size], archivable
+                )
+            return True, f"Перенесено в архив: {moved} из {len(candidates)}"
+
+        except Exception as e:
+            print(f"❌ Ошибка переноса в архив: {str(e)}")
+            return False, str(e)
+
+    def _archive_batch(self, sheet_id: int, batch: List[Tuple[int, dict]],
+                       archivable: Callable[[dict], bool]) -> int:
+        """Переносит пачку строк (номера по убыванию) в архив; возвращает их число.
+
+        Строки пачки перечитываются целиком под _rows_lock: в архив попадают
+        свежие значения, а строка, которую после чтения кандидатов сдвинули
+        или изменили так, что переносить ее уже не нужно, остается на месте.
+        """
+        with self._rows_lock:
+            first, last = batch[-1][0], batch[0][0]
+            current = self._get_values(f'Клиенты!A{first}:I{last}', coalesce=False)
+            rows = []
+            for row_number, record in batch:
+                offset = row_number - first
+                fresh = self._parse_row(current[offset] if offset < len(current) else [])
+                if fresh['telegram_id'] == record['telegram_id'] and archivable(fresh):
+                    rows.append((row_number, fresh))
+            if not rows:
+                return 0
+
+            with self._index_lock:
+                archived = set(self._archive_index)
+            new_rows = [
+                [record[field] or '' for field in self.RECORD_FIELDS]
+                for _, record in reversed(rows)
+                if record['telegram_id'] not in archived
+            ]
+            if new_rows:
+                result = self.scheduler.execute('append', self._values().append(
+                    spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+                    range=self._range(self.RECORD_FIELDS, sheet=self.archive_sheet),
+                    valueInputOption='USER_ENTERED',
+                    insertDataOption='INSERT_ROWS',
+                    body={'values': new_rows}
+                ))
+                first_row = self._row_from_updated_range(
+                    result.get('updates', {}).get('updatedRange')
+                )
+                with self._index_lock:
+                    if first_row is None:
+                        self._archive_loaded_at = None
+                    else:
+                        for offset, values in enumerate(new_rows):
+                            self._archive_index.setdefault(values[5], first_row + offset)
+
+            # Подряд идущие строки удаляются одним диапазоном, снизу вверх
+            spans = []
+            for row_number, _ in rows:
+                if spans and spans[-1][0] == row_number + 1:
+                    spans[-1][0] = row_number
+                else:
+                    spans.append([row_number, row_number])
+            # Удаление не повторяется: если первый запрос все же выполнился,
+            # повтор удалил бы строки, сдвинувшиеся на место удаленных. При
+            # ошибке перенос останавливается, а следующий проход заново
+            # сверит колонку F (уже перенесенные строки в архив не допишутся)
+            try:
+                self.scheduler.execute('batchUpdate', self.service.spreadsheets().batchUpdate(
+                    spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
+                    body={'requests': [
+                        {'deleteDimension': {'range': {
+                            'sheetId': sheet_id, 'dimension': 'ROWS',
+                            'startIndex': start - 1, 'endIndex': end
+                        }}}
+                        for start, end in spans
+                    ]}
+                ), idempotent=False)
+            finally:
+                with self._index_lock:
+                    # Строки ниже удаленных могли сдвинуться — индекс и кэш строк перечитаются
+                    self._index_generation += 1
+                    self._index_loaded_at = None
+                    self._records.clear()
+
+        ARCHIVED_ROWS.inc(amount=len(rows))
+        print(f"🗄️ Перенесено в архив строк: {len(rows)}")
+        return len(rows)
+
     def setup_headers(self) -> Tuple[bool, str]:
         """Устанавливает заголовки таблицы."""
         headers = [
@@ -152,291 +1117,65 @@ class GoogleSheetsManager:
         
         try:
             body = {'values': [headers]}
-            self.service.spreadsheets().values().update(
+            self.scheduler.execute('update', self._values().update(
                 spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
                 range='Клиенты!A1:I1',
                 valueInputOption='RAW',
                 body=body
-            ).execute()
+            ))
             return True, "Заголовки установлены"
         except Exception as e:
             return False, str(e)
 
-    def get_client_status(self, telegram_id: str) -> Optional[dict]:
-        """Возвращает текущий статус клиента."""
-        try:
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                range='Клиенты!A:I'
-            ).execute()
-            
-            for row in result.get('values', []):
-                if len(row) > 5 and row[5] == str(telegram_id):
-                    return {
-                        'status': row[6] if len(row) > 6 else None,
-                        'last_updated': row[7] if len(row) > 7 else None,
-                        'comment': row[8] if len(row) > 8 else None
-                    }
-            return None
-        except Exception:
-            return None
-
-    def client_exists(self, telegram_id: str) -> bool:
-        """Проверяет, существует ли клиент с заданным Telegram ID."""
-        if not self.service:
-            return False
+class AsyncSheetsManager:
+    """Асинхронный фасад над хранилищем клиентов (GoogleSheetsManager и др.).
 
-        try:
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=os.getenv('GOOGLE_SPREADSHEET_ID'),
-                range='Клиенты!A:I'
-            ).execute()
-            
-            for row in result.get('values', []):
-                if len(row) > 5 and row[5] == str(telegram_id):
-                    return True
-            return False
-        except Exception:
-            return False
+    Блокирующие вызовы Sheets API выполняются в ограниченном пуле потоков,
+    поэтому медленный ответ таблицы не останавливает цикл событий.
+    """
 
-# Инициализация бота
-TOKEN = os.getenv('TELEGRAM_TOKEN') or os.getenv('BOT_TOKEN') or '8102280931:AAFNx7zZOAV4QjRjNnNzB6edsgeXsLBFQss'
-bot = telebot.TeleBot(TOKEN)
-sheets_manager = GoogleSheetsManager()
-user_states = {}
-
-# Клавиатуры
-def create_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False, row_width=2)
-    buttons = [
-        KeyboardButton("Регистрация клиента"),
-        KeyboardButton("Мой профиль"),
-        KeyboardButton("Проверить статус"),
-        KeyboardButton("Связаться с нами"),
-        KeyboardButton("Помощь")
-    ]
-    markup.add(*buttons)
-    return markup
-
-def create_cancel_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add("Отмена")
-    return markup
-
-# Обработчики сообщений
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
-    bot.send_message(
-        chat_id=message.chat.id,
-        text="🚛 Добро пожаловать в NBM Japan!\n"
-             "🌏 Ваша надежная карго компания для доставки из Японии\n\n"
-             "📦 Мы доставляем товары быстро и безопасно\n"
-             "🎌 Прямые поставки из Японии\n\n"
-             "Выберите действие:",
-        reply_markup=create_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: message.text == "Проверить статус")
-def handle_status_check(message):
-    """Обработчик для проверки статуса заказа"""
-    status_info = sheets_manager.get_client_status(str(message.from_user.id))
-    
-    if not status_info:
-        bot.send_message(
-            message.chat.id,
-            "❌ Ваш статус не найден. Возможно, вы еще не зарегистрированы.",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    status = status_info.get('status', 'неизвестен')
-    last_updated = status_info.get('last_updated', 'не указана')
-    comment = status_info.get('comment', 'нет комментариев')
-    
-    status_descriptions = {
-        "В обработке": "🔄 Ваш заказ находится в обработке",
-        "Отправлен": "🚢 Ваш заказ отправлен из Японии",
-        "В пути": "✈️ Ваш заказ в пути",
-        "Прибыл": "✅ Ваш заказ прибыл в пункт выдачи"
-    }
-    
-    description = status_descriptions.get(status, f"Статус: {status}")
-    
-    response = (
-        f"📦 <b>Статус вашего заказа</b>\n\n"
-        f"{description}\n\n"
-        #f"📅 <b>Последнее обновление:</b> {last_updated}\n"
-        #f"📝 <b>Комментарий:</b> {comment}"
-    )
-    
-    bot.send_message(
-        message.chat.id,
-        response,
-        parse_mode='HTML',
-        reply_markup=create_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: message.text == "Регистрация клиента")
-def handle_registration_start(message):
-    """Начинает процесс регистрации, проверяя, не зарегистрирован ли пользователь уже."""
-    telegram_id = str(message.from_user.id)
-    
-    if sheets_manager.client_exists(telegram_id):
-        bot.send_message(
-            message.chat.id,
-            "ℹ️ Вы уже зарегистрированы в нашей системе. "
-            "Если вам нужно обновить информацию, пожалуйста, свяжитесь с нами.",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.chat.id] = {'state': 'awaiting_first_name'}
-    bot.send_message(
-        chat_id=message.chat.id,
-        text="📝 Давайте начнем регистрацию!\n\n"
-             "Пожалуйста, введите ваше имя:",
-        reply_markup=create_cancel_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'awaiting_first_name')
-def handle_first_name(message):
-    if message.text.lower() == 'отмена':
-        del user_states[message.chat.id]
-        bot.send_message(
-            message.chat.id,
-            "❌ Регистрация отменена",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.chat.id] = {
-        'state': 'awaiting_last_name',
-        'first_name': message.text
-    }
-    bot.send_message(
-        message.chat.id,
-        "Теперь введите вашу фамилию:",
-        reply_markup=create_cancel_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'awaiting_last_name')
-def handle_last_name(message):
-    if message.text.lower() == 'отмена':
-        del user_states[message.chat.id]
-        bot.send_message(
-            message.chat.id,
-            "❌ Регистрация отменена",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.chat.id]['state'] = 'awaiting_phone'
-    user_states[message.chat.id]['last_name'] = message.text
-    bot.send_message(
-        message.chat.id,
-        "Теперь введите ваш номер телефона:",
-        reply_markup=create_cancel_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'awaiting_phone')
-def handle_phone(message):
-    if message.text.lower() == 'отмена':
-        del user_states[message.chat.id]
-        bot.send_message(
-            message.chat.id,
-            "❌ Регистрация отменена",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.chat.id]['state'] = 'awaiting_city'
-    user_states[message.chat.id]['phone'] = message.text
-    bot.send_message(
-        message.chat.id,
-        "Введите ваш город:",
-        reply_markup=create_cancel_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'awaiting_city')
-def handle_city(message):
-    if message.text.lower() == 'отмена':
-        del user_states[message.chat.id]
-        bot.send_message(
-            message.chat.id,
-            "❌ Регистрация отменена",
-            reply_markup=create_keyboard()
+    def __init__(self, manager: ClientStorage, max_workers: Optional[int] = None):
+        self.manager = manager
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers or int(os.getenv('SHEETS_MAX_WORKERS', '8')),
+            thread_name_prefix='sheets'
         )
-        return
-    
-    user_states[message.chat.id]['state'] = 'awaiting_comments'
-    user_states[message.chat.id]['city'] = message.text
-    bot.send_message(
-        message.chat.id,
-        "Введите дополнительные комментарии (если есть):",
-        reply_markup=create_cancel_keyboard()
-    )
-
-@bot.message_handler(func=lambda message: user_states.get(message.chat.id, {}).get('state') == 'awaiting_comments')
-def handle_comments(message):
-    if message.text.lower() == 'отмена':
-        del user_states[message.chat.id]
-        bot.send_message(
-            message.chat.id,
-            "❌ Регистрация отменена",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.chat.id]['comments'] = message.text
-    
-    # Завершаем регистрацию
-    chat_id = message.chat.id
-    user_data = user_states[chat_id]
-    
-    success, response = sheets_manager.add_client(
-        first_name=user_data.get('first_name', ''),
-        last_name=user_data.get('last_name', ''),
-        phone=user_data.get('phone', ''),
-        city=user_data.get('city', ''),
-        comments=user_data.get('comments', ''),
-        telegram_id=str(message.from_user.id)
-    )
-    
-    if success:
-        bot.send_message(
-            chat_id,
-            "✅ Регистрация успешно завершена!\n\n"
-            f"Спасибо, {user_data['first_name']}! Теперь вы можете отслеживать статус вашего заказа.",
-            reply_markup=create_keyboard()
-        )
-    else:
-        bot.send_message(
-            chat_id,
-            f"❌ Произошла ошибка при регистрации: {response}",
-            reply_markup=create_keyboard()
+
+    @property
+    def service(self):
+        return self.manager.service
+
+    async def run(self, func, *args, **kwargs):
+        """Выполняет блокирующую функцию в пуле потоков Sheets."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
         )
-    
-    del user_states[chat_id]
-
-# Вебхук и запуск бота
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    if request.headers.get('content-type') == 'application/json':
-        json_data = request.get_json()
-        update = telebot.types.Update.de_json(json_data)
-        bot.process_new_updates([update])
-        return "OK", 200
-    return "Bad Request", 400
-
-def run_bot():
-    print("🟢 Бот запускается...")
-    try:
-        bot.remove_webhook()
-        print("🤖 Бот запущен в режиме polling!")
-        bot.polling(none_stop=True)
-    except Exception as e:
-        print(f"🔴 Ошибка запуска: {e}")
-
-if __name__ == '__main__':
-    keep_alive()
-    run_bot()
\ No newline at end of file
+
+    async def find_client(self, telegram_id: str,
+                          fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        return await self.run(self.manager.find_client, telegram_id, fields)
+
+    async def client_exists(self, telegram_id: str) -> bool:
+        return await self.run(self.manager.client_exists, telegram_id)
+
+    async def get_client_info(self, telegram_id: str) -> Optional[dict]:
+        return await self.run(self.manager.get_client_info, telegram_id)
+
+    async def get_client_status(self, telegram_id: str) -> Optional[dict]:
+        return await self.run(self.manager.get_client_status, telegram_id)
+
+    async def add_client(self, *args, **kwargs) -> Tuple[bool, str]:
+        return await self.run(self.manager.add_client, *args, **kwargs)
+
+    async def update_status(self, *args, **kwargs) -> Tuple[bool, str]:
+        return await self.run(self.manager.update_status, *args, **kwargs)
+
+    async def bulk_update_status(self, *args, **kwargs) -> Tuple[bool, str]:
+        return await self.run(self.manager.bulk_update_status, *args, **kwargs)
+
+    async def setup_headers(self) -> Tuple[bool, str]:
+        return await self.run(self.manager.setup_headers)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=True)
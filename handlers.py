@@ -0,0 +1,310 @@
+"""Обработчики сообщений бота — общие для всех режимов запуска.
+
+Обработчики написаны корутинами и обращаются к внешнему миру только через
+адаптер (SyncBotIO здесь, AsyncBotIO в async_bot.py): ответ пользователю,
+чтение и запись хранилища, скачивание файла. Режимы отличаются только
+адаптером и тем, как вызывается обработчик: AsyncTeleBot ждет корутину
+сам, а для TeleBot ее выполняет run_sync — синхронный адаптер ничего не
+ждет, поэтому корутина завершается за один шаг.
+"""
+from typing import Callable, Optional, Sequence, Tuple
+
+from bulk_status import decode_csv, parse_status_csv, parse_id_list
+from metrics import timed
+from router import ANY, Router
+from send_queue import client_ids
+from sheets_scheduler import SheetsBusy, background
+from storage import STATUS_FIELDS
+from replies import (
+    MAIN_KEYBOARD, CANCEL_KEYBOARD, format_status, format_profile,
+    format_registration_result, format_sheets_check, REGISTRATION_STEPS,
+    WELCOME_TEXT, CONTACTS_TEXT, HELP_TEXT, UNKNOWN_TEXT, NOT_REGISTERED_TEXT,
+    ALREADY_REGISTERED_TEXT, REGISTRATION_START_TEXT, REGISTRATION_CANCELLED_TEXT,
+    ADMIN_ONLY_TEXT, BULK_STATUS_USAGE, BROADCAST_USAGE, SHEETS_UNAVAILABLE_TEXT
+)
+
+
+def run_sync(coro):
+    """Выполняет корутину обработчика с синхронным адаптером и возвращает ее результат."""
+    try:
+        coro.send(None)
+    except StopIteration as e:
+        return e.value
+    coro.close()
+    raise RuntimeError("Обработчик ждал асинхронную операцию в синхронном режиме")
+
+
+def sync_handler(handler: Callable) -> Callable:
+    """Обработчик для TeleBot из корутины BotHandlers."""
+    def run(message):
+        return run_sync(handler(message))
+    run.__name__ = handler.__name__
+    return run
+
+
+def is_bulk_status_document(message) -> bool:
+    return (message.caption or '').startswith('/bulk_status')
+
+
+class SyncBotIO:
+    """Адаптер для TeleBot: все вызовы выполняются прямо в потоке обработчика."""
+
+    def __init__(self, bot, storage, registration_queue, send_queue):
+        self.bot = bot
+        self.storage = storage
+        self.registration_queue = registration_queue
+        self.send_queue = send_queue
+
+    async def reply(self, chat_id, text: str, **kwargs):
+        return self.send_queue.send(chat_id, text, **kwargs)
+
+    async def find_client(self, telegram_id: str,
+                          fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        return self.storage.find_client(telegram_id, fields=fields)
+
+    async def client_exists(self, telegram_id: str) -> bool:
+        return self.storage.client_exists(telegram_id)
+
+    async def sheets_connected(self) -> bool:
+        return bool(self.storage.service)
+
+    async def setup_headers(self) -> Tuple[bool, str]:
+        return self.storage.setup_headers()
+
+    async def bulk_update_status(self, mapping: dict) -> Tuple[bool, str]:
+        # Массовая запись уступает квоту Sheets запросам клиентов
+        with background():
+            return self.storage.bulk_update_status(mapping)
+
+    async def submit_registration(self, *args) -> Tuple[bool, str]:
+        return self.registration_queue.submit(*args)
+
+    async def start_broadcast(self, text: str, admin_chat_id) -> Tuple[bool, str]:
+        return self.send_queue.start_broadcast(
+            text, lambda: client_ids(self.storage), admin_chat_id
+        )
+
+    def broadcast_progress(self) -> str:
+        return self.send_queue.broadcast_progress()
+
+    async def download_file(self, file_id: str) -> bytes:
+        file_info = self.bot.get_file(file_id)
+        return self.bot.download_file(file_info.file_path)
+
+
+class BotHandlers:
+    """Обработчики сообщений: текстовые маршруты (Router) и CSV для /bulk_status.
+
+    io — адаптер режима запуска, user_states — хранилище шагов регистрации,
+    is_admin — проверка доступа к служебным командам.
+    """
+
+    def __init__(self, io, user_states, is_admin: Callable):
+        self.io = io
+        self.user_states = user_states
+        self.is_admin = is_admin
+        # Текстовые сообщения разбирает Router: обработчик ищется по состоянию
+        # регистрации и точному тексту кнопки или команде за одно обращение к
+        # словарю, а не перебором фильтров telebot
+        self.router = Router(self.registration_step)
+        self._add_routes()
+
+    def registration_step(self, message) -> Optional[str]:
+        state = self.user_states.get(message.from_user.id)
+        return state['step'] if state else None
+
+    def _add_routes(self) -> None:
+        add = self.router.add
+        add(self.send_welcome, '/start', '/help', state=ANY)
+        add(self.handle_status_check, "Проверить статус", state=ANY)
+        add(self.start_registration, "Регистрация клиента", state=ANY)
+        add(self.setup_sheets_headers, '/setup_sheets', state=ANY)
+        add(self.check_sheets_config, '/check_sheets', state=ANY)
+        add(self.bulk_status_command, '/bulk_status', state=ANY)
+        add(self.broadcast_command, '/broadcast', state=ANY)
+        # Шаги регистрации: любой текст, кроме кнопок выше, — ответ на текущий вопрос
+        for step in REGISTRATION_STEPS:
+            add(self.cancel_registration, "Отмена", state=step)
+            add(self.handle_registration_step, state=step)
+        # Обычные кнопки
+        add(self.handle_profile, "Мой профиль")
+        add(self.handle_contacts, "Связаться с нами")
+        add(self.handle_help, "Помощь")
+        add(self.handle_unknown, state=ANY)
+
+    def register(self, bot, wrap: Callable = lambda handler: handler) -> None:
+        """Подключает обработчики к боту; wrap — sync_handler для TeleBot."""
+        bot.message_handler(content_types=['text'])(wrap(self.handle_text))
+        bot.message_handler(
+            content_types=['document'], func=is_bulk_status_document
+        )(wrap(self.bulk_status_csv))
+
+    async def handle_text(self, message):
+        handler = self.router.resolve(message)
+        if handler is not None:
+            await handler(message)
+
+    @timed
+    async def send_welcome(self, message):
+        await self.io.reply(message.chat.id, WELCOME_TEXT, reply_markup=MAIN_KEYBOARD)
+
+    @timed
+    async def handle_status_check(self, message):
+        """Обработчик для проверки статуса заказа"""
+        # Один запрос: колонки статуса строки клиента или None, если он не зарегистрирован
+        try:
+            client = await self.io.find_client(str(message.from_user.id), fields=STATUS_FIELDS)
+        except SheetsBusy:
+            await self.io.reply(message.chat.id, SHEETS_UNAVAILABLE_TEXT, reply_markup=MAIN_KEYBOARD)
+            return
+        if not client:
+            await self.io.reply(message.chat.id, NOT_REGISTERED_TEXT, reply_markup=MAIN_KEYBOARD)
+            return
+
+        await self.io.reply(message.chat.id, format_status(client), reply_markup=MAIN_KEYBOARD)
+
+    @timed
+    async def start_registration(self, message):
+        """Начинает процесс регистрации с проверкой существующего пользователя"""
+        try:
+            registered = await self.io.client_exists(str(message.from_user.id))
+        except SheetsBusy:
+            await self.io.reply(message.chat.id, SHEETS_UNAVAILABLE_TEXT, reply_markup=MAIN_KEYBOARD)
+            return
+        if registered:
+            await self.io.reply(message.chat.id, ALREADY_REGISTERED_TEXT, reply_markup=MAIN_KEYBOARD)
+            return
+
+        self.user_states[message.from_user.id] = {'step': 'first_name'}
+        await self.io.reply(message.chat.id, REGISTRATION_START_TEXT, reply_markup=CANCEL_KEYBOARD)
+
+    @timed
+    async def setup_sheets_headers(self, message):
+        """Команда для настройки заголовков в Google Sheets"""
+        success, msg = await self.io.setup_headers()
+        await self.io.reply(message.chat.id, f"{'✅' if success else '❌'} {msg}")
+
+    @timed
+    async def check_sheets_config(self, message):
+        """Команда для проверки настроек Google Sheets"""
+        await self.io.reply(message.chat.id, format_sheets_check(await self.io.sheets_connected()))
+
+    @timed
+    async def bulk_status_command(self, message):
+        """Команда для массового обновления статусов по списку Telegram ID"""
+        if not self.is_admin(message):
+            await self.io.reply(message.chat.id, ADMIN_ONLY_TEXT)
+            return
+
+        # Первая строка после команды — статус, дальше — Telegram ID
+        lines = message.text.split('\n')
+        status = lines[0].partition(' ')[2].strip()
+        mapping = parse_id_list(lines[1:], status) if status else {}
+        if not mapping:
+            await self.io.reply(message.chat.id, BULK_STATUS_USAGE)
+            return
+
+        success, msg = await self.io.bulk_update_status(mapping)
+        await self.io.reply(message.chat.id, f"{'✅' if success else '❌'} {msg}")
+
+    @timed
+    async def bulk_status_csv(self, message):
+        """Массовое обновление статусов из присланного CSV-файла"""
+        if not self.is_admin(message):
+            await self.io.reply(message.chat.id, ADMIN_ONLY_TEXT)
+            return
+
+        status = message.caption.partition(' ')[2].strip() or None
+        text = decode_csv(await self.io.download_file(message.document.file_id))
+        mapping = parse_status_csv(text, status) if text is not None else {}
+        if not mapping:
+            await self.io.reply(message.chat.id, BULK_STATUS_USAGE)
+            return
+
+        success, msg = await self.io.bulk_update_status(mapping)
+        await self.io.reply(message.chat.id, f"{'✅' if success else '❌'} {msg}")
+
+    @timed
+    async def broadcast_command(self, message):
+        """Рассылка сообщения всем зарегистрированным клиентам"""
+        if not self.is_admin(message):
+            await self.io.reply(message.chat.id, ADMIN_ONLY_TEXT)
+            return
+
+        parts = message.text.split(maxsplit=1)
+        if len(parts) < 2:
+            await self.io.reply(
+                message.chat.id,
+                f"{BROADCAST_USAGE}\n\nСейчас: {self.io.broadcast_progress()}"
+            )
+            return
+
+        success, msg = await self.io.start_broadcast(parts[1], message.chat.id)
+        await self.io.reply(message.chat.id, f"{'✅' if success else '❌'} {msg}")
+
+    @timed
+    async def cancel_registration(self, message):
+        # Состояние могло истечь между выбором маршрута и обработкой
+        self.user_states.pop(message.from_user.id, None)
+        await self.io.reply(message.chat.id, REGISTRATION_CANCELLED_TEXT, reply_markup=MAIN_KEYBOARD)
+
+    @timed
+    async def handle_registration_step(self, message):
+        user_id = message.from_user.id
+        state = self.user_states.get(user_id)
+        if state is None:
+            # Состояние истекло между выбором маршрута и обработкой
+            return await self.handle_unknown(message)
+        step = state['step']
+        state[step] = message.text
+        next_step, prompt = REGISTRATION_STEPS[step]
+
+        if next_step:
+            state['step'] = next_step
+            # Сохраняем явно: хранилище может быть не в памяти
+            self.user_states[user_id] = state
+            await self.io.reply(message.chat.id, prompt, reply_markup=CANCEL_KEYBOARD)
+            return
+
+        # Состояние убираем до отправки заявки, чтобы повторное сообщение
+        # не отправило регистрацию второй раз
+        self.user_states.pop(user_id, None)
+        # Заявка уходит в очередь записи в Google Sheets
+        success, msg = await self.io.submit_registration(
+            state['first_name'],
+            state['last_name'],
+            state['phone'],
+            state['city'],
+            state['comments'],
+            str(user_id)
+        )
+        await self.io.reply(
+            message.chat.id,
+            format_registration_result(state, success, msg),
+            reply_markup=MAIN_KEYBOARD
+        )
+
+    @timed
+    async def handle_profile(self, message):
+        try:
+            client_info = await self.io.find_client(str(message.from_user.id), fields=('status',))
+            unavailable = False
+        except SheetsBusy:
+            client_info, unavailable = None, True
+        await self.io.reply(
+            message.chat.id,
+            format_profile(message.from_user, client_info, unavailable),
+            reply_markup=MAIN_KEYBOARD
+        )
+
+    @timed
+    async def handle_contacts(self, message):
+        await self.io.reply(message.chat.id, CONTACTS_TEXT, reply_markup=MAIN_KEYBOARD)
+
+    @timed
+    async def handle_help(self, message):
+        await self.io.reply(message.chat.id, HELP_TEXT, reply_markup=MAIN_KEYBOARD)
+
+    @timed
+    async def handle_unknown(self, message):
+        await self.io.reply(message.chat.id, UNKNOWN_TEXT, reply_markup=MAIN_KEYBOARD)
@@ -1,6 +1,7 @@
 
-from flask import Flask
+from flask import Flask, Response
 from threading import Thread
+import metrics
 
 app = Flask('')
 
@@ -8,6 +9,10 @@ app = Flask('')
 def home():
     return "🤖 Telegram Bot is alive!"
 
+@app.route('/metrics')
+def prometheus_metrics():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 def run():
     app.run(host='0.0.0.0', port=5000)
 
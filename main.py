@@ -1,324 +1,300 @@
 import os
+import sys
+import hmac
+import time
+import atexit
+import signal
+import asyncio
 import threading
-from flask import Flask, request
+from flask import Flask, request, jsonify
 import telebot
-from telebot.types import ReplyKeyboardMarkup, ReplyKeyboardRemove, KeyboardButton
-from keepalive import keep_alive
+from keepalive import keep_alive, app as keepalive_app
 from google_sheets import GoogleSheetsManager
-from datetime import datetime
-
-app = Flask(__name__)
+from storage import ClientStorage, SQLiteClientStorage, SheetsMirror
+from write_queue import ClientWriteQueue
+from sheets_scheduler import get_scheduler
+from send_queue import SendQueue, client_ids
+from status_watcher import StatusWatcher
+from archive_job import ArchiveJob
+from update_queue import UpdateQueue, update_chat_id
+from update_tracker import UpdateTracker
+from state_store import create_state_store
+from handlers import BotHandlers, SyncBotIO, sync_handler
+import metrics
+from typing import Optional, Tuple
 
 # Токен должен браться из переменных окружения
 TOKEN = os.getenv('TELEGRAM_TOKEN') or os.getenv('BOT_TOKEN') or '8102280931:AAFNx7zZOAV4QjRjNnNzB6edsgeXsLBFQss'
-bot = telebot.TeleBot(TOKEN)
 
-# Инициализируем Google Sheets Manager
-sheets_manager = GoogleSheetsManager()
+def create_components(token: str) -> Tuple[telebot.TeleBot, ClientStorage, Optional[SheetsMirror]]:
+    """Создает клиент Bot API и хранилище клиентов.
+
+    Единственное место, где они создаются: остальные модули (google_sheets,
+    storage, ...) при импорте ничего не запускают и не подключаются.
+    Обработчики сообщений к боту подключает режим запуска (setup_sync_bot).
+    Хранилище — Google Sheets (по умолчанию) или локальная SQLite
+    с фоновой синхронизацией в таблицу (STORAGE=sqlite).
+    """
+    bot = telebot.TeleBot(token)
+    if os.getenv('STORAGE') == 'sqlite':
+        storage = SQLiteClientStorage()
+        mirror = SheetsMirror(storage, GoogleSheetsManager())
+    else:
+        storage = GoogleSheetsManager()
+        mirror = None
+    return bot, storage, mirror
+
+bot, sheets_manager, sheets_mirror = create_components(TOKEN)
+
+# Регистрации пишутся в таблицу пачками в фоне, пользователь не ждет
+registration_queue = ClientWriteQueue(sheets_manager)
+sheets_manager.write_queue = registration_queue
+
+# Исходящие сообщения: лимиты Telegram (общий и на чат) и рассылки
+send_queue = SendQueue(bot)
+
+# Уведомления клиентам о смене статуса (STATUS_WATCH=0 — отключить)
+if os.getenv('STATUS_WATCH', '1') != '0':
+    status_watcher = StatusWatcher(sheets_manager, send_queue)
+else:
+    status_watcher = None
+
+# Перенос давно выданных заказов в лист архива (ARCHIVE_JOB=1 — включить).
+# Выключен по умолчанию: перенос удаляет строки листа «Клиенты» целиком,
+# вместе с колонками правее I, которые могут вести сотрудники
+archive_sheets = sheets_mirror.sheets if sheets_mirror else sheets_manager
+if os.getenv('ARCHIVE_JOB', '0') == '1' and getattr(archive_sheets, 'archive_sheet', None):
+    archive_job = ArchiveJob(archive_sheets)
+else:
+    archive_job = None
 
 # Хранение состояний пользователей для регистрации
-user_states = {}
-
-# Клавиатура
-def create_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False, row_width=2)
-    buttons = [
-        KeyboardButton("Регистрация клиента"),
-        KeyboardButton("Мой профиль"),
-        KeyboardButton("Проверить статус"),
-        KeyboardButton("Связаться с нами"),
-        KeyboardButton("Помощь")
-    ]
-    markup.add(*buttons)
-    return markup
-
-def create_cancel_keyboard():
-    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
-    markup.add("Отмена")
-    return markup
-
-# Обработчики
-@bot.message_handler(commands=['start', 'help'])
-def send_welcome(message):
-    bot.send_message(
-        chat_id=message.chat.id,
-        text="🚛 Добро пожаловать в NBM Japan!\n"
-             "🌏 Ваша надежная карго компания для доставки из Японии\n\n"
-             "📦 Мы доставляем товары быстро и безопасно\n"
-             "🎌 Прямые поставки из Японии\n\n"
-             "Выберите действие:",
-        reply_markup=create_keyboard()
-    )
+# (ограниченный LRU с TTL в памяти или SQLite — см. STATE_STORE)
+user_states = create_state_store()
 
-@bot.message_handler(func=lambda message: message.text == "Проверить статус")
-def handle_status_check(message):
-    """Обработчик для проверки статуса заказа"""
-    # Проверяем, зарегистрирован ли пользователь
-    if not sheets_manager.client_exists(str(message.from_user.id)):
-        bot.send_message(message.chat.id, "❌ Вы еще не зарегистрированы.", reply_markup=create_keyboard())
-        return
-    
-    status_info = sheets_manager.get_client_status(str(message.from_user.id))
-    
-    if not status_info:
-        bot.send_message(message.chat.id, "❌ Информация о статусе недоступна.")
-        return
-    
-    status = status_info.get('status', 'неизвестен')
-    last_updated = status_info.get('last_updated', 'не указана')
-    comment = status_info.get('comment', 'нет комментариев')
-    
-    # Формируем понятное описание статуса
-    status_descriptions = {
-        "В обработке": "🔄 Ваш заказ находится в обработке",
-        "Отправлен": "🚢 Ваш заказ отправлен из Японии",
-        "В пути": "✈️ Ваш заказ в пути",
-        "Прибыл": "✅ Ваш заказ прибыл в пункт выдачи",
-        "Готов к выдаче": "📦 Заказ готов к выдаче",
-        "Выдан": "🎉 Заказ получен"
-    }
-    
-    description = status_descriptions.get(status, f"Статус: {status}")
-    
-    # Формируем сообщение
-    response = (
-        f"📦 Статус вашего заказа:\n\n"
-        f"{description}\n\n"
-        #f"📅 Последнее обновление: {last_updated}\n"
-        #f"📝 Комментарий: {comment}\n\n"
-        f"Для уточнения деталей нажмите «Связаться с нами»"
-    )
-    
-    bot.send_message(message.chat.id, response, reply_markup=create_keyboard())
-
-@bot.message_handler(func=lambda message: message.text == "Регистрация клиента")
-def start_registration(message):
-    """Начинает процесс регистрации с проверкой существующего пользователя"""
-    user_id = str(message.from_user.id)
-    
-    # Проверяем, не зарегистрирован ли пользователь уже
-    if sheets_manager.client_exists(user_id):
-        bot.send_message(
-            message.chat.id,
-            "ℹ️ Вы уже зарегистрированы в нашей системе. "
-            "Если вам нужно обновить информацию, пожалуйста, свяжитесь с нами.",
-            reply_markup=create_keyboard()
-        )
-        return
-    
-    user_states[message.from_user.id] = {'step': 'first_name'}
-    bot.send_message(
-        message.chat.id, 
-        "📝 Начинаем регистрацию!\n\nВведите ваше имя:", 
-        reply_markup=create_cancel_keyboard()
+# Telegram ID сотрудников, которым доступны служебные команды
+ADMIN_IDS = {
+    admin_id.strip()
+    for admin_id in os.getenv('ADMIN_IDS', '').split(',')
+    if admin_id.strip()
+}
+
+def is_admin(message):
+    return str(message.from_user.id) in ADMIN_IDS
+
+def setup_sync_bot() -> BotHandlers:
+    """Подключает обработчики (handlers.py) к bot — для режимов polling и webhook.
+
+    Обработчики обращаются к хранилищу и Telegram прямо из потока
+    UpdateQueue. В режиме asyncio их получает только AsyncTeleBot, а bot
+    остается клиентом Bot API для SendQueue (рассылки, уведомления).
+    """
+    handlers = BotHandlers(
+        SyncBotIO(bot, sheets_manager, registration_queue, send_queue), user_states, is_admin
     )
+    handlers.register(bot, sync_handler)
+    return handlers
 
-@bot.message_handler(commands=['setup_sheets'])
-def setup_sheets_headers(message):
-    """Команда для настройки заголовков в Google Sheets"""
-    success, msg = sheets_manager.setup_headers()
-    if success:
-        bot.send_message(message.chat.id, f"✅ {msg}")
-    else:
-        bot.send_message(message.chat.id, f"❌ {msg}")
-
-@bot.message_handler(commands=['check_sheets'])
-def check_sheets_config(message):
-    """Команда для проверки настроек Google Sheets"""
-    config_status = []
-    
-    # Проверяем переменные окружения
-    if os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON'):
-        config_status.append("✅ GOOGLE_SERVICE_ACCOUNT_JSON настроен")
-    else:
-        config_status.append("❌ GOOGLE_SERVICE_ACCOUNT_JSON не найден")
-    
-    if os.getenv('GOOGLE_SPREADSHEET_ID'):
-        config_status.append(f"✅ GOOGLE_SPREADSHEET_ID: {os.getenv('GOOGLE_SPREADSHEET_ID')}")
-    else:
-        config_status.append("❌ GOOGLE_SPREADSHEET_ID не найден")
-    
-    # Проверяем подключение
-    if sheets_manager.service:
-        config_status.append("✅ Google Sheets API подключен")
-    else:
-        config_status.append("❌ Google Sheets API не подключен")
-    
-    response = "🔍 Проверка настроек Google Sheets:\n\n" + "\n".join(config_status)
-    bot.send_message(message.chat.id, response)
-
-@bot.message_handler(func=lambda message: True)
-def handle_all_messages(message):
-    user_id = message.from_user.id
-    text = message.text
-    
-    # Проверяем, находится ли пользователь в процессе регистрации
-    if user_id in user_states:
-        if text == "Отмена":
-            del user_states[user_id]
-            bot.send_message(message.chat.id, "❌ Регистрация отменена", reply_markup=create_keyboard())
-            return
-        
-        state = user_states[user_id]
-        
-        if state['step'] == 'first_name':
-            state['first_name'] = text
-            state['step'] = 'last_name'
-            bot.send_message(message.chat.id, "Введите вашу фамилию:", reply_markup=create_cancel_keyboard())
-            
-        elif state['step'] == 'last_name':
-            state['last_name'] = text
-            state['step'] = 'phone'
-            bot.send_message(
-                message.chat.id, 
-                "Введите ваш номер телефона (например: +996 000 000 000):", 
-                reply_markup=create_cancel_keyboard()
-            )
-            
-        elif state['step'] == 'phone':
-            state['phone'] = text
-            state['step'] = 'city'
-            bot.send_message(message.chat.id, "Введите ваш город:", reply_markup=create_cancel_keyboard())
-            
-        elif state['step'] == 'city':
-            state['city'] = text
-            state['step'] = 'comments'
-            bot.send_message(
-                message.chat.id, 
-                "Введите комментарии (пожелания, особые требования к доставке):", 
-                reply_markup=create_cancel_keyboard()
-            )
-            
-        elif state['step'] == 'comments':
-            state['comments'] = text
-            
-            # Завершаем регистрацию и добавляем в Google Sheets
-            success, msg = sheets_manager.add_client(
-                state['first_name'],
-                state['last_name'], 
-                state['phone'],
-                state['city'],
-                state['comments'],
-                str(user_id)
-            )
-            
-            if success:
-                bot.send_message(
-                    message.chat.id, 
-                    f"✅ Регистрация в NBM Japan завершена!\n\n"
-                    f"📋 Ваши данные:\n"
-                    f"Имя: {state['first_name']}\n"
-                    f"Фамилия: {state['last_name']}\n"
-                    f"Телефон: {state['phone']}\n"
-                    f"Город: {state['city']}\n"
-                    f"Комментарии: {state['comments']}\n\n"
-                    f"🗃️ {msg}\n\n"
-                    f"📞 Для оформления заказа свяжитесь с нами через кнопку 'Связаться с нами'",
-                    reply_markup=create_keyboard())
-            else:
-                bot.send_message(
-                    message.chat.id, 
-                    f"✅ Регистрация завершена!\n\n"
-                    f"📋 Ваши данные:\n"
-                    f"Имя: {state['first_name']}\n"
-                    f"Фамилия: {state['last_name']}\n"
-                    f"Телефон: {state['phone']}\n"
-                    f"Город: {state['city']}\n"
-                    f"Комментарии: {state['comments']}\n\n"
-                    f"⚠️ Ошибка записи в таблицу: {msg}\n\n"
-                    f"📞 Для оформления заказа свяжитесь с нами через кнопку 'Связаться с нами'",
-                    reply_markup=create_keyboard())
-            
-            # Удаляем состояние пользователя
-            del user_states[user_id]
-        return
-    
-    # Обычные команды
-    if text == "Мой профиль":
-        user = message.from_user
-        response = (
-            f"👤 Ваш профиль в NBM Japan:\n"
-            f"ID: {user.id}\n"
-            f"Имя: {user.first_name}\n"
-            f"Фамилия: {user.last_name or 'не указана'}\n"
-            f"Юзернейм: @{user.username or 'не указан'}\n\n"
-        )
-        
-        # Добавляем информацию из Google Sheets, если пользователь зарегистрирован
-        if sheets_manager.client_exists(str(user.id)):
-            client_info = sheets_manager.get_client_status(str(user.id))
-            response += (
-                f"📋 Статус вашего заказа:\n"
-                #f"Телефон: {client_info.get('phone', 'не указан')}\n"
-                #f"Город: {client_info.get('city', 'не указан')}\n"
-                f"📦: {client_info.get('status', 'неизвестен')}"
-            )
-        else:
-            response += "ℹ️ Вы еще не зарегистрированы в системе."
-            
-        bot.send_message(message.chat.id, response, reply_markup=create_keyboard())
-        
-    elif text == "Связаться с нами":
-        bot.send_message(
-            message.chat.id, 
-            "📞 Контакты NBM Japan:\n\n"
-            "📱 WhatsApp: +81 90-9542-7552\n"
-            "📱 WhatsApp: +996 778 56 27 36\n"
-            "📱 Telegram: @aitakma\n"
-            "📧 Email: info@nbmjapan.com\n\n"
-            "🕐 Время работы: 9:00 - 18:00 (ПН-ПТ)\n\n"
-            "💬 Напишите нам для:\n"
-            "• Оформления заказа\n"
-            "• Отслеживания посылки\n"
-            "• Консультации по товарам",
-            reply_markup=create_keyboard()
-        )
-        
-    elif text == "Помощь":
-        bot.send_message(
-            message.chat.id, 
-            "ℹ️ NBM Japan - карго доставка из Японии\n\n"
-            "🔹 Регистрация клиента - зарегистрироваться в системе\n"
-            "🔹 Мой профиль - информация о вашем аккаунте\n"
-            "🔹 Проверить статус - узнать статус вашего заказа\n"
-            "🔹 Связаться с нами - контакты для заказов\n\n"
-            "📦 Услуги:\n"
-            "• Покупка товаров в японских интернет-магазинах\n"
-            "• Консолидация посылок\n"
-            "• Быстрая доставка в Кыргызстан\n"
-            "• Страхование грузов",
-            reply_markup=create_keyboard()
-        )
-    else:
-        bot.send_message(
-            message.chat.id, 
-            "🤖 Используйте кнопки меню для навигации", 
-            reply_markup=create_keyboard()
-        )
-
-# Вебхук
-@app.route('/webhook', methods=['POST'])
-def webhook():
-    if request.headers.get('content-type') == 'application/json':
-        json_data = request.get_json()
-        update = telebot.types.Update.de_json(json_data)
+# Входящие обновления (вебхук и polling) обрабатываются пулом потоков.
+# Полоса выбирается по ID чата: разные пользователи идут параллельно,
+# а шаги регистрации одного пользователя — строго по порядку.
+# Повторно доставленные обновления отсеиваются до очереди, а обработанные
+# update_id сохраняются на диск, чтобы перезапуск продолжил с того же места.
+update_tracker = UpdateTracker()
+
+def process_update(update):
+    if isinstance(update, dict):
+        update = telebot.types.Update.de_json(update)
+    try:
         bot.process_new_updates([update])
-        return "OK", 200
-    return "Bad Request", 400
+        metrics.UPDATES.inc()
+    finally:
+        update_tracker.done(update.update_id)
+
+update_queue = UpdateQueue(process_update, key=update_chat_id)
+
+# Показатели, которые вычисляются при опросе /metrics
+metrics.instrument_telegram()
+metrics.gauge('bot_user_states', 'Пользователи в процессе регистрации', lambda: len(user_states))
+metrics.gauge('bot_update_queue_depth', 'Обновления в очереди на обработку', update_queue.depth)
+metrics.gauge('bot_registrations_pending', 'Регистрации, еще не записанные в таблицу',
+              registration_queue.pending_count)
+metrics.gauge('sheets_breaker_open', 'Предохранитель Google Sheets открыт (1) или закрыт (0)',
+              lambda: int(get_scheduler().breaker.is_open))
+
+# Секрет, который Telegram присылает в заголовке каждого запроса вебхука
+# (передается в set_webhook): без него любой, кто знает URL, мог бы прислать
+# поддельное обновление, например от имени администратора
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+
+def create_webhook_app() -> Flask:
+    """Создает Flask-приложение вебхука.
+
+    Обновление сразу уходит в очередь, Telegram получает ответ без ожидания.
+    """
+    app = Flask(__name__)
+
+    @app.route('/webhook', methods=['POST'])
+    def webhook():
+        secret = request.headers.get('X-Telegram-Bot-Api-Secret-Token', '')
+        if not WEBHOOK_SECRET or not hmac.compare_digest(secret.encode(), WEBHOOK_SECRET.encode()):
+            return "Forbidden", 403
+        if request.headers.get('content-type') == 'application/json':
+            update = request.get_json()
+            update_id = update.get('update_id')
+            if not update_tracker.accept(update_id):
+                # Telegram повторил доставку, не дождавшись ответа
+                return "OK", 200
+            if update_queue.put(update):
+                return "OK", 200
+            # Очередь переполнена — Telegram повторит доставку позже
+            update_tracker.forget(update_id)
+            return "Busy", 503
+        return "Bad Request", 400
+
+    return app
+
+# Показатели очереди — на служебном сервере рядом с /metrics, а не на вебхуке
+@keepalive_app.route('/webhook/stats')
+def webhook_stats():
+    return jsonify(update_queue.stats())
+
+def shutdown():
+    """Корректное завершение: дорабатываем очередь и дописываем регистрации."""
+    update_queue.stop(timeout=float(os.getenv('SHUTDOWN_TIMEOUT', '30')))
+    update_tracker.save()
+    if status_watcher:
+        status_watcher.stop()
+    if archive_job:
+        archive_job.stop()
+    send_queue.stop(timeout=5)
+    registration_queue.stop()
+    if sheets_mirror:
+        sheets_mirror.stop()
+
+def start_workers():
+    # Обработчики выполняются в потоках UpdateQueue, а не в пуле telebot
+    bot.threaded = False
+    update_queue.start()
+    atexit.register(shutdown)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+def enqueue_updates(updates) -> int:
+    """Раскладывает полученные обновления по полосам; возвращает число новых."""
+    accepted = 0
+    for update in updates:
+        if not update_tracker.accept(update.update_id):
+            continue
+        # Ждем места в полосе, чтобы не потерять обновление
+        if update_queue.put(update, block=True):
+            accepted += 1
+        else:
+            update_tracker.forget(update.update_id)
+    return accepted
+
+def catch_up() -> None:
+    """Выбирает накопившиеся за простой обновления пачками по 100.
+
+    offset подтверждает Telegram все обновления до него, поэтому следующая
+    пачка запрашивается, когда предыдущая обработана. long polling — не
+    дольше секунды: 0 telebot заменил бы значением по умолчанию (20 с).
+    """
+    started = time.monotonic()
+    total = 0
+    while True:
+        try:
+            updates = bot.get_updates(
+                offset=update_tracker.offset, limit=100, timeout=10, long_polling_timeout=1
+            )
+        except Exception as e:
+            print(f"⚠️ Ошибка получения обновлений: {e}")
+            break
+        total += enqueue_updates(updates)
+        if len(updates) < 100:
+            break
+        update_tracker.wait_for(updates[-1].update_id, timeout=5)
+    if total:
+        print(f"⏩ Получено накопившихся обновлений: {total} за {time.monotonic() - started:.1f} с")
+
+def poll_updates():
+    """Получает обновления long polling'ом и раскладывает их по полосам.
+
+    offset — первое необработанное обновление (update_tracker.offset), а не
+    следующее за полученным: принятые, но не обработанные обновления
+    Telegram пришлет снова после падения, а пока бот работает, их отсеет
+    фильтр повторов.
+    """
+    catch_up()
+    error_interval = 0.25
+    while True:
+        offset = update_tracker.offset
+        try:
+            updates = bot.get_updates(offset=offset, timeout=20, long_polling_timeout=20)
+        except Exception as e:
+            print(f"⚠️ Ошибка получения обновлений: {e}")
+            time.sleep(error_interval)
+            error_interval = min(error_interval * 2, 60)
+            continue
+
+        error_interval = 0.25
+        if updates and not enqueue_updates(updates):
+            # Вернулись только обновления, которые еще обрабатываются, — не
+            # опрашиваем Telegram вхолостую, пока водораздел не сдвинется
+            update_tracker.wait_for(max(offset, 1), timeout=1)
 
 # Запуск бота
 def run_bot():
     print("🟢 Бот запускается...")
+    setup_sync_bot()
+    start_workers()
     try:
         bot.remove_webhook()
         # Для разработки используем polling вместо webhook
         print("🤖 Бот запущен в режиме polling!")
-        bot.polling(none_stop=True)
+        poll_updates()
+    except Exception as e:
+        print(f"🔴 Ошибка запуска: {e}")
+
+def run_webhook():
+    print("🟢 Бот запускается...")
+    if not WEBHOOK_SECRET:
+        print("🔴 Не задан WEBHOOK_SECRET: вебхук без секрета принимал бы чужие обновления")
+        return
+    setup_sync_bot()
+    app = create_webhook_app()
+    start_workers()
+    try:
+        bot.remove_webhook()
+        bot.set_webhook(url=os.getenv('WEBHOOK_URL'), secret_token=WEBHOOK_SECRET)
+        print("🤖 Бот запущен в режиме webhook!")
+        app.run(host='0.0.0.0', port=int(os.getenv('PORT', '8080')))
     except Exception as e:
         print(f"🔴 Ошибка запуска: {e}")
 
 if __name__ == '__main__':
     # Запускаем keep-alive сервер в отдельном потоке
     keep_alive()
+    # Клиент Google Sheets создается в фоне: бот отвечает на /start сразу
+    (sheets_mirror.sheets if sheets_mirror else sheets_manager).connect_in_background()
+    # Дописываем регистрации, оставшиеся в журнале после прошлого запуска
+    registration_queue.start()
+    if sheets_mirror:
+        sheets_mirror.start()
+    # Продолжаем рассылку, прерванную перезапуском
+    send_queue.resume(lambda: client_ids(sheets_manager))
+    if status_watcher:
+        status_watcher.start()
+    if archive_job:
+        archive_job.start()
+    else:
+        print("ℹ️ Перенос выданных заказов в архив выключен (ARCHIVE_JOB=1 — включить)")
     # Запускаем бота
-    run_bot()
\ No newline at end of file
+    if os.getenv('BOT_MODE') == 'async':
+        from async_bot import run_async_bot
+        asyncio.run(run_async_bot(
+            TOKEN, sheets_manager, registration_queue, is_admin, send_queue, user_states
+        ))
+    elif os.getenv('BOT_MODE') == 'webhook':
+        run_webhook()
+    else:
+        run_bot()
\ No newline at end of file
@@ -0,0 +1,271 @@
+"""Метрики бота в текстовом формате Prometheus (GET /metrics на keepalive).
+
+Без внешних зависимостей: счетчик, гистограмма и «снимок» (gauge),
+который вычисляется только в момент опроса. Запись метрики — это один
+захват блокировки и bisect по границам корзин, поэтому сбор можно
+держать включенным в продакшене.
+"""
+import asyncio
+import bisect
+import functools
+import sys
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Границы корзин гистограмм задержек, секунды
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry: List = []
+_registry_lock = threading.Lock()
+
+
+def _register(metric):
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence, extra: str = '') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Монотонно растущий счетчик с метками."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def inc(self, *labelvalues, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def value(self, *labelvalues) -> float:
+        return self._values.get(labelvalues, 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        for labelvalues, value in items:
+            lines.append(
+                f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}'
+            )
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и метками."""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счетчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[Tuple, list] = {}
+        self._lock = threading.Lock()
+        _register(self)
+
+    def observe(self, value: float, *labelvalues) -> None:
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labelvalues)
+            if entry is None:
+                entry = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][position] += 1
+            entry[1] += value
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, (list(counts), total))
+                           for labels, (counts, total) in self._values.items())
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        for labelvalues, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(
+                    f'{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}'
+                )
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+            lines.append(f'{self.name}_count{labels} {cumulative}')
+        return lines
+
+
+class Gauge:
+    """Значение, которое вычисляется функцией в момент опроса /metrics."""
+
+    def __init__(self, name: str, documentation: str, func: Callable[[], float]):
+        self.name = name
+        self.documentation = documentation
+        self.func = func
+        _register(self)
+
+    def collect(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        try:
+            lines.append(f'{self.name} {_format_value(self.func())}')
+        except Exception as e:
+            print(f"⚠️ Метрика {self.name} недоступна: {e}")
+        return lines
+
+
+def gauge(name: str, documentation: str, func: Callable[[], float]) -> Gauge:
+    """Регистрирует gauge, заменяя прежний с тем же именем."""
+    with _registry_lock:
+        _registry[:] = [m for m in _registry if m.name != name]
+    return Gauge(name, documentation, func)
+
+
+def render() -> str:
+    """Все метрики в текстовом формате Prometheus 0.0.4."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+HANDLER_LATENCY = Histogram(
+    'bot_handler_duration_seconds', 'Время работы обработчика сообщений', ['handler']
+)
+HANDLER_ERRORS = Counter(
+    'bot_handler_errors_total', 'Исключения в обработчиках сообщений', ['handler']
+)
+UPDATES = Counter('bot_updates_total', 'Обработанные обновления Telegram')
+SHEETS_CALLS = Counter('sheets_api_calls_total', 'Вызовы Google Sheets API', ['method'])
+SHEETS_ERRORS = Counter('sheets_api_errors_total', 'Ошибки вызовов Google Sheets API', ['method'])
+SHEETS_LATENCY = Histogram(
+    'sheets_api_duration_seconds', 'Задержка вызовов Google Sheets API', ['method']
+)
+TELEGRAM_LATENCY = Histogram(
+    'telegram_api_duration_seconds', 'Задержка вызовов Telegram Bot API', ['method']
+)
+TELEGRAM_ERRORS = Counter(
+    'telegram_api_errors_total', 'Ошибки вызовов Telegram Bot API', ['method', 'code']
+)
+
+
+def timed(func: Optional[Callable] = None, *, name: Optional[str] = None):
+    """Декоратор обработчика: гистограмма задержек и счетчик ошибок.
+
+    Работает и с обычными функциями, и с корутинами (async_bot.py).
+    Ставится под @bot.message_handler, чтобы telebot зарегистрировал обертку.
+    """
+    if func is None:
+        return functools.partial(timed, name=name)
+    handler = name or func.__name__
+
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            except Exception:
+                HANDLER_ERRORS.inc(handler)
+                raise
+            finally:
+                HANDLER_LATENCY.observe(time.perf_counter() - start, handler)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            HANDLER_ERRORS.inc(handler)
+            raise
+        finally:
+            HANDLER_LATENCY.observe(time.perf_counter() - start, handler)
+    return wrapper
+
+
+def sheets_execute(method: str, request):
+    """Выполняет запрос googleapiclient, учитывая вызов, задержку и ошибку."""
+    SHEETS_CALLS.inc(method)
+    start = time.perf_counter()
+    try:
+        return request.execute()
+    except Exception:
+        SHEETS_ERRORS.inc(method)
+        raise
+    finally:
+        SHEETS_LATENCY.observe(time.perf_counter() - start, method)
+
+
+def _telegram_error_code(e: Exception) -> str:
+    return str(getattr(e, 'error_code', None) or 'network')
+
+
+def instrument_telegram() -> None:
+    """Оборачивает запросы telebot к Bot API для учета задержек и ошибок.
+
+    Покрываются синхронный apihelper и, если он уже импортирован,
+    asyncio_helper (BOT_MODE=async): сам по себе он тянет aiohttp и
+    замедлил бы запуск, поэтому async_bot вызывает эту функцию повторно.
+    getUpdates в гистограмму не попадает: long polling висит десятки
+    секунд и исказил бы картину; его ошибки все равно считаются.
+    """
+    from telebot import apihelper
+
+    make_request = apihelper._make_request
+    if not getattr(make_request, '_instrumented', False):
+        @functools.wraps(make_request)
+        def instrumented(token, method_name, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return make_request(token, method_name, *args, **kwargs)
+            except Exception as e:
+                TELEGRAM_ERRORS.inc(method_name, _telegram_error_code(e))
+                raise
+            finally:
+                if method_name != 'getUpdates':
+                    TELEGRAM_LATENCY.observe(time.perf_counter() - start, method_name)
+
+        instrumented._instrumented = True
+        apihelper._make_request = instrumented
+
+    asyncio_helper = sys.modules.get('telebot.asyncio_helper')
+    if asyncio_helper is None:
+        return
+    process_request = asyncio_helper._process_request
+    if not getattr(process_request, '_instrumented', False):
+        @functools.wraps(process_request)
+        async def async_instrumented(token, method_name, *args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await process_request(token, method_name, *args, **kwargs)
+            except Exception as e:
+                TELEGRAM_ERRORS.inc(method_name, _telegram_error_code(e))
+                raise
+            finally:
+                if method_name != 'getUpdates':
+                    TELEGRAM_LATENCY.observe(time.perf_counter() - start, method_name)
+
+        async_instrumented._instrumented = True
+        asyncio_helper._process_request = async_instrumented
@@ -0,0 +1,211 @@
+import os
+from telebot.types import ReplyKeyboardMarkup, KeyboardButton
+
+# Тексты и клавиатуры бота. Используются и синхронным (main.py),
+# и асинхронным (async_bot.py) режимом, чтобы ответы не расходились.
+
+# Клавиатура
+def create_keyboard():
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=False, row_width=2)
+    buttons = [
+        KeyboardButton("Регистрация клиента"),
+        KeyboardButton("Мой профиль"),
+        KeyboardButton("Проверить статус"),
+        KeyboardButton("Связаться с нами"),
+        KeyboardButton("Помощь")
+    ]
+    markup.add(*buttons)
+    return markup
+
+def create_cancel_keyboard():
+    markup = ReplyKeyboardMarkup(resize_keyboard=True, one_time_keyboard=True)
+    markup.add("Отмена")
+    return markup
+
+# Клавиатуры статичны: собираем и сериализуем их в JSON один раз при запуске.
+# telebot передает готовую строку в API как есть, без to_json() на каждый ответ.
+MAIN_KEYBOARD = create_keyboard().to_json()
+CANCEL_KEYBOARD = create_cancel_keyboard().to_json()
+
+WELCOME_TEXT = (
+    "🚛 Добро пожаловать в NBM Japan!\n"
+    "🌏 Ваша надежная карго компания для доставки из Японии\n\n"
+    "📦 Мы доставляем товары быстро и безопасно\n"
+    "🎌 Прямые поставки из Японии\n\n"
+    "Выберите действие:"
+)
+
+CONTACTS_TEXT = (
+    "📞 Контакты NBM Japan:\n\n"
+    "📱 WhatsApp: +81 90-9542-7552\n"
+    "📱 WhatsApp: +996 778 56 27 36\n"
+    "📱 Telegram: @aitakma\n"
+    "📧 Email: info@nbmjapan.com\n\n"
+    "🕐 Время работы: 9:00 - 18:00 (ПН-ПТ)\n\n"
+    "💬 Напишите нам для:\n"
+    "• Оформления заказа\n"
+    "• Отслеживания посылки\n"
+    "• Консультации по товарам"
+)
+
+HELP_TEXT = (
+    "ℹ️ NBM Japan - карго доставка из Японии\n\n"
+    "🔹 Регистрация клиента - зарегистрироваться в системе\n"
+    "🔹 Мой профиль - информация о вашем аккаунте\n"
+    "🔹 Проверить статус - узнать статус вашего заказа\n"
+    "🔹 Связаться с нами - контакты для заказов\n\n"
+    "📦 Услуги:\n"
+    "• Покупка товаров в японских интернет-магазинах\n"
+    "• Консолидация посылок\n"
+    "• Быстрая доставка в Кыргызстан\n"
+    "• Страхование грузов"
+)
+
+UNKNOWN_TEXT = "🤖 Используйте кнопки меню для навигации"
+NOT_REGISTERED_TEXT = "❌ Вы еще не зарегистрированы."
+ALREADY_REGISTERED_TEXT = (
+    "ℹ️ Вы уже зарегистрированы в нашей системе. "
+    "Если вам нужно обновить информацию, пожалуйста, свяжитесь с нами."
+)
+REGISTRATION_START_TEXT = "📝 Начинаем регистрацию!\n\nВведите ваше имя:"
+REGISTRATION_CANCELLED_TEXT = "❌ Регистрация отменена"
+ADMIN_ONLY_TEXT = "⛔ Команда доступна только сотрудникам."
+SHEETS_UNAVAILABLE_TEXT = (
+    "⏳ База клиентов временно недоступна. Пожалуйста, попробуйте через несколько минут."
+)
+# Приписка к данным, взятым из кэша, пока таблица недоступна
+STALE_NOTE = "\n\n⚠️ Таблица сейчас недоступна — данные могут быть устаревшими."
+
+BULK_STATUS_USAGE = (
+    "Использование:\n"
+    "/bulk_status Статус\n"
+    "123456789 987654321 ...\n\n"
+    "Или отправьте CSV-файл (Telegram ID[,статус[,комментарий]]) "
+    "с подписью /bulk_status Статус"
+)
+
+BROADCAST_USAGE = (
+    "Использование:\n"
+    "/broadcast Текст сообщения\n\n"
+    "Сообщение получат все зарегистрированные клиенты."
+)
+
+# Шаг регистрации -> (следующий шаг, вопрос для него); None — последний шаг
+REGISTRATION_STEPS = {
+    'first_name': ('last_name', "Введите вашу фамилию:"),
+    'last_name': ('phone', "Введите ваш номер телефона (например: +996 000 000 000):"),
+    'phone': ('city', "Введите ваш город:"),
+    'city': ('comments', "Введите комментарии (пожелания, особые требования к доставке):"),
+    'comments': (None, None)
+}
+
+# Понятное описание статуса
+STATUS_DESCRIPTIONS = {
+    "В обработке": "🔄 Ваш заказ находится в обработке",
+    "Отправлен": "🚢 Ваш заказ отправлен из Японии",
+    "В пути": "✈️ Ваш заказ в пути",
+    "Прибыл": "✅ Ваш заказ прибыл в пункт выдачи",
+    "Готов к выдаче": "📦 Заказ готов к выдаче",
+    "Выдан": "🎉 Заказ получен"
+}
+
+def format_status(client: dict) -> str:
+    """Сообщение для кнопки «Проверить статус»."""
+    status = client.get('status', 'неизвестен')
+    last_updated = client.get('last_updated', 'не указана')
+    comment = client.get('status_comment', 'нет комментариев')
+
+    description = STATUS_DESCRIPTIONS.get(status, f"Статус: {status}")
+
+    return (
+        f"📦 Статус вашего заказа:\n\n"
+        f"{description}\n\n"
+        #f"📅 Последнее обновление: {last_updated}\n"
+        #f"📝 Комментарий: {comment}\n\n"
+        f"Для уточнения деталей нажмите «Связаться с нами»"
+    ) + (STALE_NOTE if client.get('stale') else "")
+
+def format_status_change(status: str) -> str:
+    """Уведомление клиенту, когда сотрудник сменил статус заказа."""
+    description = STATUS_DESCRIPTIONS.get(status, f"Статус: {status}")
+    return (
+        f"🔔 Статус вашего заказа обновлен:\n\n"
+        f"{description}\n\n"
+        f"Для уточнения деталей нажмите «Связаться с нами»"
+    )
+
+def format_profile(user, client_info, unavailable: bool = False) -> str:
+    """Сообщение для кнопки «Мой профиль».
+
+    unavailable — таблица недоступна, и о заказе ничего не известно.
+    """
+    response = (
+        f"👤 Ваш профиль в NBM Japan:\n"
+        f"ID: {user.id}\n"
+        f"Имя: {user.first_name}\n"
+        f"Фамилия: {user.last_name or 'не указана'}\n"
+        f"Юзернейм: @{user.username or 'не указан'}\n\n"
+    )
+
+    # Добавляем информацию из Google Sheets, если пользователь зарегистрирован
+    if client_info:
+        response += (
+            f"📋 Статус вашего заказа:\n"
+            #f"Телефон: {client_info.get('phone', 'не указан')}\n"
+            #f"Город: {client_info.get('city', 'не указан')}\n"
+            f"📦: {client_info.get('status', 'неизвестен')}"
+        )
+        if client_info.get('stale'):
+            response += STALE_NOTE
+    elif unavailable:
+        response += "⏳ Данные о заказе сейчас недоступны, попробуйте позже."
+    else:
+        response += "ℹ️ Вы еще не зарегистрированы в системе."
+    return response
+
+def format_registration_result(state: dict, success: bool, msg: str) -> str:
+    """Итоговое сообщение после последнего шага регистрации."""
+    details = (
+        f"📋 Ваши данные:\n"
+        f"Имя: {state['first_name']}\n"
+        f"Фамилия: {state['last_name']}\n"
+        f"Телефон: {state['phone']}\n"
+        f"Город: {state['city']}\n"
+        f"Комментарии: {state['comments']}\n\n"
+    )
+    if success:
+        return (
+            f"✅ Регистрация в NBM Japan завершена!\n\n"
+            f"{details}"
+            f"🗃️ {msg}\n\n"
+            f"📞 Для оформления заказа свяжитесь с нами через кнопку 'Связаться с нами'"
+        )
+    return (
+        f"✅ Регистрация завершена!\n\n"
+        f"{details}"
+        f"⚠️ Ошибка записи в таблицу: {msg}\n\n"
+        f"📞 Для оформления заказа свяжитесь с нами через кнопку 'Связаться с нами'"
+    )
+
+def format_sheets_check(service_connected: bool) -> str:
+    """Ответ на /check_sheets."""
+    config_status = []
+
+    # Проверяем переменные окружения
+    if os.getenv('GOOGLE_SERVICE_ACCOUNT_JSON'):
+        config_status.append("✅ GOOGLE_SERVICE_ACCOUNT_JSON настроен")
+    else:
+        config_status.append("❌ GOOGLE_SERVICE_ACCOUNT_JSON не найден")
+
+    if os.getenv('GOOGLE_SPREADSHEET_ID'):
+        config_status.append(f"✅ GOOGLE_SPREADSHEET_ID: {os.getenv('GOOGLE_SPREADSHEET_ID')}")
+    else:
+        config_status.append("❌ GOOGLE_SPREADSHEET_ID не найден")
+
+    # Проверяем подключение
+    if service_connected:
+        config_status.append("✅ Google Sheets API подключен")
+    else:
+        config_status.append("❌ Google Sheets API не подключен")
+
+    return "🔍 Проверка настроек Google Sheets:\n\n" + "\n".join(config_status)
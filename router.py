@@ -0,0 +1,62 @@
+from typing import Callable, Dict, Optional, Tuple
+
+from telebot import util
+
+# Любое состояние или любой текст
+ANY = object()
+
+
+def message_key(text: Optional[str]) -> Optional[str]:
+    """Ключ маршрута: текст кнопки или '/команда' без аргументов и @имени бота."""
+    command = util.extract_command(text) if text else None
+    return text if command is None else '/' + command
+
+
+class Router:
+    """Таблица маршрутов текстовых сообщений: (состояние, текст) -> обработчик.
+
+    telebot проверяет фильтры обработчиков по очереди, поэтому каждая новая
+    кнопка или шаг диалога замедляли бы все сообщения. Здесь обработчик
+    находится не более чем за четыре обращения к словарю, сколько бы
+    маршрутов ни было:
+
+        (состояние, текст) -> (ANY, текст) -> (состояние, ANY) -> (ANY, ANY)
+
+    Состояние пользователя возвращает get_state (None — вне диалога),
+    текст — кнопка или команда ('/start'). Обработчик может быть и
+    корутиной: dispatch возвращает то, что вернул обработчик.
+    """
+
+    def __init__(self, get_state: Callable[[object], Optional[str]]):
+        self.get_state = get_state
+        self._routes: Dict[Tuple[object, object], Callable] = {}
+
+    def add(self, handler: Callable, *texts, state=None) -> None:
+        """Регистрирует обработчик; без texts — для любого текста в состоянии state."""
+        for text in texts or (ANY,):
+            key = (state, text)
+            if key in self._routes:
+                raise ValueError(f"Маршрут {text!r} уже занят обработчиком {self._routes[key].__name__}")
+            self._routes[key] = handler
+
+    def route(self, *texts, state=None) -> Callable:
+        """Декоратор для add: @router.route("Помощь"), @router.route('/start', state=ANY)."""
+        def decorator(handler):
+            self.add(handler, *texts, state=state)
+            return handler
+        return decorator
+
+    def resolve(self, message) -> Optional[Callable]:
+        state = self.get_state(message)
+        key = message_key(message.text)
+        routes = self._routes
+        return (
+            routes.get((state, key)) or routes.get((ANY, key))
+            or routes.get((state, ANY)) or routes.get((ANY, ANY))
+        )
+
+    def dispatch(self, message):
+        handler = self.resolve(message)
+        if handler is None:
+            return None
+        return handler(message)
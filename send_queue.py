@@ -0,0 +1,402 @@
+import os
+import json
+import asyncio
+import time
+import heapq
+import queue
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Iterable, Optional, Tuple
+
+from telebot.apihelper import ApiTelegramException
+
+import metrics
+from sheets_scheduler import BACKGROUND, INTERACTIVE, TokenBucket, background
+
+SEND_RETRIES = metrics.Counter(
+    'telegram_send_retries_total', 'Повторы отправки после 429 от Telegram'
+)
+BROADCAST_SENT = metrics.Counter(
+    'telegram_broadcast_messages_total', 'Сообщения рассылки', ['result']
+)
+
+# Маркер конца списка получателей для потоков рассылки
+_DONE = object()
+
+
+def client_ids(storage) -> Iterable[str]:
+    """Telegram ID всех клиентов хранилища — получатели рассылки."""
+    # Чтение таблицы ради рассылки не должно отнимать квоту у пользователей
+    with background():
+        yield from storage.iter_client_ids()
+
+
+class SendQueue:
+    """Исходящие сообщения Telegram с учетом лимитов Bot API.
+
+    Общее ведро токенов (TELEGRAM_GLOBAL_RATE, по умолчанию 30 сообщений
+    в секунду) и ведро на каждый чат (TELEGRAM_CHAT_RATE — 1 в секунду,
+    с запасом TELEGRAM_CHAT_BURST). Ответы пользователям идут вне очереди:
+    рассылка ждет за ними и не занимает последние токены общего ведра.
+    Если лимит чата исчерпан, ответ уходит позже из потока отложенной
+    отправки — обработчик обновлений не ждет и не задерживает другие чаты.
+    На 429 отправка повторяется через retry_after из ответа Telegram.
+
+    Рассылка (start_broadcast) ведет журнал на диске: после перезапуска
+    resume() продолжает ее, пропуская уже обработанных получателей.
+
+    В режиме asyncio ответы отправляет send_async через async_bot
+    (AsyncTeleBot) с теми же ведрами токенов, не занимая потоки.
+    """
+
+    def __init__(self, bot, async_bot=None, global_rate: Optional[float] = None,
+                 chat_rate: Optional[float] = None, chat_burst: Optional[float] = None,
+                 journal_path: Optional[str] = None, workers: Optional[int] = None,
+                 max_retries: int = 5):
+        self.bot = bot
+        self.async_bot = async_bot
+        global_rate = global_rate or float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+        self.chat_rate = chat_rate or float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+        self.chat_burst = chat_burst or float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+        self.journal_path = journal_path or os.getenv('BROADCAST_JOURNAL', 'broadcast.journal')
+        self.workers = workers or int(os.getenv('BROADCAST_WORKERS', '8'))
+        self.max_retries = max_retries
+
+        # Небольшой запас, чтобы за любую секунду не уйти заметно выше лимита
+        burst = max(1.0, global_rate / 6)
+        self._global = TokenBucket(global_rate * 60, burst=burst, reserve=burst / 5)
+        # ID чата -> (токены, время обновления); в начале — давно не писавшие
+        self._chats = OrderedDict()
+        self._chats_lock = threading.Lock()
+        # Отложенные ответы: ID чата -> очередь сообщений, куча (когда, №, ID чата)
+        self._delayed = {}
+        self._delayed_heap = []
+        self._delayed_seq = 0
+        self._delayed_cond = threading.Condition(self._chats_lock)
+        self._delayed_thread = None
+
+        self._journal_lock = threading.Lock()
+        self._journal_writes = 0
+        self._job = None
+        self._job_lock = threading.Lock()
+        self._stopping = threading.Event()
+
+    # Отправка
+
+    def send(self, chat_id, text: str, **kwargs):
+        """Отправляет ответ пользователю с учетом лимитов.
+
+        Возвращает отправленное сообщение или None, если лимит чата
+        исчерпан и ответ отложен (порядок сообщений чата сохраняется).
+        """
+        with self._chats_lock:
+            pending = self._delayed.get(chat_id)
+            if pending is not None:
+                pending.append((text, kwargs))
+                return None
+            delay = self._take_chat(chat_id)
+            if delay:
+                self._defer(chat_id, (text, kwargs), delay)
+                return None
+        return self._deliver(chat_id, text, INTERACTIVE, chat_ready=True, **kwargs)
+
+    async def send_async(self, chat_id, text: str, **kwargs):
+        """send для корутин: ждет токены через asyncio.sleep и отправляет через async_bot."""
+        from telebot.asyncio_helper import ApiTelegramException as AsyncApiTelegramException
+
+        attempt = 0
+        while True:
+            while True:
+                with self._chats_lock:
+                    delay = self._take_chat(chat_id)
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+            while True:
+                delay = self._global.try_acquire(INTERACTIVE)
+                if not delay:
+                    break
+                await asyncio.sleep(delay)
+            try:
+                return await self.async_bot.send_message(chat_id, text, **kwargs)
+            except AsyncApiTelegramException as e:
+                retry_after = self._retry_after(e, attempt)
+                if retry_after is None:
+                    raise
+            self._throttled(retry_after)
+            await asyncio.sleep(retry_after)
+            attempt += 1
+
+    def notify(self, chat_id, text: str, **kwargs):
+        """Отправляет уведомление по инициативе бота — после ответов пользователям."""
+        return self._deliver(chat_id, text, BACKGROUND, **kwargs)
+
+    def _deliver(self, chat_id, text: str, priority: int, chat_ready: bool = False, **kwargs):
+        attempt = 0
+        while True:
+            if not chat_ready:
+                self._acquire_chat(chat_id)
+            chat_ready = False
+            self._global.acquire(priority)
+            try:
+                return self.bot.send_message(chat_id, text, **kwargs)
+            except ApiTelegramException as e:
+                retry_after = self._retry_after(e, attempt)
+                if retry_after is None:
+                    raise
+            self._throttled(retry_after)
+            time.sleep(retry_after)
+            attempt += 1
+
+    def _retry_after(self, error, attempt: int) -> Optional[float]:
+        """Пауза из ответа 429 или None, если отправку повторять не нужно."""
+        if error.error_code != 429 or attempt >= self.max_retries:
+            return None
+        return (error.result_json or {}).get('parameters', {}).get('retry_after', 1)
+
+    def _throttled(self, retry_after: float) -> None:
+        # Telegram просит подождать — притормаживаем все отправки, а не одну
+        self._global.penalize(retry_after)
+        SEND_RETRIES.inc()
+        print(f"⏳ Telegram ограничил отправку, повтор через {retry_after} с")
+
+    def _acquire_chat(self, chat_id) -> None:
+        while True:
+            with self._chats_lock:
+                delay = self._take_chat(chat_id)
+            if not delay:
+                return
+            time.sleep(delay)
+
+    def _take_chat(self, chat_id) -> float:
+        """Берет токен чата: 0 — взят, иначе сколько секунд ждать. Под _chats_lock."""
+        now = time.monotonic()
+        tokens, updated = self._chats.pop(chat_id, (self.chat_burst, now))
+        tokens = min(self.chat_burst, tokens + (now - updated) * self.chat_rate)
+        if tokens < 1:
+            self._chats[chat_id] = (tokens, now)
+            return (1 - tokens) / self.chat_rate
+        self._chats[chat_id] = (tokens - 1, now)
+        # Чаты, чье ведро уже снова полное, хранить незачем
+        full_after = self.chat_burst / self.chat_rate
+        while self._chats:
+            _, (_, oldest) = next(iter(self._chats.items()))
+            if now - oldest < full_after:
+                break
+            self._chats.popitem(last=False)
+        return 0
+
+    def _defer(self, chat_id, message: tuple, delay: float) -> None:
+        """Начинает отложенную отправку ответов чата. Под _chats_lock."""
+        self._delayed[chat_id] = deque([message])
+        self._schedule(chat_id, delay)
+        if not self._delayed_thread:
+            self._delayed_thread = threading.Thread(
+                target=self._run_delayed, name='send-delayed', daemon=True
+            )
+            self._delayed_thread.start()
+
+    def _schedule(self, chat_id, delay: float) -> None:
+        self._delayed_seq += 1
+        heapq.heappush(self._delayed_heap, (time.monotonic() + delay, self._delayed_seq, chat_id))
+        self._delayed_cond.notify()
+
+    def _run_delayed(self) -> None:
+        while True:
+            with self._delayed_cond:
+                if not self._delayed_heap:
+                    self._delayed_cond.wait()
+                    continue
+                ready_at, _, chat_id = self._delayed_heap[0]
+                wait = ready_at - time.monotonic()
+                if wait > 0:
+                    self._delayed_cond.wait(wait)
+                    continue
+                heapq.heappop(self._delayed_heap)
+                delay = self._take_chat(chat_id)
+                pending = self._delayed[chat_id]
+                if delay:
+                    self._schedule(chat_id, delay)
+                    continue
+                text, kwargs = pending.popleft()
+            try:
+                self._deliver(chat_id, text, INTERACTIVE, chat_ready=True, **kwargs)
+            except Exception as e:
+                print(f"⚠️ Не удалось отправить отложенный ответ {chat_id}: {e}")
+            # Чат остается в _delayed до конца отправки, чтобы новые ответы не обогнали ее
+            with self._delayed_cond:
+                if pending:
+                    self._schedule(chat_id, 0)
+                else:
+                    del self._delayed[chat_id]
+
+    # Рассылка
+
+    def start_broadcast(self, text: str, recipients: Callable[[], Iterable],
+                        admin_chat_id=None) -> Tuple[bool, str]:
+        """Запускает рассылку text всем из recipients() в фоне.
+
+        recipients — функция, возвращающая поток Telegram ID; она же
+        вызывается повторно при возобновлении после перезапуска.
+        """
+        with self._job_lock:
+            if self._job:
+                return False, f"Рассылка уже идет: {self.broadcast_progress()}"
+            job = {
+                'job': uuid.uuid4().hex,
+                'text': text,
+                'admin_chat_id': admin_chat_id,
+                'started_at': time.time()
+            }
+            try:
+                self._rewrite_journal([job])
+            except OSError as e:
+                print(f"❌ Ошибка записи журнала рассылки: {e}")
+                return False, f"Не удалось сохранить рассылку: {e}"
+            self._run_job(job, recipients, set())
+        return True, "Рассылка запущена"
+
+    def resume(self, recipients: Callable[[], Iterable]) -> bool:
+        """Продолжает незавершенную рассылку из журнала (при старте бота)."""
+        job, done = self._recover_journal()
+        if not job:
+            return False
+        with self._job_lock:
+            if self._job:
+                return False
+            print(f"♻️ Продолжаем рассылку, уже обработано: {len(done)}")
+            self._run_job(job, recipients, done)
+        return True
+
+    def broadcast_progress(self) -> str:
+        job = self._job
+        if not job:
+            return "нет активной рассылки"
+        return f"отправлено {job['sent']}, ошибок {job['failed']}, пропущено {job['skipped']}"
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Останавливает рассылку; прогресс остается в журнале."""
+        self._stopping.set()
+        job = self._job
+        if job:
+            job['thread'].join(timeout)
+        self._stopping.clear()
+
+    def _run_job(self, job: dict, recipients: Callable[[], Iterable], done: set) -> None:
+        job.update(sent=0, failed=0, skipped=len(done))
+        thread = threading.Thread(
+            target=self._broadcast, args=(job, recipients, done),
+            name='broadcast-feed', daemon=True
+        )
+        job['thread'] = thread
+        self._job = job
+        thread.start()
+
+    def _broadcast(self, job: dict, recipients: Callable[[], Iterable], done: set) -> None:
+        pending = queue.Queue(maxsize=self.workers * 4)
+        counts_lock = threading.Lock()
+
+        def worker():
+            while True:
+                chat_id = pending.get()
+                if chat_id is _DONE:
+                    return
+                try:
+                    self._deliver(chat_id, job['text'], BACKGROUND)
+                    result = 'sent'
+                except Exception as e:
+                    # Пользователь заблокировал бота, удалил чат и т.п.
+                    print(f"⚠️ Рассылка: не доставлено {chat_id}: {e}")
+                    result = 'failed'
+                BROADCAST_SENT.inc(result)
+                with counts_lock:
+                    job[result] += 1
+                self._append_journal({'job': job['job'], 'done': str(chat_id)})
+
+        threads = [
+            threading.Thread(target=worker, name=f'broadcast-{i}', daemon=True)
+            for i in range(self.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        seen = set(done)
+        interrupted = False
+        try:
+            for telegram_id in recipients():
+                telegram_id = str(telegram_id or '').strip()
+                if not telegram_id.lstrip('-').isdigit() or telegram_id in seen:
+                    continue
+                seen.add(telegram_id)
+                if self._stopping.is_set():
+                    interrupted = True
+                    break
+                pending.put(int(telegram_id))
+        except Exception as e:
+            print(f"❌ Рассылка прервана, получатели недоступны: {e}")
+            interrupted = True
+        finally:
+            for _ in threads:
+                pending.put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        summary = f"📣 Рассылка завершена: {self.broadcast_progress()}"
+        with self._job_lock:
+            self._job = None
+            if not interrupted:
+                self._append_journal({'job': job['job'], 'finished': True})
+        if interrupted:
+            return
+        print(summary)
+        if job.get('admin_chat_id'):
+            try:
+                self.send(job['admin_chat_id'], summary)
+            except Exception as e:
+                print(f"⚠️ Не удалось отправить итог рассылки: {e}")
+
+    # Журнал рассылки: первая строка — задание, далее по строке на получателя
+
+    def _append_journal(self, entry: dict) -> None:
+        with self._journal_lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                self._journal_writes += 1
+                # fsync не на каждую строку: после сбоя повторятся лишь
+                # последние несколько сообщений
+                if self._journal_writes % 50 == 0 or 'finished' in entry:
+                    os.fsync(f.fileno())
+
+    def _rewrite_journal(self, entries) -> None:
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _recover_journal(self) -> Tuple[Optional[dict], set]:
+        """Возвращает незавершенное задание и уже обработанных получателей."""
+        if not os.path.exists(self.journal_path):
+            return None, set()
+
+        job = None
+        done = set()
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после падения
+                    continue
+                if 'text' in entry:
+                    job, done = entry, set()
+                elif job and entry.get('job') == job['job']:
+                    if entry.get('finished'):
+                        job = None
+                    elif 'done' in entry:
+                        done.add(entry['done'])
+        return job, done
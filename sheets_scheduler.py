@@ -0,0 +1,420 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional
+
+from googleapiclient.errors import HttpError
+
+import metrics
+
+# Приоритеты вызовов: меньшее число обслуживается раньше
+INTERACTIVE, BACKGROUND = 0, 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# Методы values(), которые расходуют квоту чтения; остальные — записи
+READ_METHODS = {'get', 'batchGet'}
+# Методы values(), которые безопасно повторить, если неясно, выполнен ли
+# запрос (таймаут, обрыв, 5xx): повтор append добавил бы строку еще раз
+IDEMPOTENT_METHODS = READ_METHODS | {'update', 'batchUpdate'}
+
+_local = threading.local()
+
+# Значение timeout по умолчанию (зависит от приоритета вызова)
+_DEFAULT = object()
+
+SCHEDULER_WAIT = metrics.Histogram(
+    'sheets_scheduler_wait_seconds', 'Ожидание квоты Google Sheets перед вызовом',
+    ['quota', 'priority']
+)
+SHEETS_RETRIES = metrics.Counter(
+    'sheets_api_retries_total', 'Повторы вызовов Google Sheets после 429/5xx',
+    ['method', 'status']
+)
+SINGLEFLIGHT_SAVED = metrics.Counter(
+    'sheets_singleflight_saved_total',
+    'Чтения Google Sheets, дождавшиеся уже идущего запроса вместо своего', ['kind']
+)
+
+
+BREAKER_REJECTED = metrics.Counter(
+    'sheets_breaker_rejected_total', 'Вызовы Google Sheets, отклоненные открытым предохранителем'
+)
+
+
+class SheetsBusy(Exception):
+    """Квота Google Sheets исчерпана, а ждать дольше вызов не может."""
+
+
+class SheetsUnavailable(SheetsBusy):
+    """Google Sheets не отвечает или отвечает ошибками (предохранитель открыт)."""
+
+
+def current_priority() -> int:
+    return getattr(_local, 'priority', INTERACTIVE)
+
+
+def call_deadline() -> Optional[float]:
+    """Срок (time.monotonic) текущего вызова Sheets в этом потоке или None.
+
+    Транспорт (sheets_transport.PooledHttp) не ждет ответа дольше него.
+    """
+    return getattr(_local, 'deadline', None)
+
+
+@contextmanager
+def background():
+    """Вызовы Sheets внутри блока уступают очередь запросам пользователей."""
+    previous = current_priority()
+    _local.priority = BACKGROUND
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class TokenBucket:
+    """Ведро токенов с очередью ожидающих по приоритету.
+
+    Токен получает только первый в очереди, поэтому фоновая задача не
+    обгонит пользователя, пришедшего позже. Кроме того, фоновые вызовы
+    не забирают последние reserve токенов — они остаются для пользователей.
+    """
+
+    def __init__(self, per_minute: float, burst: float, reserve: float = 0.0):
+        self.rate = per_minute / 60
+        self.capacity = burst
+        self.reserve = reserve
+        self.tokens = burst
+        self._updated = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: int = INTERACTIVE, timeout: Optional[float] = None) -> float:
+        """Забирает токен; возвращает время ожидания в секундах.
+
+        SheetsBusy — если токен не появился за timeout секунд.
+        """
+        ticket = (priority, next(self._seq))
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        need = min(self.capacity, 1 + (self.reserve if priority != INTERACTIVE else 0))
+
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            self._cond.notify_all()
+            try:
+                while True:
+                    self._refill()
+                    first = self._waiting[0] == ticket
+                    if first and self.tokens >= need:
+                        self.tokens -= 1
+                        return time.monotonic() - start
+
+                    # Первый ждет нужного числа токенов, остальные — своей очереди
+                    delay = (need - self.tokens) / self.rate if first else None
+                    if deadline is not None:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise SheetsBusy("Квота Google Sheets исчерпана, попробуйте позже")
+                        delay = remaining if delay is None else min(delay, remaining)
+                    self._cond.wait(delay)
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+
+    def try_acquire(self, priority: int = INTERACTIVE) -> float:
+        """Забирает токен без ожидания: 0 — взят, иначе через сколько секунд повторить.
+
+        Для корутин, которым нельзя блокировать цикл событий. Ожидающих
+        в acquire с тем же или более высоким приоритетом не обгоняет.
+        """
+        need = min(self.capacity, 1 + (self.reserve if priority != INTERACTIVE else 0))
+        with self._cond:
+            self._refill()
+            ahead = any(waiting <= priority for waiting, _ in self._waiting)
+            if not ahead and self.tokens >= need:
+                self.tokens -= 1
+                return 0.0
+            return max(need - self.tokens, 1) / self.rate
+
+    def penalize(self, seconds: float) -> None:
+        """После 429 никто не получает токены ближайшие seconds секунд."""
+        with self._cond:
+            self._refill()
+            self.tokens = min(self.tokens, 0) - seconds * self.rate
+
+
+class CircuitBreaker:
+    """Предохранитель: перестает вызывать Sheets, пока тот отвечает ошибками.
+
+    Если за последние window секунд было не меньше min_calls вызовов и
+    доля ошибок (5xx, таймауты, обрывы соединения) достигла error_rate,
+    предохранитель открывается на open_seconds: вызовы сразу получают
+    SheetsUnavailable, не занимая потоки ожиданием. Затем пропускается
+    один пробный вызов — успех закрывает предохранитель, ошибка снова
+    открывает его.
+    """
+
+    def __init__(self, error_rate: Optional[float] = None, min_calls: Optional[int] = None,
+                 window: Optional[float] = None, open_seconds: Optional[float] = None):
+        self.error_rate = error_rate or float(os.getenv('SHEETS_BREAKER_ERROR_RATE', '0.5'))
+        self.min_calls = min_calls or int(os.getenv('SHEETS_BREAKER_MIN_CALLS', '5'))
+        self.window = window or float(os.getenv('SHEETS_BREAKER_WINDOW', '30'))
+        self.open_seconds = open_seconds or float(os.getenv('SHEETS_BREAKER_OPEN_SECONDS', '30'))
+        self._lock = threading.Lock()
+        # (время, успех) вызовов за последние window секунд
+        self._calls = deque()
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """Пропускает вызов или бросает SheetsUnavailable; True — вызов пробный."""
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if not self._probing and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._probing = True
+                return True
+        BREAKER_REJECTED.inc()
+        raise SheetsUnavailable("Google Sheets временно недоступен, попробуйте позже")
+
+    def cancel_probe(self) -> None:
+        """Пробный вызов не состоялся — пробным сможет стать следующий."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, success: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self._probing:
+                self._probing = False
+                if success:
+                    print("✅ Google Sheets снова отвечает, предохранитель закрыт")
+                    self._opened_at = None
+                    self._calls.clear()
+                else:
+                    self._opened_at = now
+                return
+            if self._opened_at is not None:
+                return
+
+            self._calls.append((now, success))
+            while self._calls and now - self._calls[0][0] > self.window:
+                self._calls.popleft()
+            failures = sum(1 for _, ok in self._calls if not ok)
+            if (len(self._calls) >= self.min_calls
+                    and failures / len(self._calls) >= self.error_rate):
+                print(f"🔌 Google Sheets отвечает ошибками ({failures} из {len(self._calls)}), "
+                      f"предохранитель открыт на {self.open_seconds:.0f} с")
+                self._opened_at = now
+
+
+class SheetsScheduler:
+    """Единая точка выполнения запросов к Google Sheets API.
+
+    Отдельные ведра токенов для чтения и записи под поминутные квоты
+    (SHEETS_READ_PER_MINUTE, SHEETS_WRITE_PER_MINUTE), приоритет
+    пользовательских запросов над фоновыми (см. background()) и повтор
+    с экспоненциальной задержкой и jitter на 429/5xx.
+
+    Пользовательский вызов целиком (квота, запрос, повторы) укладывается
+    в SHEETS_INTERACTIVE_WAIT секунд, иначе получает SheetsBusy; фоновые
+    ждут квоту сколько нужно, а каждый запрос ограничен таймаутом
+    транспорта. Таймауты, обрывы соединения и 5xx повторяются только для
+    идемпотентных запросов, 429 — для всех; при частых ошибках
+    срабатывает предохранитель (CircuitBreaker).
+    """
+
+    def __init__(self, read_per_minute: Optional[float] = None,
+                 write_per_minute: Optional[float] = None,
+                 burst: Optional[float] = None,
+                 interactive_wait: Optional[float] = None,
+                 max_retries: Optional[int] = None,
+                 max_backoff: float = 32.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        burst = burst or float(os.getenv('SHEETS_BURST', '10'))
+        reserve = burst / 5
+        self.buckets = {
+            'read': TokenBucket(
+                read_per_minute or float(os.getenv('SHEETS_READ_PER_MINUTE', '60')), burst, reserve
+            ),
+            'write': TokenBucket(
+                write_per_minute or float(os.getenv('SHEETS_WRITE_PER_MINUTE', '60')), burst, reserve
+            ),
+        }
+        self.interactive_wait = (
+            interactive_wait if interactive_wait is not None
+            else float(os.getenv('SHEETS_INTERACTIVE_WAIT', '10'))
+        )
+        self.max_retries = (
+            max_retries if max_retries is not None else int(os.getenv('SHEETS_MAX_RETRIES', '5'))
+        )
+        self.max_backoff = max_backoff
+        self.breaker = breaker or CircuitBreaker()
+
+    def default_timeout(self) -> Optional[float]:
+        """Предел ожидания для текущего потока: пользователи не ждут вечно."""
+        return self.interactive_wait if current_priority() == INTERACTIVE else None
+
+    def execute(self, method: str, request, timeout=_DEFAULT,
+                idempotent: Optional[bool] = None):
+        """Выполняет запрос googleapiclient с учетом квоты и повторов.
+
+        method — имя метода values() ('get', 'append', ...), по нему
+        выбирается квота. timeout ограничивает общее ожидание (None — без
+        ограничения); по умолчанию зависит от приоритета потока.
+        idempotent — можно ли повторить запрос при неясном исходе; по
+        умолчанию определяется по method (IDEMPOTENT_METHODS).
+        """
+        priority = current_priority()
+        quota = 'read' if method in READ_METHODS else 'write'
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS
+        bucket = self.buckets[quota]
+        if timeout is _DEFAULT:
+            timeout = self.default_timeout()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        attempt = 0
+        while True:
+            probe = self.breaker.allow()
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            try:
+                waited = bucket.acquire(priority, remaining)
+            except BaseException:
+                # Например, SheetsBusy: без этого предохранитель навсегда ждал бы пробы
+                if probe:
+                    self.breaker.cancel_probe()
+                raise
+            SCHEDULER_WAIT.observe(waited, quota, PRIORITY_NAMES[priority])
+            _local.deadline = deadline
+            try:
+                result = metrics.sheets_execute(method, request)
+                self.breaker.record(True)
+                return result
+            except HttpError as e:
+                status = e.resp.status
+                # 4xx (в том числе 429 — квота) — Sheets отвечает, это не сбой
+                self.breaker.record(status < 500)
+                # На 429 запрос точно не выполнен, на 5xx — неизвестно
+                retryable = status == 429 or (status >= 500 and idempotent)
+                if not retryable or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if status == 429:
+                    bucket.penalize(delay)
+                error = e
+            except (TimeoutError, ConnectionError) as e:
+                self.breaker.record(False)
+                if deadline is not None and time.monotonic() >= deadline:
+                    raise SheetsUnavailable("Google Sheets не ответил вовремя") from e
+                if not idempotent or attempt >= self.max_retries:
+                    raise
+                status = 'network'
+                delay = self._backoff(attempt)
+                error = e
+            except Exception:
+                self.breaker.record(False)
+                raise
+            finally:
+                _local.deadline = None
+
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise SheetsBusy("Google Sheets перегружен, попробуйте позже") from error
+
+            SHEETS_RETRIES.inc(method, str(status))
+            print(f"⏳ Sheets ответил {status} на {method}, повтор через {delay:.1f} с")
+            time.sleep(delay)
+            attempt += 1
+
+    def _retry_delay(self, error: HttpError, attempt: int) -> float:
+        retry_after = error.resp.get('retry-after')
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return self._backoff(attempt)
+
+    def _backoff(self, attempt: int) -> float:
+        # «Полный» jitter: одновременные клиенты не повторяют запрос хором
+        return random.uniform(0, min(self.max_backoff, 2 ** attempt))
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Объединяет одинаковые одновременные запросы в один.
+
+    Первый вызов do() с ключом выполняет func, остальные с тем же ключом
+    ждут его результата (или исключения) вместо собственного запроса.
+    kind — метка для метрики: ключей (диапазонов строк) столько же,
+    сколько клиентов, поэтому сами ключи в метку не попадают.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+        self.saved = 0
+
+    def do(self, key, func, timeout: Optional[float] = None, kind: str = 'other'):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self.saved += 1
+
+        if not leader:
+            SINGLEFLIGHT_SAVED.inc(kind)
+            if not flight.done.wait(timeout):
+                raise SheetsBusy("Google Sheets отвечает слишком долго, попробуйте позже")
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+
+_default_scheduler: Optional[SheetsScheduler] = None
+_default_lock = threading.Lock()
+
+
+def get_scheduler() -> SheetsScheduler:
+    """Общий планировщик процесса: квоты одни на весь сервисный аккаунт."""
+    global _default_scheduler
+    with _default_lock:
+        if _default_scheduler is None:
+            _default_scheduler = SheetsScheduler()
+        return _default_scheduler
@@ -0,0 +1,83 @@
+"""HTTP-транспорт клиента Google Sheets с общим пулом соединений.
+
+googleapiclient по умолчанию ходит в API через один httplib2.Http,
+который нельзя использовать из нескольких потоков одновременно и который
+держит единственное соединение. PooledHttp повторяет интерфейс
+httplib2.Http.request поверх AuthorizedSession (requests + urllib3):
+пул keep-alive соединений потокобезопасен, поэтому обработчики из разных
+потоков делят одни и те же «теплые» TLS-соединения.
+"""
+import os
+import time
+from typing import Optional, Tuple
+
+import httplib2
+import requests
+from google.auth.transport.requests import AuthorizedSession
+
+from sheets_scheduler import call_deadline
+
+# Соединений в пуле по умолчанию — по числу потоков SHEETS_MAX_WORKERS
+DEFAULT_POOL_SIZE = 8
+
+
+class PooledHttp:
+    """Замена httplib2.Http для googleapiclient на основе AuthorizedSession.
+
+    pool_size — сколько соединений держать открытыми (SHEETS_POOL_SIZE);
+    при большем числе одновременных запросов лишние соединения
+    открываются и закрываются после ответа. connect_timeout и
+    read_timeout — таймауты в секундах (SHEETS_CONNECT_TIMEOUT,
+    SHEETS_READ_TIMEOUT); если у вызова есть срок (SheetsScheduler задает
+    его пользовательским запросам), ждем не дольше него. Повторы здесь
+    не делаются: этим занимается SheetsScheduler.
+    """
+
+    def __init__(self, credentials, pool_size: Optional[int] = None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None):
+        self.pool_size = pool_size or int(os.getenv('SHEETS_POOL_SIZE', str(DEFAULT_POOL_SIZE)))
+        self.timeout = (
+            connect_timeout or float(os.getenv('SHEETS_CONNECT_TIMEOUT', '5')),
+            read_timeout or float(os.getenv('SHEETS_READ_TIMEOUT', '30'))
+        )
+        self.credentials = credentials
+        self.session = AuthorizedSession(credentials)
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=0
+        )
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, uri: str, method: str = 'GET', body=None, headers=None,
+                redirections=None, connection_type=None) -> Tuple[httplib2.Response, bytes]:
+        """То же, что httplib2.Http.request: (ответ с заголовками, тело)."""
+        connect_timeout, read_timeout = self.timeout
+        deadline = call_deadline()
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError("Истек срок вызова Google Sheets")
+            connect_timeout = min(connect_timeout, remaining)
+            read_timeout = min(read_timeout, remaining)
+        try:
+            response = self.session.request(
+                method, uri, data=body, headers=headers,
+                timeout=(connect_timeout, read_timeout)
+            )
+        except requests.exceptions.Timeout as e:
+            # googleapiclient и SheetsScheduler понимают встроенные исключения
+            raise TimeoutError(str(e)) from e
+        except requests.exceptions.ConnectionError as e:
+            raise ConnectionError(str(e)) from e
+
+        info = {key.lower(): value for key, value in response.headers.items()}
+        # requests уже распаковал тело, как и httplib2
+        info.pop('content-encoding', None)
+        info['status'] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason
+        return resp, response.content
+
+    def close(self) -> None:
+        self.session.close()
@@ -0,0 +1,198 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+
+class MemoryStateStore:
+    """Состояния пользователей в памяти: LRU с ограниченным размером и TTL.
+
+    Каждое обращение переносит запись в конец, поэтому самые старые
+    записи всегда в начале и вытесняются за O(1) без полного обхода.
+    """
+
+    def __init__(self, max_size: Optional[int] = None, ttl: Optional[float] = None):
+        self.max_size = max_size or int(os.getenv('STATE_MAX_SIZE', '10000'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('STATE_TTL', '86400'))
+        # ключ -> (время последнего обращения, состояние)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            touched_at, state = item
+            now = time.monotonic()
+            if now - touched_at >= self.ttl:
+                del self._data[key]
+                return default
+            self._data[key] = (now, state)
+            self._data.move_to_end(key)
+            return state
+
+    def set(self, key, state: dict) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), state)
+            self._data.move_to_end(key)
+            self._evict()
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def pop(self, key, default=None):
+        """Удаляет состояние и возвращает его (default — если его нет или оно истекло)."""
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None or time.monotonic() - item[0] >= self.ttl:
+            return default
+        return item[1]
+
+    def compact(self) -> int:
+        """Удаляет просроченные записи; возвращает число удаленных."""
+        with self._lock:
+            return self._evict()
+
+    def _evict(self) -> int:
+        removed = 0
+        deadline = time.monotonic() - self.ttl
+        while self._data:
+            key, (touched_at, _) = next(iter(self._data.items()))
+            if touched_at > deadline and len(self._data) <= self.max_size:
+                break
+            del self._data[key]
+            removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key) -> dict:
+        state = self.get(key)
+        if state is None:
+            raise KeyError(key)
+        return state
+
+    def __setitem__(self, key, state: dict) -> None:
+        self.set(key, state)
+
+    def __delitem__(self, key) -> None:
+        self.delete(key)
+
+
+class SQLiteStateStore:
+    """Состояния пользователей в SQLite — переживают перезапуск бота.
+
+    Просроченные записи удаляются при записи не чаще раза в
+    compact_interval секунд (по индексу на времени обновления).
+    """
+
+    def __init__(self, path: Optional[str] = None, max_size: Optional[int] = None,
+                 ttl: Optional[float] = None, compact_interval: float = 60.0):
+        self.path = path or os.getenv('STATE_DB_PATH', 'states.sqlite3')
+        self.max_size = max_size or int(os.getenv('STATE_MAX_SIZE', '10000'))
+        self.ttl = ttl if ttl is not None else float(os.getenv('STATE_TTL', '86400'))
+        self.compact_interval = compact_interval
+        self._last_compact = 0.0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS user_states ('
+            'key TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL)'
+        )
+        self._conn.execute(
+            'CREATE INDEX IF NOT EXISTS user_states_updated_at ON user_states (updated_at)'
+        )
+
+    def get(self, key, default=None):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state, updated_at FROM user_states WHERE key = ?', (str(key),)
+            ).fetchone()
+            if row is None:
+                return default
+            if time.time() - row[1] >= self.ttl:
+                self._conn.execute('DELETE FROM user_states WHERE key = ?', (str(key),))
+                return default
+            return json.loads(row[0])
+
+    def set(self, key, state: dict) -> None:
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO user_states (key, state, updated_at) VALUES (?, ?, ?)',
+                (str(key), json.dumps(state, ensure_ascii=False), time.time())
+            )
+            if time.monotonic() - self._last_compact >= self.compact_interval:
+                self._compact()
+
+    def delete(self, key) -> None:
+        with self._lock:
+            self._conn.execute('DELETE FROM user_states WHERE key = ?', (str(key),))
+
+    def pop(self, key, default=None):
+        """Удаляет состояние и возвращает его (default — если его нет или оно истекло)."""
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT state, updated_at FROM user_states WHERE key = ?', (str(key),)
+            ).fetchone()
+            self._conn.execute('DELETE FROM user_states WHERE key = ?', (str(key),))
+        if row is None or time.time() - row[1] >= self.ttl:
+            return default
+        return json.loads(row[0])
+
+    def compact(self) -> int:
+        """Удаляет просроченные и лишние (сверх max_size) записи."""
+        with self._lock:
+            return self._compact()
+
+    def _compact(self) -> int:
+        self._last_compact = time.monotonic()
+        removed = self._conn.execute(
+            'DELETE FROM user_states WHERE updated_at <= ?', (time.time() - self.ttl,)
+        ).rowcount
+        removed += self._conn.execute(
+            'DELETE FROM user_states WHERE key IN ('
+            'SELECT key FROM user_states ORDER BY updated_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_size,)
+        ).rowcount
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM user_states').fetchone()[0]
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __getitem__(self, key) -> dict:
+        state = self.get(key)
+        if state is None:
+            raise KeyError(key)
+        return state
+
+    def __setitem__(self, key, state: dict) -> None:
+        self.set(key, state)
+
+    def __delitem__(self, key) -> None:
+        self.delete(key)
+
+
+def create_state_store():
+    """Создает хранилище по STATE_STORE: 'memory' (по умолчанию) или 'sqlite'."""
+    backend = os.getenv('STATE_STORE', 'memory').lower()
+    if backend == 'sqlite':
+        return SQLiteStateStore()
+    if backend != 'memory':
+        print(f"⚠️ Неизвестное хранилище состояний '{backend}', используем память")
+    return MemoryStateStore()
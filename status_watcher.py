@@ -0,0 +1,136 @@
+import os
+import json
+import hashlib
+import threading
+from typing import Dict, Optional, Tuple
+
+import metrics
+from replies import MAIN_KEYBOARD, format_status_change
+from sheets_scheduler import background
+
+STATUS_NOTIFICATIONS = metrics.Counter(
+    'bot_status_notifications_total', 'Уведомления о смене статуса', ['result']
+)
+
+
+def _digest(value: str) -> str:
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=8).hexdigest()
+
+
+class StatusWatcher:
+    """Фоновое отслеживание смены статусов и уведомление клиентов.
+
+    Раз в interval секунд (STATUS_WATCH_INTERVAL) читает пары
+    (Telegram ID, статус) одним запросом и сравнивает со снимком из
+    хешей. Если хеш всей колонки не изменился, построчное сравнение
+    пропускается. Клиентам, чей статус сменился, уходит описание нового
+    статуса. Снимок хранится на диске (STATUS_SNAPSHOT), поэтому после
+    перезапуска смены не теряются и не рассылаются повторно; при самом
+    первом запуске снимок только запоминается.
+    """
+
+    def __init__(self, storage, send_queue, interval: Optional[float] = None,
+                 snapshot_path: Optional[str] = None):
+        self.storage = storage
+        self.send_queue = send_queue
+        self.interval = interval or float(os.getenv('STATUS_WATCH_INTERVAL', '60'))
+        self.snapshot_path = snapshot_path or os.getenv('STATUS_SNAPSHOT', 'status_snapshot.json')
+        self._digest_all: Optional[str] = None
+        # Telegram ID -> хеш статуса
+        self._rows: Dict[str, str] = {}
+        self._stop = threading.Event()
+        self._thread = None
+        self._load_snapshot()
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='status-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            self.check_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def check_once(self) -> Tuple[bool, str]:
+        """Один проход: читает статусы, уведомляет об изменениях."""
+        try:
+            # Проверка статусов уступает квоту Sheets запросам пользователей
+            with background():
+                pairs = list(self.storage.iter_statuses())
+        except Exception as e:
+            print(f"⚠️ Не удалось прочитать статусы: {e}")
+            return False, str(e)
+
+        whole = hashlib.blake2b(digest_size=16)
+        for telegram_id, status in pairs:
+            whole.update(f"{telegram_id}\t{status}\n".encode('utf-8'))
+        digest_all = whole.hexdigest()
+        if digest_all == self._digest_all:
+            return True, "Изменений нет"
+
+        rows = {}
+        changed = []
+        for telegram_id, status in pairs:
+            telegram_id = str(telegram_id).strip()
+            # При дублях учитываем первую строку, как и поиск клиента
+            if not telegram_id or telegram_id in rows:
+                continue
+            digest = _digest(status or '')
+            rows[telegram_id] = digest
+            previous = self._rows.get(telegram_id)
+            if previous is not None and previous != digest and status:
+                changed.append((telegram_id, status))
+
+        notified = sum(self._notify(telegram_id, status) for telegram_id, status in changed)
+
+        self._rows = rows
+        self._digest_all = digest_all
+        self._save_snapshot()
+        return True, f"Статус изменился: {len(changed)}, уведомлено: {notified}"
+
+    def _notify(self, telegram_id: str, status: str) -> bool:
+        if not telegram_id.isdigit():
+            return False
+        try:
+            self.send_queue.notify(
+                int(telegram_id), format_status_change(status), reply_markup=MAIN_KEYBOARD
+            )
+            STATUS_NOTIFICATIONS.inc('sent')
+            return True
+        except Exception as e:
+            # Клиент мог заблокировать бота — остальные уведомления не страдают
+            print(f"⚠️ Не удалось уведомить {telegram_id} о статусе: {e}")
+            STATUS_NOTIFICATIONS.inc('failed')
+            return False
+
+    def _load_snapshot(self) -> None:
+        if not os.path.exists(self.snapshot_path):
+            return
+        try:
+            with open(self.snapshot_path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self._digest_all = snapshot['digest']
+            self._rows = snapshot['rows']
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Снимок статусов поврежден, начинаем заново: {e}")
+
+    def _save_snapshot(self) -> None:
+        tmp_path = self.snapshot_path + '.tmp'
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'digest': self._digest_all, 'rows': self._rows}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.snapshot_path)
+        except OSError as e:
+            print(f"⚠️ Не удалось сохранить снимок статусов: {e}")
@@ -0,0 +1,493 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+from sheets_scheduler import background
+
+
+# Значение bulk_update_status: статус, (статус, комментарий)
+# или (статус, комментарий, дата обновления)
+StatusUpdate = Union[str, Tuple[str, str], Tuple[str, str, str]]
+
+
+def unpack_status(value: StatusUpdate, comment: str,
+                  update_time: str) -> Tuple[str, str, str]:
+    """(статус, комментарий, дата) из значения bulk_update_status.
+
+    Дата берется из значения, если она там есть (например, зеркало
+    отправляет время локальной смены статуса), иначе — update_time.
+    """
+    if not isinstance(value, tuple):
+        return value, comment, update_time
+    if len(value) == 2:
+        return value[0], value[1], update_time
+    return value
+
+
+class ClientStorage(ABC):
+    """Общий интерфейс хранилища клиентов.
+
+    Реализации: GoogleSheetsManager (google_sheets.py) и SQLiteClientStorage.
+    Обработчики бота работают только через эти методы.
+    """
+
+    # Очередь отложенной записи регистраций (см. write_queue.py)
+    write_queue = None
+
+    @abstractmethod
+    def find_client(self, telegram_id: str,
+                    fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """Запись клиента или None, если он не зарегистрирован.
+
+        fields — какие поля нужны вызывающему; реализация вправе прочитать
+        только их (и telegram_id), по умолчанию — все CLIENT_FIELDS.
+        """
+
+    @abstractmethod
+    def iter_clients(self) -> Iterator[dict]:
+        """Перебирает записи всех клиентов."""
+
+    def iter_client_ids(self) -> Iterator[str]:
+        """Telegram ID всех клиентов — например, получатели рассылки."""
+        for client in self.iter_clients():
+            yield client['telegram_id']
+
+    def iter_statuses(self) -> Iterator[Tuple[str, str]]:
+        """Пары (Telegram ID, статус) всех клиентов — для StatusWatcher."""
+        for client in self.iter_clients():
+            yield client['telegram_id'], client.get('status') or ''
+
+    @abstractmethod
+    def add_clients(self, clients: List[dict]) -> Tuple[bool, str]:
+        """Добавляет клиентов; элементы — словари с аргументами add_client."""
+
+    @abstractmethod
+    def update_status(self, telegram_id: str, new_status: str,
+                      comment: str = "") -> Tuple[bool, str]:
+        """Обновляет статус заказа одного клиента."""
+
+    @abstractmethod
+    def bulk_update_status(self, mapping: Dict[str, StatusUpdate],
+                           comment: str = "") -> Tuple[bool, str]:
+        """Обновляет статусы многих клиентов; значения — см. StatusUpdate."""
+
+    @abstractmethod
+    def setup_headers(self) -> Tuple[bool, str]:
+        """Готовит хранилище: заголовки листа или схему таблицы."""
+
+    def _pending_client(self, telegram_id: str) -> Optional[dict]:
+        """Регистрация, принятая очередью, но еще не записанная в хранилище."""
+        if self.write_queue:
+            return self.write_queue.pending_client(telegram_id)
+        return None
+
+    def add_client(self, first_name: str, last_name: str, phone: str,
+                   city: str, comments: str, telegram_id: str) -> Tuple[bool, str]:
+        """Добавляет нового клиента."""
+        return self.add_clients([{
+            'first_name': first_name,
+            'last_name': last_name,
+            'phone': phone,
+            'city': city,
+            'comments': comments,
+            'telegram_id': str(telegram_id)
+        }])
+
+    def client_exists(self, telegram_id: str) -> bool:
+        """Проверяет, существует ли клиент с заданным Telegram ID."""
+        return self.find_client(telegram_id) is not None
+
+    def get_client_info(self, telegram_id: str) -> Optional[dict]:
+        """Возвращает полную информацию о клиенте по Telegram ID"""
+        record = self.find_client(telegram_id)
+        if not record:
+            return None
+        return {
+            'first_name': record['first_name'],
+            'last_name': record['last_name'],
+            'phone': record['phone'],
+            'city': record['city'],
+            'comments': record['comments'],
+            'status': record['status'],
+            'last_updated': record['last_updated'],
+            'status_comment': record['status_comment']
+        }
+
+    def get_client_status(self, telegram_id: str) -> Optional[dict]:
+        """Возвращает текущий статус клиента."""
+        record = self.find_client(telegram_id, fields=STATUS_FIELDS)
+        if not record:
+            return None
+        return {
+            'status': record['status'],
+            'last_updated': record['last_updated'],
+            'comment': record['status_comment']
+        }
+
+
+# Поля записи клиента в порядке колонок листа «Клиенты» (A:I)
+CLIENT_FIELDS = (
+    'first_name', 'last_name', 'phone', 'city', 'comments',
+    'telegram_id', 'status', 'last_updated', 'status_comment'
+)
+
+# Поля, нужные для ответа «Проверить статус»
+STATUS_FIELDS = ('status', 'last_updated', 'status_comment')
+
+# Значения колонки dirty: что еще нужно отправить в Google Sheets
+SYNCED, DIRTY_NEW, DIRTY_STATUS = 0, 1, 2
+
+
+class SQLiteClientStorage(ClientStorage):
+    """Клиенты в локальной SQLite с индексом по Telegram ID.
+
+    Поиск — локальный запрос без сети. Если подключено зеркало
+    (SheetsMirror), изменения помечаются и уходят в Google Sheets в фоне,
+    а правки сотрудников в таблице подтягиваются обратно.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or os.getenv('CLIENTS_DB_PATH', 'clients.sqlite3')
+        self.mirror = None
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._create_schema()
+
+    @property
+    def service(self):
+        """Подключение к Google Sheets зеркала (для /check_sheets)."""
+        return self.mirror.sheets.service if self.mirror else None
+
+    def _create_schema(self) -> None:
+        with self._lock:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS clients ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                'first_name TEXT, last_name TEXT, phone TEXT, city TEXT, comments TEXT, '
+                'telegram_id TEXT NOT NULL, status TEXT, last_updated TEXT, status_comment TEXT, '
+                'dirty INTEGER NOT NULL DEFAULT 0, version INTEGER NOT NULL DEFAULT 0)'
+            )
+            self._conn.execute(
+                'CREATE UNIQUE INDEX IF NOT EXISTS clients_telegram_id ON clients (telegram_id)'
+            )
+            self._conn.execute(
+                'CREATE INDEX IF NOT EXISTS clients_dirty ON clients (dirty) WHERE dirty != 0'
+            )
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> dict:
+        return {field: row[field] for field in CLIENT_FIELDS}
+
+    def find_client(self, telegram_id: str,
+                    fields: Optional[Sequence[str]] = None) -> Optional[dict]:
+        """Возвращает полную запись клиента одним индексным запросом.
+
+        fields не учитывается: строка SQLite читается целиком без потерь.
+        """
+        pending = self._pending_client(telegram_id)
+        if pending:
+            return pending
+
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT * FROM clients WHERE telegram_id = ?', (str(telegram_id),)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def iter_clients(self, page_size: int = 500) -> Iterator[dict]:
+        """Перебирает клиентов страницами по id, не загружая таблицу целиком."""
+        last_id = 0
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    'SELECT * FROM clients WHERE id > ? ORDER BY id LIMIT ?',
+                    (last_id, page_size)
+                ).fetchall()
+            for row in rows:
+                yield self._record(row)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1]['id']
+
+    def add_clients(self, clients: List[dict]) -> Tuple[bool, str]:
+        """Добавляет клиентов; уже существующие Telegram ID пропускаются."""
+        if not clients:
+            return True, "Нет клиентов для добавления"
+
+        try:
+            with self._lock:
+                added = 0
+                for client in clients:
+                    added += self._conn.execute(
+                        'INSERT OR IGNORE INTO clients (first_name, last_name, phone, city, '
+                        'comments, telegram_id, status, last_updated, status_comment, dirty) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (client['first_name'], client['last_name'], client['phone'],
+                         client['city'], client['comments'], str(client['telegram_id']),
+                         "В обработке", "", "", DIRTY_NEW)
+                    ).rowcount
+            # Повтор уже записанной регистрации — не ошибка (очередь не должна
+            # бесконечно повторять такую запись)
+            if len(clients) == 1:
+                if not added:
+                    return True, "Клиент уже зарегистрирован"
+                return True, "Клиент успешно зарегистрирован"
+            return True, f"Добавлено клиентов: {added}"
+        except sqlite3.Error as e:
+            print(f"❌ Ошибка: {str(e)}")
+            return False, f"Ошибка при добавлении: {str(e)}"
+
+    def update_status(self, telegram_id: str, new_status: str,
+                      comment: str = "") -> Tuple[bool, str]:
+        """Обновляет статус заказа."""
+        try:
+            updated, _ = self._apply_statuses({str(telegram_id): (new_status, comment)})
+        except sqlite3.Error as e:
+            print(f"❌ Ошибка обновления статуса: {str(e)}")
+            return False, str(e)
+        if not updated:
+            return False, "Клиент не найден"
+        return True, "Статус успешно обновлен"
+
+    def bulk_update_status(self, mapping: Dict[str, StatusUpdate],
+                           comment: str = "") -> Tuple[bool, str]:
+        """Обновляет статусы многих клиентов в одной транзакции."""
+        if not mapping:
+            return True, "Нет клиентов для обновления"
+
+        try:
+            updated, missing = self._apply_statuses(mapping, comment)
+        except sqlite3.Error as e:
+            print(f"❌ Ошибка массового обновления статусов: {str(e)}")
+            return False, str(e)
+
+        msg = f"Обновлено статусов: {updated}"
+        if missing:
+            shown = ", ".join(missing[:10])
+            more = f" и еще {len(missing) - 10}" if len(missing) > 10 else ""
+            msg += f"; не найдены: {shown}{more}"
+        return bool(updated), msg
+
+    def _apply_statuses(self, mapping: Dict[str, StatusUpdate],
+                        comment: str = "") -> Tuple[int, List[str]]:
+        update_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        missing = []
+        updated = 0
+        with self._lock:
+            self._conn.execute('BEGIN')
+            try:
+                for telegram_id, value in mapping.items():
+                    new_status, status_comment, last_updated = unpack_status(
+                        value, comment, update_time
+                    )
+                    # Новая строка еще не в таблице — она уйдет туда целиком
+                    changed = self._conn.execute(
+                        'UPDATE clients SET status = ?, last_updated = ?, status_comment = ?, '
+                        'dirty = CASE WHEN dirty = ? THEN dirty ELSE ? END, version = version + 1 '
+                        'WHERE telegram_id = ?',
+                        (new_status, last_updated, status_comment,
+                         DIRTY_NEW, DIRTY_STATUS, str(telegram_id))
+                    ).rowcount
+                    if changed:
+                        updated += 1
+                    else:
+                        missing.append(str(telegram_id))
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+        return updated, missing
+
+    def setup_headers(self) -> Tuple[bool, str]:
+        """Создает таблицу клиентов (и заголовки в Google Sheets, если есть зеркало)."""
+        try:
+            self._create_schema()
+        except sqlite3.Error as e:
+            return False, str(e)
+        if self.mirror:
+            return self.mirror.sheets.setup_headers()
+        return True, "Таблица клиентов готова"
+
+    # Методы для SheetsMirror
+
+    def dirty_clients(self, kind: int) -> List[Tuple[dict, int]]:
+        """Записи, ожидающие отправки в Google Sheets, с их версиями."""
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT * FROM clients WHERE dirty = ? ORDER BY id', (kind,)
+            ).fetchall()
+        return [(self._record(row), row['version']) for row in rows]
+
+    def mark_synced(self, versions: Dict[str, int]) -> None:
+        """Снимает отметку, если запись не менялась после чтения."""
+        with self._lock:
+            self._conn.executemany(
+                'UPDATE clients SET dirty = 0 WHERE telegram_id = ? AND version = ?',
+                list(versions.items())
+            )
+
+    def merge_remote(self, records: List[dict]) -> int:
+        """Подтягивает данные из Google Sheets в записи без локальных изменений."""
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.execute('BEGIN')
+            try:
+                self._conn.executemany(
+                    'INSERT INTO clients (first_name, last_name, phone, city, comments, '
+                    'telegram_id, status, last_updated, status_comment) '
+                    'VALUES (:first_name, :last_name, :phone, :city, :comments, '
+                    ':telegram_id, :status, :last_updated, :status_comment) '
+                    'ON CONFLICT (telegram_id) DO UPDATE SET '
+                    'first_name = excluded.first_name, last_name = excluded.last_name, '
+                    'phone = excluded.phone, city = excluded.city, comments = excluded.comments, '
+                    'status = excluded.status, last_updated = excluded.last_updated, '
+                    'status_comment = excluded.status_comment '
+                    'WHERE clients.dirty = 0 AND ('
+                    'clients.status IS NOT excluded.status OR '
+                    'clients.last_updated IS NOT excluded.last_updated OR '
+                    'clients.status_comment IS NOT excluded.status_comment OR '
+                    'clients.first_name IS NOT excluded.first_name OR '
+                    'clients.last_name IS NOT excluded.last_name OR '
+                    'clients.phone IS NOT excluded.phone OR '
+                    'clients.city IS NOT excluded.city OR '
+                    'clients.comments IS NOT excluded.comments)',
+                    records
+                )
+                self._conn.execute('COMMIT')
+            except sqlite3.Error:
+                self._conn.execute('ROLLBACK')
+                raise
+            return self._conn.total_changes - before
+
+
+class SheetsMirror:
+    """Фоновая синхронизация SQLiteClientStorage с Google Sheets.
+
+    Каждые interval секунд отправляет новые регистрации (одним append)
+    и смененные статусы (одним batchUpdate), затем перечитывает лист и
+    подтягивает правки сотрудников в записи без локальных изменений —
+    даже если отправка не удалась. Статусы клиентов, чьих строк в таблице
+    больше нет (их удалили сотрудники), не отправляются и не повторяются.
+    """
+
+    def __init__(self, storage: SQLiteClientStorage, sheets, interval: Optional[float] = None):
+        self.storage = storage
+        self.sheets = sheets
+        self.interval = interval or float(os.getenv('SHEETS_MIRROR_INTERVAL', '60'))
+        self._stop = threading.Event()
+        self._thread = None
+        storage.mirror = self
+
+    def start(self) -> None:
+        if self._thread:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='sheets-mirror', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        # Последняя попытка отправить накопленное
+        self.sync_once(pull=False)
+
+    def _run(self) -> None:
+        while True:
+            self.sync_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def sync_once(self, pull: bool = True) -> Tuple[bool, str]:
+        """Один цикл синхронизации; возвращает (успех, сводка)."""
+        if not self.sheets.service:
+            return False, "Сервис не инициализирован"
+
+        errors = []
+        pushed = pulled = 0
+        with background():
+            try:
+                pushed = self._push_new() + self._push_statuses()
+            except Exception as e:
+                errors.append(e)
+            # Правки сотрудников подтягиваются, даже если отправка не удалась
+            if pull:
+                try:
+                    # Строка заголовков и пустые ID — не клиенты
+                    pulled = self.storage.merge_remote([
+                        record for record in self.sheets.iter_clients()
+                        if (record['telegram_id'] or '').isdigit()
+                    ])
+                except Exception as e:
+                    errors.append(e)
+        if errors:
+            msg = "; ".join(str(e) for e in errors)
+            print(f"⚠️ Ошибка синхронизации с Google Sheets: {msg}")
+            return False, msg
+        return True, f"Отправлено: {pushed}, получено: {pulled}"
+
+    def _push_new(self) -> int:
+        dirty = self.storage.dirty_clients(DIRTY_NEW)
+        if not dirty:
+            return 0
+
+        # Клиент мог попасть в таблицу раньше (например, до сбоя);
+        # проверка идет по свежей колонке Telegram ID без чтения строк
+        self.sheets.refresh_index()
+        fresh = [record for record, _ in dirty if not self.sheets.client_exists(record['telegram_id'])]
+        if fresh:
+            success, msg = self.sheets.add_clients([
+                {field: record[field] for field in CLIENT_FIELDS[:6]} for record in fresh
+            ])
+            if not success:
+                raise RuntimeError(msg)
+
+        # Статус мог смениться до первой отправки
+        changed = {
+            record['telegram_id']: (record['status'], record['status_comment'], record['last_updated'])
+            for record, _ in dirty if record['status'] != "В обработке"
+        }
+        if changed:
+            success, msg = self.sheets.bulk_update_status(changed)
+            if not success:
+                raise RuntimeError(msg)
+
+        self.storage.mark_synced({record['telegram_id']: version for record, version in dirty})
+        return len(dirty)
+
+    def _push_statuses(self) -> int:
+        dirty = self.storage.dirty_clients(DIRTY_STATUS)
+        if not dirty:
+            return 0
+
+        # Строку клиента могли удалить из таблицы: такой статус отправить
+        # некуда, а повторять его каждый цикл бессмысленно
+        self.sheets.refresh_index()
+        present = {}
+        gone = []
+        for record, _ in dirty:
+            if self.sheets.client_exists(record['telegram_id']):
+                # В таблицу уходит время локальной смены статуса, а не отправки
+                present[record['telegram_id']] = (
+                    record['status'], record['status_comment'], record['last_updated']
+                )
+            else:
+                gone.append(record['telegram_id'])
+        if gone:
+            shown = ", ".join(gone[:10])
+            more = f" и еще {len(gone) - 10}" if len(gone) > 10 else ""
+            print(f"⚠️ Клиентов нет в таблице, статус не отправлен: {shown}{more}")
+
+        if present:
+            success, msg = self.sheets.bulk_update_status(present)
+            if not success:
+                raise RuntimeError(msg)
+        self.storage.mark_synced({record['telegram_id']: version for record, version in dirty})
+        return len(present)
@@ -0,0 +1,23 @@
+import pytest
+
+from benchmark import FakeSheetsService
+from google_sheets import GoogleSheetsManager
+from sheets_scheduler import SheetsScheduler
+
+
+@pytest.fixture
+def service():
+    """Лист «Клиенты» из 10 строк: Telegram ID 1000000-1000009, статусы по кругу."""
+    return FakeSheetsService(sheet_size=10)
+
+
+@pytest.fixture
+def sheets(service):
+    """GoogleSheetsManager без снимка на диске и со своим планировщиком."""
+    manager = GoogleSheetsManager(scheduler=SheetsScheduler(), snapshot_path='')
+    manager.service = service
+    return manager
+
+
+def client_ids(service, sheet='Клиенты'):
+    return [row[5] for row in service.sheets[sheet][1:]]
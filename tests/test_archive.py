@@ -0,0 +1,20 @@
+from tests.conftest import client_ids
+
+
+def test_archive_rechecks_rows_changed_during_transfer(sheets, service):
+    rows = service.sheets['Клиенты']
+    archive_batch = sheets._archive_batch
+
+    def edit_then_archive(sheet_id, batch, archivable):
+        # Сотрудник правит лист между чтением и переносом:
+        # 1000004 снова в работе, у 1000009 новый комментарий
+        rows[5][6] = "В обработке"
+        rows[10][8] = "правка"
+        return archive_batch(sheet_id, batch, archivable)
+
+    sheets._archive_batch = edit_then_archive
+
+    assert sheets.archive_delivered() == (True, "Перенесено в архив: 1 из 2")
+    assert service.sheets['Архив'][1][5:] == ['1000009', "Выдан", "2024-01-01 10:00:00", "правка"]
+    assert client_ids(service) == [str(1000000 + i) for i in range(9)]
+    assert rows[5][6] == "В обработке"
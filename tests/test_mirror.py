@@ -0,0 +1,46 @@
+import pytest
+
+from google_sheets import GoogleSheetsManager
+from sheets_scheduler import SheetsScheduler
+from storage import SheetsMirror, SQLiteClientStorage
+
+
+@pytest.fixture
+def sheets(service):
+    manager = GoogleSheetsManager(scheduler=SheetsScheduler(), snapshot_path='', archive_sheet='')
+    manager.service = service
+    return manager
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return SQLiteClientStorage(str(tmp_path / 'clients.db'))
+
+
+@pytest.fixture
+def mirror(storage, sheets):
+    mirror = SheetsMirror(storage, sheets)
+    assert mirror.sync_once() == (True, "Отправлено: 0, получено: 10")
+    return mirror
+
+
+def sheet_row(service, telegram_id):
+    return next(row for row in service.sheets['Клиенты'] if row[5] == telegram_id)
+
+
+def test_push_sends_stored_update_time(mirror, storage, service):
+    storage.bulk_update_status({'1000001': ("В пути", "", "2025-01-02 03:04:05")})
+
+    assert mirror.sync_once()[0]
+    assert sheet_row(service, '1000001')[6:8] == ["В пути", "2025-01-02 03:04:05"]
+
+
+def test_deleted_row_does_not_block_pull(mirror, storage, service):
+    storage.update_status('1000002', "Отправлен")
+    del service.sheets['Клиенты'][3]
+    service.sheets['Клиенты'][1][6] = "Выдан"
+
+    assert mirror.sync_once()[0]
+    assert storage.find_client('1000000')['status'] == "Выдан"
+    # Удаленная строка не отправляется снова на каждом проходе
+    assert storage.dirty_clients(2) == []
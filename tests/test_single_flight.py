@@ -0,0 +1,34 @@
+import threading
+import time
+
+from benchmark import FakeSheetsService
+from sheets_scheduler import background
+
+
+def test_interactive_read_does_not_join_background_read(sheets):
+    sheets.service = service = FakeSheetsService(sheet_size=10, latency=0.3)
+
+    def refresh_in_background():
+        with background():
+            sheets.refresh_index()
+
+    thread = threading.Thread(target=refresh_in_background)
+    thread.start()
+    time.sleep(0.05)
+    sheets.refresh_index()
+    thread.join()
+
+    assert service.calls['get'] == 2
+
+
+def test_concurrent_interactive_reads_are_coalesced(sheets):
+    sheets.service = service = FakeSheetsService(sheet_size=10, latency=0.3)
+
+    threads = [threading.Thread(target=sheets.refresh_index) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert service.calls['get'] == 1
+    assert sheets._reads.saved == 2
@@ -0,0 +1,42 @@
+import pytest
+
+from update_tracker import UpdateTracker
+
+
+@pytest.fixture
+def tracker(tmp_path):
+    return UpdateTracker(path=str(tmp_path / 'offset.json'))
+
+
+def test_watermark_waits_for_forgotten_update(tracker):
+    for update_id in (1, 2, 3):
+        assert tracker.accept(update_id)
+    # Очередь переполнена: обновление 2 Telegram доставит снова
+    tracker.forget(2)
+    tracker.done(1)
+    tracker.done(3)
+
+    assert tracker.watermark == 1
+    assert tracker.offset == 2
+    assert not tracker.accept(3)
+
+    assert tracker.accept(2)
+    tracker.done(2)
+    assert tracker.watermark == 3
+
+
+def test_duplicate_below_watermark_is_rejected(tracker):
+    assert tracker.accept(1)
+    tracker.done(1)
+    assert not tracker.accept(1)
+
+
+def test_watermark_survives_restart(tracker, tmp_path):
+    for update_id in (1, 2):
+        tracker.accept(update_id)
+        tracker.done(update_id)
+    tracker.save()
+
+    restarted = UpdateTracker(path=str(tmp_path / 'offset.json'))
+    assert restarted.offset == 3
+    assert not restarted.accept(2)
@@ -0,0 +1,62 @@
+import json
+
+from tests.conftest import client_ids
+from write_queue import ClientWriteQueue
+
+
+def make_queue(sheets, tmp_path):
+    # Фоновый поток не пишет сам: пачки отправляет тест через flush
+    queue = ClientWriteQueue(sheets, journal_path=str(tmp_path / 'journal'),
+                             flush_interval_ms=60_000)
+    sheets.write_queue = queue
+    return queue
+
+
+def journal_entry(telegram_id):
+    return {
+        'id': f'entry-{telegram_id}',
+        'client': {
+            'first_name': 'Имя', 'last_name': 'Фамилия', 'phone': '+996 555 000000',
+            'city': 'Бишкек', 'comments': '', 'telegram_id': telegram_id
+        },
+        'queued_at': 0
+    }
+
+
+def test_retry_after_timeout_does_not_duplicate(sheets, service, tmp_path):
+    append = service.append
+    calls = []
+
+    def append_then_time_out(range_name, values):
+        result = append(range_name, values)
+        calls.append(range_name)
+        if len(calls) == 1:
+            # Строки записались, но ответ до бота не дошел
+            raise TimeoutError('read timeout')
+        return result
+
+    service.append = append_then_time_out
+    queue = make_queue(sheets, tmp_path)
+    queue.submit('Имя', 'Фамилия', '+996 555 111111', 'Бишкек', '', '777')
+
+    assert not queue.flush()[0]
+    assert queue.flush() == (True, "Очередь пуста")
+    queue.stop()
+
+    assert client_ids(service).count('777') == 1
+    assert queue.pending_count() == 0
+
+
+def test_journal_recovery_skips_rows_already_written(sheets, service, tmp_path):
+    with open(tmp_path / 'journal', 'w') as f:
+        for telegram_id in ('1000001', '555'):
+            f.write(json.dumps(journal_entry(telegram_id)) + '\n')
+
+    queue = make_queue(sheets, tmp_path)
+    queue.start()
+    queue.stop()
+
+    ids = client_ids(service)
+    assert ids.count('1000001') == 1
+    assert ids.count('555') == 1
+    assert queue.pending_count() == 0
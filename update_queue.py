@@ -0,0 +1,201 @@
+import os
+import queue
+import threading
+import time
+from typing import Callable, Optional
+
+# Маркер остановки для рабочих потоков
+_STOP = object()
+
+
+def update_chat_id(update):
+    """Возвращает ID чата обновления (объект Update или JSON из вебхука)."""
+    if isinstance(update, dict):
+        for field in ('message', 'edited_message', 'channel_post', 'callback_query'):
+            payload = update.get(field)
+            if payload:
+                chat = payload.get('chat') or payload.get('message', {}).get('chat')
+                if chat:
+                    return chat['id']
+                if payload.get('from'):
+                    return payload['from']['id']
+        return update.get('update_id')
+
+    for field in ('message', 'edited_message', 'channel_post', 'callback_query'):
+        payload = getattr(update, field, None)
+        if payload:
+            chat = getattr(payload, 'chat', None) or getattr(
+                getattr(payload, 'message', None), 'chat', None
+            )
+            if chat:
+                return chat.id
+            if getattr(payload, 'from_user', None):
+                return payload.from_user.id
+    return update.update_id
+
+
+class UpdateQueue:
+    """Ограниченная очередь входящих обновлений с пулом обработчиков.
+
+    Вебхук и polling только кладут обновление в очередь, а обработку
+    выполняют рабочие потоки. Если очередь заполнена, put() возвращает
+    False — вебхук отвечает 503 и Telegram повторит доставку позже.
+    stop() дожидается обработки уже принятых обновлений.
+
+    Если задан key (например, update_chat_id), у каждого потока своя
+    очередь-«полоса», и обновления с одинаковым ключом всегда попадают
+    в одну полосу: разные пользователи обрабатываются параллельно, а
+    сообщения одного пользователя — строго по порядку.
+    """
+
+    def __init__(self, process: Callable, maxsize: Optional[int] = None,
+                 workers: Optional[int] = None, put_timeout: float = 0.0,
+                 key: Optional[Callable] = None):
+        self.process = process
+        self.maxsize = maxsize or int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+        self.workers = workers or int(os.getenv('UPDATE_WORKERS', '4'))
+        self.put_timeout = put_timeout
+        self.key = key
+
+        if key:
+            lane_size = max(1, self.maxsize // self.workers)
+            self._queues = [queue.Queue(maxsize=lane_size) for _ in range(self.workers)]
+        else:
+            self._queues = [queue.Queue(maxsize=self.maxsize)]
+        self._threads = []
+        self._lock = threading.Lock()
+        self._accepting = False
+        self._stopped = False
+
+        # Показатели для наблюдения за нагрузкой
+        self.accepted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.high_watermark = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads or self._stopped:
+                return
+            self._accepting = True
+            for i in range(self.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(self._queues[i % len(self._queues)],),
+                    name=f'update-worker-{i}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _queue_for(self, update) -> queue.Queue:
+        if not self.key:
+            return self._queues[0]
+        return self._queues[hash(self.key(update)) % len(self._queues)]
+
+    def put(self, update, block: bool = False) -> bool:
+        """Ставит обновление в очередь; False — очередь переполнена или закрыта.
+
+        block=True ждет свободного места (так polling притормаживает
+        получение обновлений вместо отказа).
+        """
+        if not self._threads:
+            self.start()
+        if not self._accepting:
+            return False
+
+        target = self._queue_for(update)
+        try:
+            if block:
+                target.put((time.monotonic(), update))
+            elif self.put_timeout:
+                target.put((time.monotonic(), update), timeout=self.put_timeout)
+            else:
+                target.put_nowait((time.monotonic(), update))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+
+        with self._lock:
+            self.accepted += 1
+            self.high_watermark = max(self.high_watermark, self.depth())
+        return True
+
+    def depth(self) -> int:
+        return sum(q.qsize() for q in self._queues)
+
+    def stats(self) -> dict:
+        """Снимок показателей очереди (глубина, заполненность, отказы)."""
+        with self._lock:
+            depth = self.depth()
+            started = self.processed + self.failed + self.in_flight
+            return {
+                'depth': depth,
+                'maxsize': self.maxsize,
+                'fill_ratio': depth / self.maxsize,
+                'high_watermark': self.high_watermark,
+                'workers': self.workers,
+                'ordered_by_key': bool(self.key),
+                'in_flight': self.in_flight,
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'processed': self.processed,
+                'failed': self.failed,
+                'avg_wait_ms': self.total_wait / started * 1000 if started else 0.0,
+                'max_wait_ms': self.max_wait * 1000
+            }
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """Перестает принимать обновления и дорабатывает очередь.
+
+        Возвращает True, если все рабочие потоки завершились вовремя.
+        """
+        with self._lock:
+            self._accepting = False
+            self._stopped = True
+            threads, self._threads = self._threads, []
+        if not threads:
+            return True
+
+        pending = self.depth()
+        if pending:
+            print(f"⏳ Дорабатываем очередь обновлений: {pending}")
+
+        # Маркеры встают после уже принятых обновлений, по одному на поток
+        for i in range(len(threads)):
+            self._queues[i % len(self._queues)].put((time.monotonic(), _STOP))
+
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in threads:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            thread.join(remaining)
+        return not any(thread.is_alive() for thread in threads)
+
+    def _worker(self, source: queue.Queue) -> None:
+        while True:
+            queued_at, update = source.get()
+            if update is _STOP:
+                return
+
+            wait = time.monotonic() - queued_at
+            with self._lock:
+                self.in_flight += 1
+                self.total_wait += wait
+                self.max_wait = max(self.max_wait, wait)
+
+            try:
+                self.process(update)
+                failed = False
+            except Exception as e:
+                print(f"❌ Ошибка обработки обновления: {e}")
+                failed = True
+
+            with self._lock:
+                self.in_flight -= 1
+                if failed:
+                    self.failed += 1
+                else:
+                    self.processed += 1
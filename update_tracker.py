@@ -0,0 +1,167 @@
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import metrics
+
+DUPLICATE_UPDATES = metrics.Counter(
+    'bot_updates_duplicate_total', 'Повторно доставленные обновления, отброшенные фильтром'
+)
+
+
+class UpdateTracker:
+    """Учет обработанных update_id: фильтр повторов и смещение на диске.
+
+    accept() пропускает каждое обновление один раз: недавние update_id
+    хранятся в LRU на max_seen записей (UPDATE_DEDUP_SIZE), поэтому
+    повторная доставка вебхука или getUpdates после сбоя не вызовет
+    обработчик дважды. done() отмечает конец обработки.
+
+    Обновления обрабатываются параллельно, поэтому на диск (UPDATE_OFFSET_PATH)
+    пишется «водораздел» — update_id, до которого включительно обработано
+    все, — и уже обработанные обновления выше него. Polling запрашивает
+    getUpdates с offset, поэтому Telegram не забывает обновления, пока они
+    не обработаны; повторно пришедшие отсеиваются фильтром, в том числе
+    после перезапуска. Файл переписывается не чаще раза в save_interval
+    секунд и при остановке.
+
+    Обновление, отклоненное через forget() (вебхук ответил 503), держит
+    водораздел ниже себя, пока Telegram не доставит его снова; иначе
+    повтор оказался бы ниже водораздела и был бы отброшен как дубль.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_seen: Optional[int] = None,
+                 save_interval: float = 1.0):
+        self.path = path or os.getenv('UPDATE_OFFSET_PATH', 'update_offset.json')
+        self.max_seen = max_seen or int(os.getenv('UPDATE_DEDUP_SIZE', '10000'))
+        self.save_interval = save_interval
+        # Все update_id не больше водораздела обработаны
+        self.watermark = 0
+        self._seen = OrderedDict()
+        self._in_flight = set()
+        # Отклоненные update_id, которые Telegram еще должен доставить снова
+        self._forgotten = set()
+        # Обработанные update_id выше водораздела
+        self._done = set()
+        self._max_accepted = 0
+        self._lock = threading.Lock()
+        self._advanced = threading.Condition(self._lock)
+        self._save_lock = threading.Lock()
+        self._saved_at = 0.0
+        self._load()
+
+    @property
+    def offset(self) -> int:
+        """offset для getUpdates: первое еще не обработанное обновление."""
+        return self.watermark + 1 if self.watermark else 0
+
+    def accept(self, update_id) -> bool:
+        """True — обновление новое и его нужно обработать."""
+        if update_id is None:
+            return True
+        with self._lock:
+            if update_id in self._in_flight or update_id in self._done:
+                # Polling получает все обновления выше водораздела, пока тот
+                # не сдвинется, — это не повторная доставка
+                return False
+            if update_id in self._forgotten:
+                # Повтор отклоненного обновления
+                self._forgotten.discard(update_id)
+                self._remember(update_id)
+                self._in_flight.add(update_id)
+                return True
+            if update_id <= self.watermark:
+                duplicate = True
+            elif update_id in self._seen:
+                self._seen.move_to_end(update_id)
+                duplicate = True
+            else:
+                duplicate = False
+                self._remember(update_id)
+                self._in_flight.add(update_id)
+                self._max_accepted = max(self._max_accepted, update_id)
+        if duplicate:
+            DUPLICATE_UPDATES.inc()
+            print(f"♻️ Обновление {update_id} уже получено, пропускаем")
+        return not duplicate
+
+    def forget(self, update_id) -> None:
+        """Обновление не принято в обработку (Telegram доставит его снова)."""
+        with self._lock:
+            self._in_flight.discard(update_id)
+            self._seen.pop(update_id, None)
+            if update_id is not None and update_id > self.watermark:
+                self._forgotten.add(update_id)
+
+    def done(self, update_id) -> None:
+        """Обработка обновления закончена."""
+        if update_id is None:
+            return
+        with self._lock:
+            self._in_flight.discard(update_id)
+            self._done.add(update_id)
+            self._max_accepted = max(self._max_accepted, update_id)
+            self._advance()
+            while self._forgotten and len(self._done) > self.max_seen:
+                # Telegram так и не доставил отклоненное обновление снова
+                self._forgotten.discard(min(self._forgotten))
+                self._advance()
+            due = time.monotonic() - self._saved_at >= self.save_interval
+        if due:
+            self.save()
+
+    def wait_for(self, update_id: int, timeout: float) -> bool:
+        """Ждет, пока водораздел дойдет до update_id; False — вышел timeout."""
+        with self._advanced:
+            return self._advanced.wait_for(lambda: self.watermark >= update_id, timeout)
+
+    def _remember(self, update_id) -> None:
+        self._seen[update_id] = None
+        while len(self._seen) > self.max_seen:
+            self._seen.popitem(last=False)
+
+    def _advance(self) -> None:
+        pending = self._in_flight | self._forgotten
+        if pending:
+            watermark = min(pending) - 1
+        else:
+            watermark = self._max_accepted
+        if watermark > self.watermark:
+            self.watermark = watermark
+            self._done = {update_id for update_id in self._done if update_id > watermark}
+            self._advanced.notify_all()
+
+    def save(self) -> None:
+        """Атомарно записывает водораздел на диск."""
+        with self._save_lock:
+            with self._lock:
+                snapshot = {'watermark': self.watermark, 'done': sorted(self._done)}
+                self._saved_at = time.monotonic()
+            tmp_path = self.path + '.tmp'
+            try:
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f)
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"⚠️ Не удалось сохранить смещение обновлений: {e}")
+
+    def _load(self) -> None:
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                snapshot = json.load(f)
+            self.watermark = int(snapshot['watermark'])
+            done = [int(update_id) for update_id in snapshot.get('done', [])]
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Смещение обновлений повреждено, начинаем заново: {e}")
+            return
+        self._max_accepted = max([self.watermark] + done)
+        self._done = set(done)
+        for update_id in done:
+            self._remember(update_id)
@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import uuid
+import threading
+from typing import List, Optional, Set, Tuple
+
+from sheets_scheduler import background
+
+
+class ClientWriteQueue:
+    """Отложенная (write-behind) запись регистраций в Google Sheets.
+
+    Регистрация сразу подтверждается пользователю и попадает в журнал на
+    диске. Фоновый поток дописывает накопленные строки одним append —
+    как только набралось batch_size строк или прошло flush_interval_ms
+    с момента самой старой. При ошибке запись повторяется с растущей
+    паузой, а после падения процесса журнал дочитывается при старте.
+    Перед повтором и после старта записи сверяются с таблицей: append мог
+    выполниться, хотя ответ на него не дошел.
+    """
+
+    def __init__(self, manager, journal_path: Optional[str] = None,
+                 batch_size: Optional[int] = None,
+                 flush_interval_ms: Optional[int] = None,
+                 max_retry_delay: float = 60.0):
+        self.manager = manager
+        self.journal_path = journal_path or os.getenv(
+            'REGISTRATION_JOURNAL', 'registrations.journal'
+        )
+        self.batch_size = batch_size or int(os.getenv('REGISTRATION_BATCH_SIZE', '20'))
+        if flush_interval_ms is None:
+            flush_interval_ms = int(os.getenv('REGISTRATION_FLUSH_MS', '2000'))
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_retry_delay = max_retry_delay
+
+        # Записи вида {'id': ..., 'client': {...}, 'queued_at': ...}
+        self._pending: List[dict] = []
+        # id записей, которые могли уже попасть в таблицу (см. _drop_written)
+        self._unchecked: Set[str] = set()
+        # id записей, прочитанных из журнала прошлого запуска
+        self._recovered: Set[str] = set()
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self._retry_delay = 0.0
+        self._next_attempt = 0.0
+
+    def start(self) -> None:
+        """Восстанавливает журнал и запускает фоновый поток записи.
+
+        Журнал только читается; сверка с таблицей идет уже в фоновом
+        потоке (см. _drop_written), поэтому start не ждет Google Sheets.
+        """
+        with self._cond:
+            if self._thread:
+                return
+            self._pending = self._read_journal()
+            self._recovered = {entry['id'] for entry in self._pending}
+            self._unchecked = set(self._recovered)
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def stop(self, flush: bool = True) -> None:
+        """Останавливает поток и, при необходимости, дописывает остаток."""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+            thread, self._thread = self._thread, None
+        if thread:
+            thread.join()
+        if flush and self._pending:
+            self.flush()
+
+    def submit(self, first_name: str, last_name: str, phone: str,
+               city: str, comments: str, telegram_id: str) -> Tuple[bool, str]:
+        """Принимает регистрацию: пишет ее в журнал и ставит в очередь."""
+        self.start()
+        entry = {
+            'id': uuid.uuid4().hex,
+            'client': {
+                'first_name': first_name,
+                'last_name': last_name,
+                'phone': phone,
+                'city': city,
+                'comments': comments,
+                'telegram_id': str(telegram_id)
+            },
+            'queued_at': time.time()
+        }
+
+        try:
+            with self._cond:
+                self._append_journal(entry)
+                entry['queued_monotonic'] = time.monotonic()
+                self._pending.append(entry)
+                self._cond.notify_all()
+        except OSError as e:
+            print(f"❌ Ошибка записи журнала регистраций: {e}")
+            return False, f"Ошибка при сохранении заявки: {e}"
+
+        return True, "Заявка на регистрацию принята"
+
+    def pending_client(self, telegram_id: str) -> Optional[dict]:
+        """Возвращает запись клиента, еще не попавшую в таблицу."""
+        telegram_id = str(telegram_id)
+        with self._cond:
+            for entry in self._pending:
+                if entry['client']['telegram_id'] == telegram_id:
+                    return dict(
+                        entry['client'],
+                        status="В обработке",
+                        last_updated="",
+                        status_comment=""
+                    )
+        return None
+
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def flush(self) -> Tuple[bool, str]:
+        """Дописывает все ожидающие строки одним запросом."""
+        with self._flush_lock:
+            if not self._drop_written():
+                return False, "Не удалось сверить регистрации с таблицей"
+            with self._cond:
+                batch = list(self._pending)
+            if not batch:
+                return True, "Очередь пуста"
+
+            # Фоновая запись уступает квоту Sheets запросам пользователей
+            with background():
+                success, msg = self.manager.add_clients([e['client'] for e in batch])
+            if not success:
+                # Планировщик не повторяет append после таймаута или обрыва,
+                # потому что строки могли записаться; повтор пачки тоже
+                # дождется сверки с таблицей
+                with self._cond:
+                    self._unchecked.update(e['id'] for e in batch)
+                return False, msg
+
+            written = {e['id'] for e in batch}
+            with self._cond:
+                self._pending = [e for e in self._pending if e['id'] not in written]
+                try:
+                    self._rewrite_journal(self._pending)
+                except OSError as e:
+                    # Строки уже в таблице; при восстановлении дубли отсеются
+                    print(f"⚠️ Не удалось сжать журнал регистраций: {e}")
+            return True, msg
+
+    def _run(self) -> None:
+        # Журнал сверяется с таблицей сразу, не дожидаясь первой записи
+        with self._flush_lock:
+            self._drop_written()
+        while True:
+            with self._cond:
+                while not self._stopping and not self._flush_due():
+                    self._cond.wait(self._time_until_due())
+                if self._stopping:
+                    return
+
+            success, msg = self.flush()
+            if success:
+                self._retry_delay = 0.0
+                self._next_attempt = 0.0
+            else:
+                self._retry_delay = min(
+                    max(1.0, self._retry_delay * 2), self.max_retry_delay
+                )
+                self._next_attempt = time.monotonic() + self._retry_delay
+                print(f"⚠️ Запись регистраций отложена на {self._retry_delay:.0f} с: {msg}")
+
+    def _flush_due(self) -> bool:
+        if not self._pending or time.monotonic() < self._next_attempt:
+            return False
+        if len(self._pending) >= self.batch_size:
+            return True
+        oldest = self._pending[0]['queued_monotonic']
+        return time.monotonic() - oldest >= self.flush_interval
+
+    def _time_until_due(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        now = time.monotonic()
+        due = self._pending[0]['queued_monotonic'] + self.flush_interval
+        if len(self._pending) >= self.batch_size:
+            due = now
+        return max(due, self._next_attempt) - now
+
+    def _append_journal(self, entry: dict) -> None:
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(
+                {k: entry[k] for k in ('id', 'client', 'queued_at')},
+                ensure_ascii=False
+            ) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_journal(self, entries: List[dict]) -> None:
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(
+                    {k: entry[k] for k in ('id', 'client', 'queued_at')},
+                    ensure_ascii=False
+                ) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _read_journal(self) -> List[dict]:
+        """Читает регистрации из журнала, оставшегося после прошлого запуска."""
+        if not os.path.exists(self.journal_path):
+            return []
+
+        entries = []
+        with open(self.journal_path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # Оборванная последняя строка после падения
+                    continue
+
+        now = time.monotonic()
+        for entry in entries:
+            entry['queued_monotonic'] = now
+        return entries
+
+    def _drop_written(self) -> bool:
+        """Отбрасывает непроверенные регистрации, которые уже есть в таблице.
+
+        Непроверенные — записи из журнала (процесс мог упасть между append
+        и сжатием журнала) и пачки, чей append завершился ошибкой. Индекс
+        читается один раз с фоновым приоритетом и без блокировки очереди:
+        submit и pending_client тем временем работают как обычно. Вызывается
+        под _flush_lock; False — сверить не удалось, запись откладывается.
+        """
+        with self._cond:
+            self._unchecked.intersection_update(entry['id'] for entry in self._pending)
+            if not self._unchecked:
+                return True
+        try:
+            with background():
+                refresh_index = getattr(self.manager, 'refresh_index', None)
+                if refresh_index:
+                    refresh_index()
+                # Не client_exists: он видит и сами ожидающие регистрации
+                registered = set(self.manager.iter_client_ids())
+        except Exception as e:
+            # Записи остаются в журнале: повтор без сверки мог бы задвоить строки
+            print(f"⚠️ Google Sheets недоступен, регистрации не сверены с таблицей: {e}")
+            return False
+
+        with self._cond:
+            unchecked, self._unchecked = self._unchecked, set()
+            written = {
+                entry['id'] for entry in self._pending
+                if entry['id'] in unchecked
+                and entry['client']['telegram_id'] in registered
+            }
+            if written:
+                self._pending = [e for e in self._pending if e['id'] not in written]
+                try:
+                    self._rewrite_journal(self._pending)
+                except OSError as e:
+                    print(f"⚠️ Не удалось сжать журнал регистраций: {e}")
+            recovered = len((self._recovered & unchecked) - written)
+            already = len(written - self._recovered)
+            self._recovered -= unchecked
+        if recovered:
+            print(f"♻️ Восстановлено регистраций из журнала: {recovered}")
+        if already:
+            print(f"♻️ Регистрации уже записаны в таблицу, повтор не нужен: {already}")
+        return True